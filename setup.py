@@ -15,5 +15,9 @@ setup(
     'distributed', # 2025.5.1
     'dask', # 2025.5.1
     'prov', # 2.0.1
-  ]
+  ],
+  extras_require = {
+    'lineage': ['numpy', 'scipy'],
+    'zstd': ['zstandard'],
+  }
 )
\ No newline at end of file
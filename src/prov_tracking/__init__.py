@@ -1 +1,14 @@
-from prov_tracking.plugin import ProvTracker
\ No newline at end of file
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+  from prov_tracking.plugin import ProvTracker
+
+__all__ = ['ProvTracker']
+
+def __getattr__(name: str):
+  # The plugin is imported on first use, so that tools working on saved
+  # documents, e.g. the reader or the diff, don't load dask and distributed
+  if name == 'ProvTracker':
+    from prov_tracking.plugin import ProvTracker
+    return ProvTracker
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
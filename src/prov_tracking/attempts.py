@@ -0,0 +1,251 @@
+from array import array
+from enum import IntEnum
+from typing import Any, cast
+from dask.typing import Key
+
+from prov_tracking.clock import UNSET, RunClock
+
+class Outcome(IntEnum):
+  """How an execution attempt of a task ended."""
+
+  # The attempt has not ended yet
+  RUNNING = 0
+  SUCCESS = 1
+  FAILURE = 2
+  # The task was reassigned to another worker by work stealing
+  STOLEN = 3
+  # The task left the worker without a result, e.g. because the worker died
+  RESCHEDULED = 4
+
+class AttemptHistory:
+  """Execution attempts of a task, stored in a ring buffer: once `capacity`
+  attempts are stored, each new attempt overwrites the oldest one. Workers are
+  stored as indices in the table of `AttemptTracker`, times as nanoseconds of
+  a `RunClock`."""
+
+  __slots__ = ('count', 'workers', 'starts', 'ends', 'outcomes', 'flags')
+
+  def __init__(self):
+    # Number of attempts ever started, including the overwritten ones
+    self.count = 0
+    self.workers = array('i')
+    self.starts = array('q')
+    self.ends = array('q')
+    self.outcomes = bytearray()
+    # Bit set of the kinds of repeated executions seen, see AttemptTracker
+    self.flags = 0
+
+  def _last(self, capacity: int) -> int:
+    return (self.count - 1) % capacity
+
+  def start(self, worker: int, time: int, capacity: int):
+    if len(self.starts) < capacity:
+      self.workers.append(worker)
+      self.starts.append(time)
+      self.ends.append(UNSET)
+      self.outcomes.append(Outcome.RUNNING)
+    else:
+      slot = self.count % capacity
+      self.workers[slot] = worker
+      self.starts[slot] = time
+      self.ends[slot] = UNSET
+      self.outcomes[slot] = Outcome.RUNNING
+    self.count += 1
+
+  def end(self, outcome: Outcome, time: int, capacity: int) -> bool:
+    """Ends the last attempt, if it is still running."""
+
+    if self.count == 0:
+      return False
+    slot = self._last(capacity)
+    if self.outcomes[slot] != Outcome.RUNNING:
+      return False
+    self.ends[slot] = time
+    self.outcomes[slot] = outcome
+    return True
+
+  def last_outcome(self, capacity: int) -> Outcome | None:
+    if self.count == 0:
+      return None
+    return Outcome(self.outcomes[self._last(capacity)])
+
+  def to_list(
+    self, workers: list[str], capacity: int, clock: RunClock
+  ) -> list[dict[str, Any]]:
+    """Returns the stored attempts, from the oldest to the newest."""
+
+    stored = len(self.starts)
+    first = self.count % capacity if self.count > capacity else 0
+    attempts = []
+    for i in range(stored):
+      slot = (first + i) % stored
+      attempts.append({
+        'worker': workers[self.workers[slot]],
+        'start': clock.isoformat(self.starts[slot]),
+        'end': clock.isoformat(self.ends[slot]),
+        'outcome': Outcome(self.outcomes[slot]).name.lower(),
+      })
+    return attempts
+
+class AttemptTracker:
+  """Keeps the execution attempts of each task, i.e. each time it has been sent
+  to a worker, and counts the tasks executed more than once: recomputed after
+  their result was lost, stolen by other workers or rescheduled after leaving a
+  worker without a result. As most tasks are executed once, the first attempt
+  is stored in columns shared by all tasks, and a history is only allocated
+  when the task is executed again. Both are released when the scheduler
+  forgets the task."""
+
+  RECOMPUTED = 1
+  STOLEN = 2
+  RESCHEDULED = 4
+
+  def __init__(self, capacity: int, clock: RunClock):
+    self.capacity = capacity
+    self.clock = clock
+    # Attempts of the tasks executed more than once
+    self.tasks: dict[Key, AttemptHistory] = {}
+    # Single attempt of the other tasks, by the slot of each one in the columns.
+    # Slots of the tasks that were forgotten or executed again are reused
+    self._slots: dict[Key, int] = {}
+    self._free: list[int] = []
+    self._workers = array('i')
+    self._starts = array('q')
+    self._ends = array('q')
+    self._outcomes = bytearray()
+    # Workers are interned, so that attempts only store their index
+    self.workers: list[str] = []
+    self._worker_ids: dict[str, int] = {}
+    self.counts = { 'recomputed': 0, 'stolen': 0, 'rescheduled': 0 }
+    self.attempts = 0
+
+  def _worker(self, address: str) -> int:
+    id = self._worker_ids.get(address)
+    if id is None:
+      id = len(self.workers)
+      self.workers.append(address)
+      self._worker_ids[address] = id
+    return id
+
+  def _flag(self, history: AttemptHistory, flag: int, name: str):
+    if history.flags & flag == 0:
+      history.flags |= flag
+      self.counts[name] += 1
+
+  def _first(self, key: Key, worker: int, time: int):
+    if len(self._free) > 0:
+      slot = self._free.pop()
+      self._workers[slot] = worker
+      self._starts[slot] = time
+      self._ends[slot] = UNSET
+      self._outcomes[slot] = Outcome.RUNNING
+    else:
+      slot = len(self._starts)
+      self._workers.append(worker)
+      self._starts.append(time)
+      self._ends.append(UNSET)
+      self._outcomes.append(Outcome.RUNNING)
+    self._slots[key] = slot
+
+  def _history(self, key: Key) -> AttemptHistory | None:
+    """Returns the history of `key`, moving its single attempt, if any, into a
+    new one."""
+
+    history = self.tasks.get(key)
+    if history is not None:
+      return history
+    slot = self._slots.pop(key, None)
+    if slot is None:
+      return None
+    self._free.append(slot)
+    history = AttemptHistory()
+    history.start(self._workers[slot], self._starts[slot], self.capacity)
+    outcome = Outcome(self._outcomes[slot])
+    if outcome != Outcome.RUNNING:
+      history.end(outcome, self._ends[slot], self.capacity)
+    if outcome == Outcome.RESCHEDULED:
+      # Already counted when the attempt ended
+      history.flags |= AttemptTracker.RESCHEDULED
+    self.tasks[key] = history
+    return history
+
+  def started(self, key: Key, worker: str, time: int):
+    """Must be called when `key` is sent to `worker` for processing."""
+
+    self.attempts += 1
+    if key not in self._slots and key not in self.tasks:
+      self._first(key, self._worker(worker), time)
+      return
+    history = cast(AttemptHistory, self._history(key))
+    if history.last_outcome(self.capacity) == Outcome.SUCCESS:
+      self._flag(history, AttemptTracker.RECOMPUTED, 'recomputed')
+    history.start(self._worker(worker), time, self.capacity)
+
+  def finished(self, key: Key, finish: str, time: int) -> AttemptHistory | None:
+    """Must be called when the processing of `key` ends, `finish` being the new
+    state of the task. Returns the history of the task, or `None` if it has
+    been executed only once."""
+
+    if finish == 'memory':
+      outcome = Outcome.SUCCESS
+    elif finish == 'erred':
+      outcome = Outcome.FAILURE
+    else:
+      outcome = Outcome.RESCHEDULED
+    slot = self._slots.get(key)
+    if slot is not None:
+      if self._outcomes[slot] == Outcome.RUNNING:
+        self._ends[slot] = time
+        self._outcomes[slot] = outcome
+        if outcome == Outcome.RESCHEDULED:
+          self.counts['rescheduled'] += 1
+      return None
+    history = self.tasks.get(key)
+    if history is None:
+      return None
+    if outcome == Outcome.RESCHEDULED:
+      self._flag(history, AttemptTracker.RESCHEDULED, 'rescheduled')
+    history.end(outcome, time, self.capacity)
+    return history
+
+  def stolen(self, key: Key, thief: str, time: int) -> AttemptHistory | None:
+    """Must be called when `key` is reassigned to `thief` by work stealing."""
+
+    history = self._history(key)
+    if history is None or not history.end(Outcome.STOLEN, time, self.capacity):
+      return None
+    self._flag(history, AttemptTracker.STOLEN, 'stolen')
+    history.start(self._worker(thief), time, self.capacity)
+    self.attempts += 1
+    return history
+
+  def forget(self, key: Key):
+    """Must be called when the scheduler forgets `key`."""
+
+    self.tasks.pop(key, None)
+    slot = self._slots.pop(key, None)
+    if slot is not None:
+      self._free.append(slot)
+
+  def handle_event(self, topic: str, msg: Any, time: int) -> tuple[Key, AttemptHistory] | None:
+    """Handles work-stealing events, see `DataMovementTracker.handle_event`.
+    Returns the key and the history of the stolen task, if any."""
+
+    # ('confirm', key, state, victim, thief, stimulus_id)
+    if (
+      topic == 'stealing' and isinstance(msg, tuple) and len(msg) >= 5 and
+      msg[0] == 'confirm'
+    ):
+      history = self.stolen(msg[1], msg[4], time)
+      if history is not None:
+        return msg[1], history
+    return None
+
+  def to_list(self, history: AttemptHistory) -> list[dict[str, Any]]:
+    return history.to_list(self.workers, self.capacity, self.clock)
+
+  def summary(self) -> dict[str, int]:
+    """Returns the number of tasks executed more than once, by reason, and the
+    total number of attempts."""
+
+    return { **self.counts, 'attempts': self.attempts }
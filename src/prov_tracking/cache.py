@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from dask.task_spec import GraphNode
+from dask.tokenize import tokenize
+from dask.typing import Key
+
+class CachedRegistration:
+  """Records how a task has been registered by the plugin, i.e. the keys of the
+  runnable tasks it expanded into. `counted` tells if the task was only counted,
+  as the overload controller had lowered the fidelity."""
+
+  __slots__ = ('_specs', '_token', 'sub_keys', 'counted')
+
+  def __init__(self, specs: GraphNode, sub_keys: list[Key], counted: bool = False):
+    self._specs: GraphNode | None = specs
+    self._token: str | None = None
+    self.sub_keys = sub_keys
+    self.counted = counted
+
+  @property
+  def token(self) -> str:
+    """Structural hash of the specs of the registered task. It is computed
+    lazily, as most tasks are never submitted twice."""
+
+    if self._token is None:
+      self._token = tokenize(self._specs)
+      self._specs = None
+    return self._token
+
+  def matches(self, specs: GraphNode) -> bool:
+    """Tells if `specs` is structurally equal to the specs this registration was
+    made for."""
+
+    if self._specs is specs:
+      return True
+    return self.token == tokenize(specs)
+
+class RegistrationCache:
+  """LRU cache of the tasks registered by the plugin. Dask keys are
+  deterministic, so a graph submitted again, or recomputed, has the same keys as
+  before: when also the structure of the task is the same, the existing
+  activities and entities can be reused without expanding the task again."""
+
+  def __init__(self, maxsize: int):
+    self.maxsize = maxsize
+    self.hits = 0
+    self._entries: OrderedDict[Key, CachedRegistration] = OrderedDict()
+
+  def __contains__(self, key: Key) -> bool:
+    return key in self._entries
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def lookup(self, key: Key, specs: GraphNode) -> CachedRegistration | None:
+    """Returns the registration for `key`, if there is one and it was made for
+    a task with the same structure as `specs`."""
+
+    entry = self._entries.get(key)
+    if entry is None or not entry.matches(specs):
+      return None
+    self._entries.move_to_end(key)
+    self.hits += 1
+    return entry
+
+  def add(
+    self, key: Key, specs: GraphNode, sub_keys: list[Key], counted: bool = False
+  ):
+    """Records the registration of `key`, evicting the least recently used
+    registration if the cache is full."""
+
+    self._entries[key] = CachedRegistration(specs, sub_keys, counted)
+    self._entries.move_to_end(key)
+    if len(self._entries) > self.maxsize:
+      self._entries.popitem(last=False)
+
+  def discard(self, key: Key):
+    """Forgets the registration of `key`, if any."""
+
+    self._entries.pop(key, None)
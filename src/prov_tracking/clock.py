@@ -0,0 +1,133 @@
+import datetime as dt
+from array import array
+from time import monotonic_ns
+from typing import Any
+
+# Marks a time that has not been recorded
+UNSET = -1
+
+class RunClock:
+  """Monotonic clock of a run. Times are integer nanoseconds elapsed since the
+  clock was created, when it was anchored to the wall clock, so durations are
+  never negative, even if the wall clock is adjusted meanwhile, e.g. by NTP.
+  Times are converted to datetimes only when they are exported."""
+
+  def __init__(self):
+    self.anchor = dt.datetime.now()
+    self._origin = monotonic_ns()
+    self._anchor_timestamp = self.anchor.timestamp()
+
+  def now(self) -> int:
+    return monotonic_ns() - self._origin
+
+  def from_timestamp(self, timestamp: float) -> int:
+    """Converts a POSIX timestamp, e.g. one reported by a worker, to a time of
+    the clock. Timestamps of other hosts are only as accurate as the
+    synchronization of their wall clocks."""
+
+    return int((timestamp - self._anchor_timestamp) * 1e9)
+
+  def datetime(self, time: int) -> dt.datetime | None:
+    if time == UNSET:
+      return None
+    return self.anchor + dt.timedelta(microseconds=time // 1000)
+
+  def isoformat(self, time: int) -> str | None:
+    """Returns the time in the format used by the provenance document."""
+
+    if time == UNSET:
+      return None
+    return (self.anchor + dt.timedelta(microseconds=time // 1000)).isoformat(sep=' ')
+
+class TimestampStore:
+  """Start and end times of activities, stored in two arrays of 64-bit integers
+  indexed by the slot given to each activity at registration. Two more arrays
+  hold the time spent by the task ready to run before being dispatched to a
+  worker and the time between the dispatch and the start of its execution."""
+
+  def __init__(self, clock: RunClock):
+    self.clock = clock
+    self.starts = array('q')
+    self.ends = array('q')
+    self.queue_latencies = array('q')
+    self.dispatch_latencies = array('q')
+
+  def __len__(self) -> int:
+    return len(self.starts)
+
+  def allocate(self) -> int:
+    """Returns a new slot, with both times unset."""
+
+    self.starts.append(UNSET)
+    self.ends.append(UNSET)
+    self.queue_latencies.append(UNSET)
+    self.dispatch_latencies.append(UNSET)
+    return len(self.starts) - 1
+
+  def start(self, slot: int, time: int):
+    # Slots are only missing for activities that were never registered
+    if slot >= 0:
+      self.starts[slot] = time
+
+  def end(self, slot: int, time: int):
+    if slot >= 0:
+      self.ends[slot] = time
+
+  def latencies(self, slot: int, queue: int, dispatch: int):
+    if slot >= 0:
+      self.queue_latencies[slot] = queue
+      self.dispatch_latencies[slot] = dispatch
+
+  def latency_attributes(self, slot: int) -> dict[str, float]:
+    """Returns the latencies recorded for the slot, in seconds."""
+
+    attributes: dict[str, float] = {}
+    if self.queue_latencies[slot] != UNSET:
+      attributes['queue_latency'] = self.queue_latencies[slot] / 1e9
+    if self.dispatch_latencies[slot] != UNSET:
+      attributes['dispatch_latency'] = self.dispatch_latencies[slot] / 1e9
+    return attributes
+
+  def datetimes(self, slot: int) -> tuple[dt.datetime | None, dt.datetime | None]:
+    return self.clock.datetime(self.starts[slot]), self.clock.datetime(self.ends[slot])
+
+  def duration_stats(self) -> dict[str, Any]:
+    """Returns the number of activities with both times recorded and the mean,
+    minimum, maximum and percentiles of their durations, in seconds. The
+    statistics are computed over the arrays with numpy, if it is installed."""
+
+    try:
+      import numpy as np
+    except ImportError:
+      np = None
+
+    if np is not None:
+      starts = np.frombuffer(self.starts, dtype=np.int64)
+      ends = np.frombuffer(self.ends, dtype=np.int64)
+      durations = (ends - starts)[(starts != UNSET) & (ends != UNSET)] / 1e9
+      if len(durations) == 0:
+        return { 'count': 0 }
+      p50, p90, p99 = np.percentile(durations, (50, 90, 99))
+      return {
+        'count': len(durations), 'mean': float(durations.mean()),
+        'min': float(durations.min()), 'max': float(durations.max()),
+        'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+      }
+
+    values = sorted(
+      (end - start) / 1e9 for start, end in zip(self.starts, self.ends)
+      if start != UNSET and end != UNSET
+    )
+    if len(values) == 0:
+      return { 'count': 0 }
+    def percentile(q: float) -> float:
+      # Linear interpolation, as numpy does by default
+      position = (len(values) - 1) * q
+      lower = int(position)
+      upper = min(lower + 1, len(values) - 1)
+      return values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return {
+      'count': len(values), 'mean': sum(values) / len(values),
+      'min': values[0], 'max': values[-1],
+      'p50': percentile(0.5), 'p90': percentile(0.9), 'p99': percentile(0.99),
+    }
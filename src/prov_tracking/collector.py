@@ -0,0 +1,453 @@
+import asyncio
+import os
+import pickle
+import socket
+import struct
+import tempfile
+from collections import deque
+from time import monotonic
+from traceback import format_exc
+from typing import Any, BinaryIO, Iterator
+from uuid import uuid4
+
+from distributed.scheduler import Scheduler
+
+from prov_tracking.replay import MAGIC, Replayer, TransitionRecorder
+
+_LENGTH = struct.Struct('<I')
+# Number of frames of the stream the collector has stored
+_COUNT = struct.Struct('<Q')
+_STREAM_ID_SIZE = 16
+
+class CollectorClient(TransitionRecorder):
+  """Forwards the stream recorded by `TransitionRecorder` to a collector
+  process over a Unix domain socket, see `Collector`. The first event of the
+  stream holds the options of the `ProvTracker` run by the collector.
+
+  Frames are written to the socket without blocking, in batches, and are kept
+  until the collector acknowledges having stored them, so they can be sent
+  again if it's restarted. Up to `buffer_size` bytes of frames are kept in
+  memory, the others are appended to a temporary file in `spill_directory`,
+  so a slow or unavailable collector never blocks the scheduler. The
+  connection is retried every `retry_interval` seconds. On close, the plugin
+  waits up to `close_timeout` seconds for the collector to acknowledge the
+  whole stream, and otherwise saves what is left in a file from which the
+  collector can resume it."""
+
+  name = 'provenance-collector-client'
+
+  def __init__(
+    self, address: str, options: dict[str, Any], buffer_size: int = 64 << 20,
+    spill_directory: str | None = None, flush_interval: float = 0.05,
+    retry_interval: float = 1.0, close_timeout: float = 60.0
+  ):
+    super().__init__(address)
+    self.address = address
+    self.buffer_size = buffer_size
+    self.spill_directory = spill_directory
+    self.flush_interval = flush_interval
+    self.retry_interval = retry_interval
+    self.close_timeout = close_timeout
+    self.stream_id = uuid4().bytes
+    self._socket: socket.socket | None = None
+    self._last_attempt = float('-inf')
+    # Frames sent and not acknowledged yet, starting from frame `_acked`, then
+    # those yet to be sent, the first one possibly in part, up to `_offset`
+    self._acked = 0
+    self._unacked: deque[bytes] = deque()
+    self._unsent: deque[bytes] = deque()
+    self._offset = 0
+    self._buffered = 0
+    # Frames that don't fit in memory, loaded as the collector catches up
+    self._spill: BinaryIO | None = None
+    self._spill_position = 0
+    self._spilled = 0
+    self._acks = bytearray()
+    self._since_flush = 0
+    self._callback: Any = None
+    self._write(('options', options))
+
+  def start(self, scheduler: Scheduler):
+    self._scheduler = scheduler
+    try:
+      asyncio.get_running_loop()
+    except RuntimeError:
+      # Without an event loop, frames are only flushed as they are written
+      return
+    from tornado.ioloop import PeriodicCallback
+    self._callback = PeriodicCallback(self.flush, self.flush_interval * 1000)
+    self._callback.start()
+
+  def cell(self, cell_id: int | None):
+    """Forwards the id of the last executed notebook cell."""
+
+    self._write(('cell', cell_id))
+
+  def _emit(self, frame: bytes):
+    if self._spilled > 0 or (self._buffered + len(frame) > self.buffer_size and self._buffered > 0):
+      if self._spill is None:
+        self._spill = tempfile.TemporaryFile(dir=self.spill_directory)
+      self._spill.seek(0, os.SEEK_END)
+      self._spill.write(frame)
+      self._spilled += 1
+    else:
+      self._unsent.append(frame)
+      self._buffered += len(frame)
+    self._since_flush += 1
+    # Graphs are flushed right away, as they are usually large
+    if self._since_flush >= 256 or len(frame) >= 1 << 16:
+      self.flush()
+
+  def _connect(self):
+    now = monotonic()
+    if now - self._last_attempt < self.retry_interval:
+      return
+    self._last_attempt = now
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.settimeout(self.retry_interval)
+      sock.connect(self.address)
+      sock.sendall(MAGIC + self.stream_id)
+      stored = b''
+      while len(stored) < _COUNT.size:
+        data = sock.recv(_COUNT.size - len(stored))
+        if len(data) == 0:
+          raise ConnectionError('The collector closed the connection')
+        stored += data
+      sock.setblocking(False)
+    except OSError:
+      sock.close()
+      return
+    self._socket = sock
+    self._acks.clear()
+    self._acknowledge(_COUNT.unpack(stored)[0])
+    # What was sent and not stored is sent again
+    self._unsent.extendleft(reversed(self._unacked))
+    self._unacked.clear()
+    self._offset = 0
+
+  def _disconnect(self):
+    if self._socket is not None:
+      self._socket.close()
+      self._socket = None
+
+  def _acknowledge(self, count: int):
+    """Forgets the frames the collector has stored."""
+
+    if count < self._acked:
+      print(f"""Warning: the provenance collector has lost {self._acked - count}
+      events, which can't be sent again.""")
+      return
+    while self._acked < count and len(self._unacked) > 0:
+      self._buffered -= len(self._unacked.popleft())
+      self._acked += 1
+    # Frames stored by a restarted collector before their acknowledgment
+    while self._acked < count and len(self._unsent) > 0:
+      self._buffered -= len(self._unsent.popleft())
+      self._acked += 1
+      self._offset = 0
+    self._load_spilled()
+
+  def _load_spilled(self):
+    spill = self._spill
+    if spill is None or self._spilled == 0:
+      return
+    spill.seek(self._spill_position)
+    while self._spilled > 0 and self._buffered < self.buffer_size:
+      header = spill.read(_LENGTH.size)
+      frame = header + spill.read(_LENGTH.unpack(header)[0])
+      self._unsent.append(frame)
+      self._buffered += len(frame)
+      self._spilled -= 1
+    self._spill_position = spill.tell()
+    if self._spilled == 0:
+      spill.seek(0)
+      spill.truncate()
+      self._spill_position = 0
+
+  def flush(self):
+    """Sends the frames written so far, as long as the socket accepts them,
+    and processes the acknowledgments of the collector."""
+
+    self._since_flush = 0
+    self._write_batch()
+    if self._socket is None:
+      self._connect()
+      if self._socket is None:
+        return
+    sock = self._socket
+    # Acknowledgments sent before the collector closed the connection still count
+    closed = False
+    try:
+      while True:
+        data = sock.recv(1 << 12)
+        if len(data) == 0:
+          closed = True
+          break
+        self._acks += data
+    except BlockingIOError:
+      pass
+    except OSError:
+      closed = True
+    if len(self._acks) >= _COUNT.size:
+      end = len(self._acks) - len(self._acks) % _COUNT.size
+      self._acknowledge(_COUNT.unpack_from(self._acks, end - _COUNT.size)[0])
+      del self._acks[:end]
+    if closed:
+      self._disconnect()
+      return
+    try:
+      while len(self._unsent) > 0:
+        frame = self._unsent[0]
+        self._offset += sock.send(memoryview(frame)[self._offset:])
+        if self._offset < len(frame):
+          break
+        self._unacked.append(self._unsent.popleft())
+        self._offset = 0
+    except BlockingIOError:
+      pass
+    except OSError:
+      self._disconnect()
+
+  @property
+  def pending(self) -> int:
+    """Number of frames not yet stored by the collector."""
+
+    return len(self._unacked) + len(self._unsent) + self._spilled
+
+  def _save_pending(self) -> str:
+    """Saves the frames not stored by the collector in a recording whose first
+    event tells the collector the stream and the position they resume from."""
+
+    fd, path = tempfile.mkstemp(
+      prefix='yprov4dask-', suffix='.rec', dir=self.spill_directory
+    )
+    with os.fdopen(fd, 'wb') as file:
+      file.write(MAGIC)
+      payload = pickle.dumps(('resume', self.stream_id, self._acked))
+      file.write(_LENGTH.pack(len(payload)) + payload)
+      for frame in (*self._unacked, *self._unsent):
+        file.write(frame)
+      if self._spill is not None:
+        self._spill.seek(self._spill_position)
+        while True:
+          data = self._spill.read(1 << 20)
+          if len(data) == 0:
+            break
+          file.write(data)
+    return path
+
+  async def close(self):
+    if self._callback is not None:
+      self._callback.stop()
+    self._write(('close',))
+    deadline = monotonic() + self.close_timeout
+    while self.pending > 0 and monotonic() < deadline:
+      self.flush()
+      await asyncio.sleep(self.flush_interval)
+    self._disconnect()
+    if self.pending > 0:
+      path = self._save_pending()
+      print(f"""Warning: the provenance collector didn't store {self.pending}
+      events, which have been saved in {path}. Run `python -m
+      prov_tracking.collector <address> --resume {path}` to complete the
+      document.""")
+    if self._spill is not None:
+      self._spill.close()
+      self._spill = None
+
+def _read_frames(path: str) -> Iterator[tuple[bytes, int]]:
+  """Yields the undecoded events of a recording, with the offset at which
+  each one ends. A frame cut short, e.g. by a crash, ends the recording."""
+
+  with open(path, 'rb') as file:
+    if file.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f'{path} is not a recording of the transition stream')
+    while True:
+      header = file.read(_LENGTH.size)
+      if len(header) < _LENGTH.size:
+        return
+      length = _LENGTH.unpack(header)[0]
+      payload = file.read(length)
+      if len(payload) < length:
+        return
+      yield payload, file.tell()
+
+class _Stream:
+  """A stream being collected: the tracker fed with its events and the file
+  in which they are stored, in the format of `TransitionRecorder`, so that the
+  stream can be resumed if the collector is restarted."""
+
+  def __init__(self, path: str):
+    self.path = path
+    self.count = 0
+    self.replayer: Replayer | None = None
+    self.closed = False
+    # Whether the stream was closed before the collector could save it
+    self.closing = False
+    if os.path.exists(path):
+      # Resume after a restart of the collector, dropping a partial frame
+      end = len(MAGIC)
+      for payload, end in _read_frames(path):
+        self.count += 1
+        self.closing = self._feed(payload) or self.closing
+      self.file = open(path, 'r+b')
+      self.file.truncate(end)
+      self.file.seek(end)
+    else:
+      self.file = open(path, 'wb')
+      self.file.write(MAGIC)
+
+  def _apply(self, event: tuple) -> bool:
+    """Feeds an event to the tracker, returning `True` if it closes it."""
+
+    kind = event[0]
+    if kind == 'options':
+      # Imported here, as the plugin module imports this one
+      from prov_tracking.plugin import ProvTracker
+      options = dict(event[1])
+      options['jupyter_tracking'] = False
+      self.replayer = Replayer(ProvTracker(**options))
+    elif self.replayer is None:
+      return False
+    elif kind == 'cell':
+      self.replayer.plugin.last_cell_id = event[1]
+    elif kind == 'close':
+      return True
+    else:
+      self.replayer.apply(event)
+    return False
+
+  def _feed(self, payload: bytes) -> bool:
+    try:
+      return self._apply(pickle.loads(payload))
+    except Exception:
+      # The event is stored anyway, so the stream isn't stuck on it
+      print(f'Event {self.count} generated an exception:\n{format_exc()}')
+      return False
+
+  async def receive(self, payload: bytes):
+    self.file.write(_LENGTH.pack(len(payload)) + payload)
+    self.count += 1
+    if self._feed(payload):
+      await self.close()
+
+  async def close(self):
+    if self.replayer is not None and not self.closed:
+      await self.replayer.plugin.close()
+    self.closed = True
+    self.file.close()
+
+class Collector:
+  """Process owning the `ProvTracker` fed by a `CollectorClient`, through a
+  Unix domain socket at `address`. Each stream is stored in `spool_directory`
+  as it's received and acknowledged, so a restarted collector rebuilds the
+  state of the tracker from it and the client sends again the events that
+  were not stored. Once the document of a stream is saved, its file is
+  removed."""
+
+  def __init__(self, address: str, spool_directory: str, ack_interval: float = 0.05):
+    self.address = address
+    self.spool_directory = spool_directory
+    self.ack_interval = ack_interval
+    self.streams: dict[str, _Stream] = {}
+    # Number of events of the streams whose document was saved, for clients
+    # reconnecting before having received the last acknowledgment
+    self.finished: dict[str, int] = {}
+    os.makedirs(spool_directory, exist_ok=True)
+
+  async def _stream(self, stream_id: str) -> _Stream:
+    stream = self.streams.get(stream_id)
+    if stream is None:
+      stream = _Stream(os.path.join(self.spool_directory, f'{stream_id}.rec'))
+      self.streams[stream_id] = stream
+      if stream.closing:
+        await stream.close()
+    return stream
+
+  async def _finish(self, stream_id: str, stream: _Stream):
+    if stream.closed:
+      os.remove(stream.path)
+      del self.streams[stream_id]
+      self.finished[stream_id] = stream.count
+
+  async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+      header = await reader.readexactly(len(MAGIC) + _STREAM_ID_SIZE)
+      if header[:len(MAGIC)] != MAGIC:
+        return
+      stream_id = header[len(MAGIC):].hex()
+      if stream_id in self.finished:
+        writer.write(_COUNT.pack(self.finished[stream_id]))
+        await writer.drain()
+        return
+      stream = await self._stream(stream_id)
+      writer.write(_COUNT.pack(stream.count))
+      acked = stream.count
+      while not stream.closed:
+        try:
+          length = await asyncio.wait_for(
+            reader.readexactly(_LENGTH.size), self.ack_interval
+          )
+          payload = await reader.readexactly(_LENGTH.unpack(length)[0])
+        except asyncio.TimeoutError:
+          payload = None
+        if payload is not None:
+          await stream.receive(payload)
+        if stream.count > acked and (payload is None or stream.count - acked >= 1024 or stream.closed):
+          if not stream.closed:
+            stream.file.flush()
+          writer.write(_COUNT.pack(stream.count))
+          await writer.drain()
+          acked = stream.count
+      await self._finish(stream_id, stream)
+    except (asyncio.IncompleteReadError, ConnectionError):
+      # The client will connect again, partial frames are sent again
+      pass
+    finally:
+      writer.close()
+
+  async def resume(self, path: str):
+    """Completes a stream with the events saved by a client that couldn't
+    deliver them, see `CollectorClient.close`."""
+
+    frames = (payload for payload, _ in _read_frames(path))
+    kind, stream_id, position = pickle.loads(next(frames))
+    if kind != 'resume':
+      raise ValueError(f'{path} is not a stream saved by a collector client')
+    stream = await self._stream(stream_id.hex())
+    if stream.count < position:
+      raise ValueError(f'The collector lost {position - stream.count} events of {path}')
+    for i, payload in enumerate(frames, start=position):
+      if stream.closed:
+        break
+      if i >= stream.count:
+        await stream.receive(payload)
+    await self._finish(stream_id.hex(), stream)
+
+  async def serve(self):
+    if os.path.exists(self.address):
+      os.remove(self.address)
+    server = await asyncio.start_unix_server(self._handle, path=self.address)
+    async with server:
+      await server.serve_forever()
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(
+    description='Collects the provenance streamed by ProvTracker(collector=...)'
+  )
+  parser.add_argument('address', help='path of the Unix domain socket')
+  parser.add_argument(
+    '--spool', default=os.path.join(tempfile.gettempdir(), 'yprov4dask-spool'),
+    help='folder in which streams are stored until their document is saved'
+  )
+  parser.add_argument('--resume', default=None, help='stream saved by a client to complete')
+  args = parser.parse_args()
+
+  collector = Collector(args.address, args.spool)
+  if args.resume is not None:
+    asyncio.run(collector.resume(args.resume))
+  else:
+    asyncio.run(collector.serve())
@@ -0,0 +1,251 @@
+import io
+import gzip
+import shutil
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from typing import Any, BinaryIO, Iterator, TextIO
+
+CODECS = ('gzip', 'zstd')
+# File name extension of each codec
+EXTENSIONS = { 'gzip': '.gz', 'zstd': '.zst' }
+# Amount of uncompressed data in each frame
+CHUNK_SIZE = 1 << 20
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Gzip members carry the size of the whole member in an extra subfield, as in
+# BGZF: id1, id2, cm, flg (FEXTRA), mtime, xfl, os, xlen, si1, si2, slen, size
+_GZIP_HEADER = struct.Struct('<4sIBBH2sHI')
+_GZIP_SUBFIELD = b'YP'
+_GZIP_TRAILER = struct.Struct('<II')
+# Zstandard frames are preceded by a skippable frame, ignored by decoders,
+# holding the compressed and the uncompressed size of the frame
+_ZSTD_SKIPPABLE = 0x184D2A5A
+_ZSTD_SIZES = struct.Struct('<III')
+
+def _zstandard() -> Any:
+  try:
+    import zstandard
+  except ImportError:
+    raise ImportError(
+      'The zstd codec requires the zstandard package (pip install yprov4dask[zstd])'
+    )
+  return zstandard
+
+def detect(path: str) -> str | None:
+  """Returns the codec with which the file is compressed, or `None` if it isn't
+  compressed. Codecs are told apart by the first bytes of the file."""
+
+  with open(path, 'rb') as file:
+    head = file.read(4)
+  if head[:2] == _GZIP_MAGIC:
+    return 'gzip'
+  if head == _ZSTD_MAGIC or (
+    len(head) == 4 and struct.unpack('<I', head)[0] == _ZSTD_SKIPPABLE
+  ):
+    return 'zstd'
+  return None
+
+class FrameWriter(io.BufferedIOBase):
+  """Binary file that compresses what is written into independent frames, each
+  holding `chunk_size` bytes of data, except the last one. Frames are gzip
+  members or zstd frames, so the file can be decompressed by the standard tools,
+  and each of them records its own size, so readers can find them without
+  decompressing the file, see `FrameReader`. Since frames are independent,
+  opening the file in append mode adds new frames to it."""
+
+  def __init__(
+    self, path: str, codec: str = 'gzip', level: int | None = None,
+    chunk_size: int = CHUNK_SIZE, append: bool = False
+  ):
+    if codec not in CODECS:
+      raise ValueError(f'Unsupported codec {codec}, use one of {", ".join(CODECS)}')
+    if not 0 < chunk_size < 1 << 32:
+      raise ValueError('chunk_size must be positive and smaller than 4 GiB')
+    self.codec = codec
+    self.chunk_size = chunk_size
+    if codec == 'gzip':
+      self.level = level if level is not None else 6
+    else:
+      self.level = level if level is not None else 3
+      self._compressor = _zstandard().ZstdCompressor(level=self.level)
+    self._buffer = bytearray()
+    self._file = open(path, 'ab' if append else 'wb')
+
+  def writable(self) -> bool:
+    return True
+
+  def write(self, data: Any) -> int:
+    if self.closed:
+      raise ValueError('write to closed file')
+    self._buffer += data
+    while len(self._buffer) >= self.chunk_size:
+      self._write_frame(bytes(self._buffer[:self.chunk_size]))
+      del self._buffer[:self.chunk_size]
+    return len(data)
+
+  def _write_frame(self, chunk: bytes):
+    if self.codec == 'gzip':
+      compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+      payload = compressor.compress(chunk) + compressor.flush()
+      size = _GZIP_HEADER.size + len(payload) + _GZIP_TRAILER.size
+      self._file.write(_GZIP_HEADER.pack(
+        b'\x1f\x8b\x08\x04', 0, 0, 255, 8, _GZIP_SUBFIELD, 4, size
+      ))
+      self._file.write(payload)
+      self._file.write(_GZIP_TRAILER.pack(zlib.crc32(chunk), len(chunk)))
+    else:
+      payload = self._compressor.compress(chunk)
+      self._file.write(_ZSTD_SIZES.pack(_ZSTD_SKIPPABLE, 8, len(payload)))
+      self._file.write(struct.pack('<I', len(chunk)))
+      self._file.write(payload)
+
+  def close(self):
+    if self.closed:
+      return
+    try:
+      if len(self._buffer) > 0:
+        self._write_frame(bytes(self._buffer))
+        self._buffer.clear()
+      self._file.close()
+    finally:
+      super().close()
+
+def open_writer(
+  path: str, codec: str, level: int | None = None, append: bool = False,
+  chunk_size: int = CHUNK_SIZE
+) -> TextIO:
+  """Opens a text file compressed in frames, see `FrameWriter`."""
+
+  writer = FrameWriter(path, codec, level, chunk_size, append)
+  return io.TextIOWrapper(writer, encoding='utf-8')
+
+def open_binary(path: str) -> BinaryIO:
+  """Opens a file for reading, decompressing it as it's read if it's compressed
+  with one of the supported codecs, whether in frames or not."""
+
+  codec = detect(path)
+  if codec == 'gzip':
+    return gzip.open(path, 'rb')
+  file = open(path, 'rb')
+  if codec == 'zstd':
+    decompressor = _zstandard().ZstdDecompressor()
+    return decompressor.stream_reader(file, read_across_frames=True, closefd=True)
+  return file
+
+def decompress_into(path: str, target: BinaryIO) -> int:
+  """Writes the decompressed content of the file into `target` and returns the
+  number of bytes written."""
+
+  with open_binary(path) as source:
+    shutil.copyfileobj(source, target, CHUNK_SIZE)
+  return target.tell()
+
+class FrameReader:
+  """Random access to the data of a file written by `FrameWriter`. The frames
+  are indexed by reading only their headers, so reading a range of the data
+  only decompresses the frames that hold it. Raises `ValueError` if the file
+  wasn't compressed in frames."""
+
+  def __init__(self, path: str):
+    self.path = path
+    self.codec = detect(path)
+    if self.codec is None:
+      raise ValueError(f'{path} is not compressed')
+    self._file = open(path, 'rb')
+    # Offset and size of the compressed payload of each frame, and offset of
+    # its data within the decompressed content
+    self._offsets = array('q')
+    self._sizes = array('q')
+    self._starts = array('q')
+    self.size = 0
+    self._cached: tuple[int, bytes] | None = None
+    try:
+      self._build_index()
+    except Exception:
+      self._file.close()
+      raise
+
+  def _build_index(self):
+    file = self._file
+    position = 0
+    while True:
+      file.seek(position)
+      if self.codec == 'gzip':
+        header = file.read(_GZIP_HEADER.size)
+        if len(header) == 0:
+          break
+        if len(header) < _GZIP_HEADER.size:
+          raise ValueError(f'Truncated frame at offset {position}')
+        magic, _, _, _, xlen, subfield, slen, size = _GZIP_HEADER.unpack(header)
+        if magic != b'\x1f\x8b\x08\x04' or xlen != 8 or subfield != _GZIP_SUBFIELD or slen != 4:
+          raise ValueError(f'{self.path} is not compressed in frames')
+        file.seek(position + size - 4)
+        length = struct.unpack('<I', file.read(4))[0]
+        self._offsets.append(position + _GZIP_HEADER.size)
+        self._sizes.append(size - _GZIP_HEADER.size - _GZIP_TRAILER.size)
+      else:
+        header = file.read(_ZSTD_SIZES.size + 4)
+        if len(header) == 0:
+          break
+        if len(header) < _ZSTD_SIZES.size + 4:
+          raise ValueError(f'Truncated frame at offset {position}')
+        magic, _, size = _ZSTD_SIZES.unpack(header[:_ZSTD_SIZES.size])
+        if magic != _ZSTD_SKIPPABLE:
+          raise ValueError(f'{self.path} is not compressed in frames')
+        length = struct.unpack('<I', header[_ZSTD_SIZES.size:])[0]
+        self._offsets.append(position + len(header))
+        self._sizes.append(size)
+        size += len(header)
+      self._starts.append(self.size)
+      self.size += length
+      position += size
+
+  def __len__(self) -> int:
+    return len(self._starts)
+
+  def __enter__(self) -> 'FrameReader':
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    self._file.close()
+
+  def frame(self, index: int) -> bytes:
+    """Returns the decompressed data of a frame. The last one is cached, as
+    consecutive reads often fall in the same frame."""
+
+    if self._cached is not None and self._cached[0] == index:
+      return self._cached[1]
+    self._file.seek(self._offsets[index])
+    payload = self._file.read(self._sizes[index])
+    if self.codec == 'gzip':
+      data = zlib.decompress(payload, -zlib.MAX_WBITS)
+    else:
+      data = _zstandard().ZstdDecompressor().decompress(payload)
+    self._cached = (index, data)
+    return data
+
+  def read(self, start: int, end: int) -> bytes:
+    """Returns the decompressed data between the offsets `start` and `end`."""
+
+    start, end = max(start, 0), min(end, self.size)
+    parts: list[bytes] = []
+    index = bisect_right(self._starts, start) - 1
+    while start < end and index < len(self._starts):
+      data = self.frame(index)
+      offset = self._starts[index]
+      parts.append(data[start - offset:end - offset])
+      start = offset + len(data)
+      index += 1
+    return b''.join(parts)
+
+  def chunks(self) -> Iterator[bytes]:
+    """Yields the decompressed data of each frame, in order."""
+
+    for index in range(len(self._starts)):
+      yield self.frame(index)
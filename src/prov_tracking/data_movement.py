@@ -0,0 +1,160 @@
+from typing import Any
+from dask.typing import Key
+from distributed.scheduler import TaskState, WorkerState
+
+class TaskMovement:
+  """Data movement and memory events observed while a task was being processed
+  by a worker."""
+
+  __slots__ = (
+    'worker', 'transferred', 'transferred_bytes', 'stolen', 'paused', '_pauses'
+  )
+
+  def __init__(self, worker: str, pauses: int):
+    self.worker = worker
+    # Keys of the dependencies that were not already on the worker
+    self.transferred: list[Key] = []
+    self.transferred_bytes = 0
+    self.stolen = 0
+    self.paused = 0
+    # Number of pauses of the worker when the task was dispatched to it
+    self._pauses = pauses
+
+  def attributes(self) -> dict[str, Any]:
+    """Returns a compact representation of the events, i.e. only those that
+    actually happened are reported."""
+
+    attributes: dict[str, Any] = {}
+    if len(self.transferred) > 0:
+      attributes['transferred_deps'] = [str(key) for key in self.transferred]
+      attributes['transferred_bytes'] = self.transferred_bytes
+    if self.stolen > 0:
+      attributes['stolen'] = self.stolen
+    if self.paused > 0:
+      attributes['paused'] = self.paused
+    return attributes
+
+class WorkerTotals:
+  """Aggregate data movement and memory events of a single worker. Outgoing
+  transfers only count the dependencies held by this worker alone, as the
+  scheduler doesn't tell which holder a dependency is fetched from. Spilled
+  bytes are those reported by the heartbeats of the worker, regardless of the
+  task being processed."""
+
+  __slots__ = (
+    'transfers_in', 'bytes_in', 'transfers_out', 'bytes_out', 'stolen_in',
+    'stolen_out', 'spilled_bytes', 'pauses'
+  )
+
+  def __init__(self):
+    self.transfers_in = 0
+    self.bytes_in = 0
+    self.transfers_out = 0
+    self.bytes_out = 0
+    self.stolen_in = 0
+    self.stolen_out = 0
+    self.spilled_bytes = 0
+    self.pauses = 0
+
+  def to_dict(self) -> dict[str, int]:
+    return { name: getattr(self, name) for name in WorkerTotals.__slots__ }
+
+class DataMovementTracker:
+  """Collects, from the scheduler state and events, which dependencies had to be
+  transferred between workers, spill-to-disk events, memory-pressure pauses and
+  work-stealing reassignments."""
+
+  def __init__(self):
+    self.tasks: dict[Key, TaskMovement] = {}
+    self.workers: dict[str, WorkerTotals] = {}
+    # Last known amount of spilled bytes and number of pauses for each worker
+    self._spilled: dict[str, int] = {}
+    self._pauses: dict[str, int] = {}
+
+  def _totals(self, address: str) -> WorkerTotals:
+    totals = self.workers.get(address)
+    if totals is None:
+      totals = WorkerTotals()
+      self.workers[address] = totals
+    return totals
+
+  def _record_transfers(self, movement: TaskMovement, task: TaskState):
+    """Records the dependencies of `task` that don't live on the worker that
+    has to execute it, and hence must be transferred there."""
+
+    totals = self._totals(movement.worker)
+    for dep in task.dependencies:
+      if len(dep.who_has) == 0 or any(ws.address == movement.worker for ws in dep.who_has):
+        continue
+      nbytes = max(dep.nbytes, 0)
+      movement.transferred.append(dep.key)
+      movement.transferred_bytes += nbytes
+      totals.transfers_in += 1
+      totals.bytes_in += nbytes
+      if len(dep.who_has) == 1:
+        source = self._totals(next(iter(dep.who_has)).address)
+        source.transfers_out += 1
+        source.bytes_out += nbytes
+
+  def task_dispatched(self, task: TaskState):
+    """Must be called when `task` is sent to a worker for processing."""
+
+    if task.processing_on is None:
+      return
+    address = task.processing_on.address
+    movement = TaskMovement(address, self._pauses.get(address, 0))
+    self._record_transfers(movement, task)
+    self.tasks[task.key] = movement
+
+  def task_stolen(self, task: TaskState, victim: str, thief: str):
+    """Must be called when `task` is reassigned from `victim` to `thief`. The
+    transfers are recomputed w.r.t. the new worker."""
+
+    old = self.tasks.get(task.key)
+    movement = TaskMovement(thief, self._pauses.get(thief, 0))
+    movement.stolen = (old.stolen if old is not None else 0) + 1
+    self._record_transfers(movement, task)
+    self.tasks[task.key] = movement
+    self._totals(victim).stolen_out += 1
+    self._totals(thief).stolen_in += 1
+
+  def task_finished(
+    self, key: Key, workers: dict[str, WorkerState]
+  ) -> TaskMovement | None:
+    """Must be called when the processing of `key` ends. Spilled bytes are only
+    known through the worker heartbeats, so they are sampled here and added to
+    the totals of the worker, as they can't be told apart by task."""
+
+    movement = self.tasks.pop(key, None)
+    if movement is None:
+      return None
+    worker = workers.get(movement.worker)
+    if worker is not None:
+      spilled = worker.memory.spilled
+      delta = spilled - self._spilled.get(movement.worker, 0)
+      self._spilled[movement.worker] = spilled
+      if delta > 0:
+        self._totals(movement.worker).spilled_bytes += delta
+    movement.paused = self._pauses.get(movement.worker, 0) - movement._pauses
+    return movement
+
+  def handle_event(self, topic: str, msg: Any, tasks: dict[Key, TaskState]):
+    """Handles an event logged on the scheduler. Work-stealing events are
+    published in the `stealing` topic, while changes of status of the workers
+    are published in the topic named after the worker."""
+
+    if topic == 'stealing':
+      # ('confirm', key, state, victim, thief, stimulus_id)
+      if isinstance(msg, tuple) and len(msg) >= 5 and msg[0] == 'confirm':
+        task = tasks.get(msg[1])
+        if task is not None:
+          self.task_stolen(task, msg[3], msg[4])
+    elif isinstance(msg, dict) and msg.get('action') == 'worker-status-change':
+      if msg.get('status') == 'paused':
+        self._pauses[topic] = self._pauses.get(topic, 0) + 1
+        self._totals(topic).pauses += 1
+
+  def summary(self) -> dict[str, dict[str, int]]:
+    """Returns the aggregate totals for each worker."""
+
+    return { address: totals.to_dict() for address, totals in self.workers.items() }
@@ -0,0 +1,179 @@
+from hashlib import blake2b
+from typing import Any
+
+from prov_tracking.errors import strip_addresses
+from prov_tracking.reader import ProvReader
+
+# Attributes describing what an activity computed, as opposed to how and when
+# it was run, e.g. its start time or the worker it was processed on
+ACTIVITY_CONTENT = (
+  'prov:type', 'yprov4wfs:status', 'yprov4wfs:group', 'yprov4wfs:module',
+  'yprov4wfs:nice_name', 'yprov4wfs:error'
+)
+# Attributes describing an entity
+ENTITY_CONTENT = (
+  'yprov4wfs:value', 'yprov4wfs:dtype', 'yprov4wfs:nbytes',
+  'yprov4wfs:is_error', 'yprov4wfs:fan_in_size',
+  'yprov4wfs:fan_in_group', 'yprov4wfs:fan_in_ranges'
+)
+def _content(attributes: dict[str, Any], names: tuple[str, ...]) -> str:
+  return strip_addresses(repr([attributes.get(name) for name in names]))
+
+def _digest(*parts: str | bytes) -> bytes:
+  hash = blake2b(digest_size=16)
+  for part in parts:
+    hash.update(part.encode() if isinstance(part, str) else part)
+    hash.update(b'\0')
+  return hash.digest()
+
+class RunDigest:
+  """Merkle-style hashes of the activities of a provenance document. The local
+  hash of an activity covers its content, the content of the entities it used
+  and the identifiers of the activities that generated them, while its merkle
+  hash also covers the merkle hashes of those activities, i.e. the whole
+  subgraph upstream of it. Times, workers and other details of the execution
+  are ignored, so two runs of the same graph have the same hashes."""
+
+  def __init__(self, path: str):
+    self.local: dict[str, bytes] = {}
+    self.merkle: dict[str, bytes] = {}
+    self.groups: dict[str, str] = {}
+    # Activities whose results have been used by each activity
+    self.producers: dict[str, list[str]] = {}
+
+    with ProvReader(path) as reader:
+      inputs: dict[str, list[str]] = {}
+      for activity, entity in reader.used():
+        inputs.setdefault(activity, []).append(entity)
+
+      for id in reader.activity_ids():
+        attributes = reader.activity(id)
+        group = attributes.get('yprov4wfs:group')
+        # The workflow activity is the only one without a group
+        if group is None:
+          continue
+        self.groups[id] = group
+        parts = [_content(attributes, ACTIVITY_CONTENT)]
+        if reader.has_entity(f'{id}.return_value'):
+          parts.append(_content(reader.entity(f'{id}.return_value'), ENTITY_CONTENT))
+        producers: set[str] = set()
+        used: list[str] = []
+        for entity in inputs.get(id, []):
+          # Parameters are named after the activity, other entities are shared
+          name = entity[len(id) + 1:] if entity.startswith(f'{id}.') else entity
+          producer = reader.generator(entity)
+          if producer is not None:
+            producers.add(producer)
+            used.append(f'{name}<-{producer}')
+            continue
+          members = reader.fan_in_members(entity)
+          producers.update(members)
+          if reader.has_entity(entity):
+            used.append(f'{name}={_content(reader.entity(entity), ENTITY_CONTENT)}')
+          else:
+            used.append(name)
+        parts.extend(sorted(used))
+        self.local[id] = _digest(*parts)
+        self.producers[id] = sorted(producers)
+
+    self._hash_subgraphs()
+
+  def _hash_subgraphs(self):
+    """Computes the merkle hashes bottom-up, visiting each activity once."""
+
+    local, merkle, producers = self.local, self.merkle, self.producers
+    for root in local:
+      if root in merkle:
+        continue
+      stack = [root]
+      while len(stack) > 0:
+        id = stack[-1]
+        pending = [
+          producer for producer in producers[id]
+          if producer in local and producer not in merkle
+        ]
+        if len(pending) > 0:
+          stack.extend(pending)
+          continue
+        stack.pop()
+        if id in merkle:
+          continue
+        merkle[id] = _digest(local[id], *(
+          merkle[producer] for producer in producers[id] if producer in merkle
+        ))
+
+class ProvDiff:
+  """Differences between two runs, with the identifiers of the activities
+  grouped by task group:
+  - `added` and `removed` are the activities found in only one of the runs;
+  - `changed` are the activities whose content or inputs changed;
+  - `affected` are the activities that didn't change themselves, but depend on
+  activities that did.
+  """
+
+  def __init__(self, old: RunDigest, new: RunDigest):
+    self.added: dict[str, list[str]] = {}
+    self.removed: dict[str, list[str]] = {}
+    self.changed: dict[str, list[str]] = {}
+    self.affected: dict[str, list[str]] = {}
+    self.unchanged = 0
+
+    for id, hash in new.merkle.items():
+      old_hash = old.merkle.get(id)
+      if old_hash is None:
+        self.added.setdefault(new.groups[id], []).append(id)
+      elif old_hash == hash:
+        self.unchanged += 1
+      elif old.local[id] != new.local[id]:
+        self.changed.setdefault(new.groups[id], []).append(id)
+      else:
+        self.affected.setdefault(new.groups[id], []).append(id)
+    for id in old.merkle:
+      if id not in new.merkle:
+        self.removed.setdefault(old.groups[id], []).append(id)
+
+  def __bool__(self) -> bool:
+    return any(len(kind) > 0 for kind in (self.added, self.removed, self.changed, self.affected))
+
+  def summary(self) -> str:
+    """Returns a line for each task group with differences, with the number of
+    activities of each kind."""
+
+    kinds = {
+      'added': self.added, 'removed': self.removed, 'changed': self.changed,
+      'affected': self.affected
+    }
+    groups = sorted(set().union(*kinds.values()))
+    lines = [
+      f'{group}: ' + ', '.join(
+        f'{len(ids[group])} {kind}' for kind, ids in kinds.items() if group in ids
+      )
+      for group in groups
+    ]
+    lines.append(f'{self.unchanged} activities unchanged')
+    return '\n'.join(lines)
+
+def diff(old_path: str, new_path: str) -> ProvDiff:
+  """Compares the provenance documents of two runs. Activities are matched by
+  identifier, which is the same in both runs for the same task."""
+
+  return ProvDiff(RunDigest(old_path), RunDigest(new_path))
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(
+    description='Compares the provenance documents of two runs'
+  )
+  parser.add_argument('old')
+  parser.add_argument('new')
+  parser.add_argument('--ids', action='store_true', help='list the activities of each group')
+  args = parser.parse_args()
+
+  result = diff(args.old, args.new)
+  print(result.summary())
+  if args.ids:
+    for kind in ('added', 'removed', 'changed', 'affected'):
+      for group, ids in sorted(getattr(result, kind).items()):
+        for id in sorted(ids):
+          print(f'{kind} {group} {id}')
@@ -1,13 +1,28 @@
-from typing import Any
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
 from dask.task_spec import DataNode
+from dask.typing import Key
 from distributed.scheduler import TaskState
 
-from prov_tracking.utils import GeneratedValue, ReadyValue, Value
+from prov_tracking.clock import RunClock, TimestampStore
+from prov_tracking.compression import CODECS, EXTENSIONS, open_writer
+from prov_tracking.errors import ErrorTable
+from prov_tracking.fan_in import FanIn
+from prov_tracking.utils import GeneratedValue, ReadyValue, Value, value_type
+from prov_tracking.overload import Fidelity, OverloadController
 from prov_tracking.task_info import RunnableTaskInfo
 from yprov4wfs.datamodel.workflow import Workflow
 from yprov4wfs.datamodel.data import Data
 from yprov4wfs.datamodel.task import Task
+from importlib.util import find_spec
 from uuid import uuid4
+import json
+import os
+
+if TYPE_CHECKING:
+  # Optional backends, only imported when they are enabled
+  from prov_tracking.live import LiveFeed
+  from prov_tracking.prune import ReachabilityPruner
+  from prov_tracking.rdf import TripleWriter
 
 def _sanitize(string: str) -> str:
   """Given a string, returns a new string without `(`, `)`, `\\` and with
@@ -49,7 +64,7 @@ def _type(obj: Any) -> str:
         types.append(_type(item))
       return f'tuple[{', '.join(types)}]'
   if not isinstance(obj, type):
-    obj = type(obj)
+    obj = value_type(obj)
   module = obj.__module__
   if module != 'builtins':
     return f'{module}.{obj.__qualname__}'
@@ -67,18 +82,146 @@ class Documenter:
     - `rich_types: bool`: tells if datatypes of values such be richer, e.g. for
     tuples, track the type of each element instead of just saying that the value
     is a tuple. Defaults to `False`.
+    - `rdf_format: str | None`: if `nt` or `ttl`, the document is also streamed
+    in N-Triples or Turtle format to `yprov4wfs.nt` or `yprov4wfs.ttl`, using
+    the vocabulary defined in `dask-prov.ttl`. Defaults to `None`.
+    - `rdf_compress: bool`: tells if the RDF stream should be compressed, with
+    `compression` or, if that is not set, with gzip. Defaults to `False`.
+    - `compression: str | None`: if `gzip` or `zstd`, the document is compressed
+    in frames of 1 MiB, see `prov_tracking.compression`, and `.gz` or `.zst` is
+    appended to its name. Defaults to `None`.
+    - `compression_level: int | None`: level of the codec. Defaults to `None`,
+    i.e. the default level of the codec.
     """
     
     self.destination: str = kwargs.pop('destination', './output')
     self.rich_types: bool = kwargs.pop('rich_types', False)
+    rdf_format: str | None = kwargs.pop('rdf_format', None)
+    rdf_compress: bool = kwargs.pop('rdf_compress', False)
+    self.compression: str | None = kwargs.pop('compression', None)
+    self.compression_level: int | None = kwargs.pop('compression_level', None)
+    if self.compression is not None and self.compression not in CODECS:
+      raise ValueError(
+        f'Unsupported compression {self.compression}, use one of {", ".join(CODECS)}'
+      )
+    if self.compression == 'zstd' and find_spec('zstandard') is None:
+      self.compression = 'gzip'
+      print("""Warning: zstd compression requires the zstandard package, which is
+      not installed. The document will be compressed with gzip instead.""")
 
     self.workflow = Workflow(id = str(uuid4()), name=name)
     self.data = {}
     self.tasks = {}
+    # Attributes added to the document after yprov4wfs has generated it, as it
+    # only supports short, string-valued attributes. The first ones are for the
+    # workflow activity, the others are indexed by the id of the activity.
+    self.run_attributes: dict[str, Any] = {}
+    self.activity_extras: dict[str, dict[str, Any]] = {}
+    self.entity_extras: dict[str, dict[str, Any]] = {}
+    # Activities whose dependencies have been registered. Keys are deterministic,
+    # so a task tracked again, e.g. when recomputed, has the same dependencies
+    self._with_dependencies: set[str] = set()
+    # Times are kept as monotonic nanoseconds in arrays, with a slot for each
+    # activity, and converted to strings only when the document is exported
+    self.clock = RunClock()
+    self.times = TimestampStore(self.clock)
+    self.slots: dict[str, int] = {}
+    # Errors raised by failed tasks, each one stored once
+    self.errors = ErrorTable(self.clock)
+    # Aggregates and logs served while tracking, see prov_tracking.live
+    self.feed: LiveFeed | None = None
+    # Activities that never contributed to an output are pruned, if enabled
+    self.pruner: ReachabilityPruner | None = None
+    self.pruned = { 'activities': 0, 'entities': 0 }
+    # Pruned records are removed from the lists of the workflow in batches
+    self._stale_records = 0
+    self._stale_informants: dict[int, Task] = {}
+
+    # Triples are written as soon as records are finalized, so only activities
+    # that have not finished yet must be remembered, together with those already
+    # written, which are not written again if their task is run again
+    self.rdf: TripleWriter | None = None
+    self._rdf_pending: set[str] = set()
+    self._rdf_written: set[str] = set()
+    self._rdf_usages = 0
+    if rdf_format is not None:
+      codec = (self.compression or 'gzip') if rdf_compress else None
+      file_name = f'yprov4wfs.{rdf_format}' + EXTENSIONS.get(codec or '', '')
+      from prov_tracking.rdf import TripleWriter
+      self.rdf = TripleWriter(
+        os.path.join(self.destination or '.', file_name), rdf_format, codec,
+        self.compression_level
+      )
+
+  def _emit_entity(self, data: Data):
+    """Streams the triples of an entity, if RDF output is enabled."""
+
+    if self.rdf is not None:
+      attributes = dict(data._info or {})
+      attributes.update(self.entity_extras.get(data._id, {}))
+      self.rdf.write_resource(data._id, 'Entity', data._name, attributes)
+
+  def _emit_task(self, task: Task):
+    """Streams the triples of a finalized activity and of the value it returned,
+    if RDF output is enabled. Each activity is written once, so a task that is
+    recomputed, or that is seen failing more than once, keeps its first triples."""
+
+    rdf = self.rdf
+    if rdf is None or task._id in self._rdf_written:
+      return
+    self._rdf_pending.discard(task._id)
+    self._rdf_written.add(task._id)
+    attributes = dict(task._info or {})
+    attributes.update(self.activity_extras.get(task._id, {}))
+    attributes['status'] = task._status
+    slot = self.slots.get(task._id)
+    if slot is not None:
+      attributes.update(self.times.latency_attributes(slot))
+    rdf.write_resource(task._id, 'Activity', task._name, attributes)
+    node = rdf.node(task._id)
+    times = []
+    start_time, end_time = self._task_times(task)
+    if start_time is not None:
+      times.append((rdf.prov('startedAtTime'), rdf.literal(start_time)))
+    if end_time is not None:
+      times.append((rdf.prov('endedAtTime'), rdf.literal(end_time)))
+    rdf.write(node, times)
+    for result in task._outputs:
+      self._emit_entity(result)
+      rdf.write(rdf.node(result._id), [(rdf.prov('wasGeneratedBy'), node)])
+
+  def _emit_usage(self, task: Task, name: str, data_id: str):
+    """Streams a used relation, qualified with the name of the parameter, if RDF
+    output is enabled."""
+
+    rdf = self.rdf
+    if rdf is None:
+      return
+    node = rdf.node(task._id)
+    entity = rdf.node(data_id)
+    usage = f'_:usage{self._rdf_usages}'
+    self._rdf_usages += 1
+    rdf.write(node, [
+      (rdf.prov('used'), entity), (rdf.prov('qualifiedUsage'), usage)
+    ])
+    rdf.write(usage, [
+      (rdf.prov('entity'), entity), (rdf.dskp('as_parameter'), rdf.literal(name))
+    ])
+
+  def _task_times(self, task: Task) -> tuple[Any, Any]:
+    """Returns the start and end time of an activity as datetimes. Only
+    activities that don't represent a single task, e.g. the aggregates of the
+    overload controller, have them set directly."""
+
+    slot = self.slots.get(task._id)
+    if slot is None:
+      return task._start_time, task._end_time
+    return self.times.datetimes(slot)
+
+  def _make_data(self, datanode: DataNode) -> Data:
+    """Creates the entity representing a non-runnable task, without adding it to
+    the workflow."""
 
-  def register_data(self, datanode: DataNode):
-    """Non-runnable tasks are registered as entities as they are in fact just data"""
-    
     data_id = _sanitize(str(datanode.key))
     data = Data(id=data_id, name=data_id)
     data.type = str(type(datanode.typ)) if not self.rich_types else _type(datanode.typ)
@@ -86,11 +229,28 @@ class Documenter:
       'value': _serialize_value(datanode.value),
       'dtype': data.type
     }
+    return data
 
+  def register_data(self, datanode: DataNode):
+    """Non-runnable tasks are registered as entities as they are in fact just data"""
+    
+    data = self._make_data(datanode)
     self.workflow.add_data(data)
-    self.data[data_id] = data
+    self.data[data._id] = data
+    self._emit_entity(data)
+
+  def register_data_nodes(self, datanodes: Iterable[DataNode]):
+    """Bulk version of `Documenter.register_data`. All entities are created
+    first and then added to the workflow at once."""
 
-  def _register_task_param(self, task_id: str, name: str, param: Value) -> tuple[str, str]:
+    new_data = [self._make_data(datanode) for datanode in datanodes]
+    self.workflow._data.extend(new_data)
+    self.data.update((data._id, data) for data in new_data)
+    if self.rdf is not None:
+      for data in new_data:
+        self._emit_entity(data)
+
+  def _register_task_param(self, task_id: str, name: str, param: Value | FanIn) -> tuple[str, str]:
     """Registers the param name for activity `activity_id` according to its
     value. If it is a `ReadyValue`, an entity is created for the parameter and
     the pair `(name, key)` is returned, with `key` being the identifier of the
@@ -103,16 +263,31 @@ class Documenter:
       param_id = _sanitize(param.key)
     elif isinstance(param, GeneratedValue):
       param_id = f'{_sanitize(param.generatedBy)}.return_value'
+    elif isinstance(param, FanIn):
+      # A single entity stands for the results of all the tasks of the fan-in,
+      # which readers can expand from its group and ranges
+      param_id = f'{task_id}.{name}.{_sanitize(param.group)}'
+      if param_id not in self.data:
+        data = Data(id=param_id, name=param_id)
+        data._info = { 'fan_in_size': param.size }
+        self.entity_extras[param_id] = {
+          'fan_in_group': param.group,
+          'fan_in_ranges': param.ranges(),
+        }
+        self.workflow.add_data(data)
+        self.data[param_id] = data
+        self._emit_entity(data)
     else:
       param_id = f'{task_id}.{name}'
       data = Data(id=param_id, name=param_id)
-      data.type = str(type(param.value)) if not self.rich_types else _type(param.value)
+      data.type = str(value_type(param.value)) if not self.rich_types else _type(param.value)
       data._info = {
         'value': _serialize_value(param.value),
         'dtype': data.type
       }
       self.workflow.add_data(data)
       self.data[param_id] = data
+      self._emit_entity(data)
       
     return (name, param_id)
 
@@ -121,6 +296,9 @@ class Documenter:
     via used relations. All runnable dependencies of the task are registered via
     communication relations."""
     task_id = _sanitize(str(info.key))
+    if task_id in self._with_dependencies:
+      return
+    self._with_dependencies.add(task_id)
     task = self.tasks[task_id]
 
     used_params = []
@@ -135,6 +313,9 @@ class Documenter:
         data: Data = self.data[data_id]
         data.add_consumer(task)
         task.add_input(data)
+        self._emit_usage(task, name, data_id)
+        if self.feed is not None:
+          self.feed.edges.append(('used', task_id, data_id))
       except Exception as e:
         print(f'Warning: missing data_id for {info.key}(.., {name}=..): {e}')
     try:
@@ -143,8 +324,30 @@ class Documenter:
         informant_task: Task = self.tasks[informant_id]
         task.add_prev(informant_task)
         informant_task.add_next(task)
+        if self.feed is not None:
+          self.feed.edges.append(('wasInformedBy', task_id, informant_id))
+        if self.rdf is not None:
+          self.rdf.write(self.rdf.node(task._id), [
+            (self.rdf.prov('wasInformedBy'), self.rdf.node(informant_id))
+          ])
     except Exception as e:
       print(f'Warning: missing informant_id for {info.key}: {e}')
+    if self.pruner is not None:
+      self.pruner.add_edges(task_id, self._producers(info))
+
+  @staticmethod
+  def _producers(info: RunnableTaskInfo) -> Iterator[str]:
+    """Yields the activities whose results are used by the task, including the
+    members of its fan-ins, which are not informants."""
+
+    for informant_key in info.informants:
+      yield _sanitize(str(informant_key))
+    for param in info.args_dict.values():
+      if isinstance(param, set):
+        for value in param:
+          if isinstance(value, FanIn):
+            for key in value.keys():
+              yield _sanitize(str(key))
 
   def register_task_worker(self, info: RunnableTaskInfo):
     """Registers the worker on which the task was processed."""
@@ -153,10 +356,9 @@ class Documenter:
     task = self.tasks[task_id]
     task._info['processed_on'] = info.processed_on
   
-  def register_task(self, info: RunnableTaskInfo) -> Task:
-    """Runnble tasks are registered as activities and their returned values as
-    entities. No other info is recorded here. For registering dependencies see
-    `Documenter.register_task_dependencies`"""
+  def _make_task(self, info: RunnableTaskInfo) -> Task:
+    """Creates the activity representing a runnable task, without adding it to
+    the workflow."""
 
     task_id = _sanitize(str(info.key))
     attributes = {
@@ -171,18 +373,138 @@ class Documenter:
       attributes['jupyter_cell'] = info.jupyter_cell
     task = Task(id=task_id, name=task_id)
     task._info = attributes
-    if task_id not in self.tasks:
+    return task
+
+  def _make_result(self, task: Task) -> Data:
+    """Creates the entity representing the value returned by `task`."""
+
+    result_id = f'{task._id}.return_value'
+    result = Data(id=result_id, name=result_id)
+    result.set_producer(task)
+    task.add_output(result)
+    return result
+
+  def register_task(self, info: RunnableTaskInfo) -> Task:
+    """Runnble tasks are registered as activities and their returned values as
+    entities. No other info is recorded here. For registering dependencies see
+    `Documenter.register_task_dependencies`"""
+
+    task = self._make_task(info)
+    if task._id not in self.tasks:
       self.workflow.add_task(task)
-      self.tasks[task_id] = task
-      result_id = f'{task._id}.return_value'
-      result = Data(id=result_id, name=result_id)
-      result.set_producer(task)
-      task.add_output(result)
+      self.tasks[task._id] = task
+      self.slots[task._id] = self.times.allocate()
+      result = self._make_result(task)
       self.workflow.add_data(result)
-      self.data[result_id] = result
+      self.data[result._id] = result
+      if self.rdf is not None:
+        self._rdf_pending.add(task._id)
+      if self.feed is not None:
+        self.feed.registered(str(info.group), result._id, task._id)
+      if self.pruner is not None:
+        self.pruner.add_activity(task._id)
+    info.slot = self.slots[task._id]
     
     return task
 
+  def register_tasks(self, infos: Iterable[RunnableTaskInfo]):
+    """Bulk version of `Documenter.register_task`. All activities and their
+    returned values are created first and then added to the workflow at once."""
+
+    new_tasks: list[Task] = []
+    new_results: list[Data] = []
+    for info in infos:
+      task_id = _sanitize(str(info.key))
+      # Aliases share their info with the target, so the same info can be seen
+      # multiple times
+      if task_id in self.tasks:
+        info.slot = self.slots[task_id]
+        continue
+      task = self._make_task(info)
+      self.tasks[task_id] = task
+      info.slot = self.times.allocate()
+      self.slots[task_id] = info.slot
+      new_tasks.append(task)
+      result = self._make_result(task)
+      self.data[result._id] = result
+      new_results.append(result)
+    self.workflow._tasks.extend(new_tasks)
+    self.workflow._data.extend(new_results)
+    if self.rdf is not None:
+      self._rdf_pending.update(task._id for task in new_tasks)
+    if self.feed is not None:
+      for task, result in zip(new_tasks, new_results):
+        self.feed.registered(str(task._info['group']), result._id, task._id)
+    if self.pruner is not None:
+      for task in new_tasks:
+        self.pruner.add_activity(task._id)
+
+  def register_task_movement(self, info: RunnableTaskInfo, attributes: dict[str, Any]):
+    """Registers the data movement and memory events observed while the task was
+    processed, e.g. the dependencies that were transferred to its worker."""
+
+    if len(attributes) > 0:
+      task_id = _sanitize(str(info.key))
+      extras = self.activity_extras.setdefault(task_id, {})
+      if 'transferred_deps' in attributes:
+        attributes['transferred_deps'] = [
+          _sanitize(key) for key in attributes['transferred_deps']
+        ]
+      extras.update(attributes)
+
+  def register_task_io(self, info: RunnableTaskInfo, attributes: dict[str, Any]):
+    """Registers what the task read from a source array, e.g. a Zarr store."""
+
+    task_id = _sanitize(str(info.key))
+    self.activity_extras.setdefault(task_id, {}).update(attributes)
+
+  def register_task_attempts(
+    self, info: RunnableTaskInfo, attempts: list[dict[str, Any]], total: int
+  ):
+    """Registers the execution attempts of a task executed more than once. Only
+    the most recent attempts are kept, `total` being the number of all of them."""
+
+    task_id = _sanitize(str(info.key))
+    extras = self.activity_extras.setdefault(task_id, {})
+    extras['attempts'] = attempts
+    if total > len(attempts):
+      extras['attempts_total'] = total
+
+  def register_task_fidelity(self, info: RunnableTaskInfo, level: Fidelity):
+    """Registers that the task has been recorded with less detail than usual."""
+
+    task_id = _sanitize(str(info.key))
+    self.tasks[task_id]._info['fidelity'] = level.name.lower()
+
+  def register_overload(self, controller: OverloadController):
+    """Registers the changes of fidelity made by the overload controller and the
+    tasks that were only counted. Tasks counted within their group are
+    represented by a single activity for each group."""
+
+    self.run_attributes['fidelity_changes'] = controller.changes
+    self.run_attributes['fidelity_counters'] = controller.counters
+    for group, aggregate in controller.groups.items():
+      task_id = f'{_sanitize(str(group))}.aggregate'
+      task = self.tasks.get(task_id)
+      if task is None:
+        task = Task(id=task_id, name=task_id)
+        self.workflow.add_task(task)
+        self.tasks[task_id] = task
+      task._status = 'failure' if aggregate.failed > 0 else 'success'
+      task._start_time = aggregate.first_seen
+      task._end_time = aggregate.last_seen
+      task._info = {
+        'group': group,
+        'fidelity': Fidelity.GROUPS.name.lower(),
+        'tasks': aggregate.tasks,
+        'succeeded': aggregate.succeeded,
+        'failed': aggregate.failed,
+      }
+      # Aggregates change until the end of the run, so they are written with the
+      # activities that never completed, see `Documenter.serialize`
+      if self.rdf is not None:
+        self._rdf_pending.add(task_id)
+
   def register_task_success(
     self, info: RunnableTaskInfo, dtype: str | None, nbytes: int | None
   ):
@@ -192,8 +514,8 @@ class Documenter:
     task_id = _sanitize(str(info.key))
     task: Task = self.tasks[task_id]
     task._status = 'success'
-    task._start_time = info.start_time
-    task._end_time = info.finish_time
+    if info.executions > 1:
+      task._info['executions'] = info.executions
 
     # Records the value generated by this funcion
     result = task._outputs[0] # Tasks always have exactly one output
@@ -204,6 +526,7 @@ class Documenter:
         'nbytes': str(nbytes)
     }
     result._info = attributes
+    self._emit_task(task)
 
   def register_task_failure(
     self, info: RunnableTaskInfo, exception_text: str | None,
@@ -215,28 +538,214 @@ class Documenter:
     task_id = _sanitize(str(info.key))
     task: Task = self.tasks[task_id]
     task._status = 'failure'
-    task._start_time = info.start_time
-    task._end_time = info.finish_time
+    if info.executions > 1:
+      task._info['executions'] = info.executions
 
     # Records the value generated by this funcion
     result = task._outputs[0] # Tasks always have exactly one output
-    attributes = {}  
     attributes: dict[str, Any] = {
       'is_error': True,
     }
     if exception_text is not None:
-      attributes['exception_text'] = exception_text
-    
-      if traceback is not None:
-        attributes['traceback'] = traceback
+      # Texts are stored once in the error table and referenced by the activity
+      if 'error' not in task._info:
+        task._info['error'] = self.errors.intern(
+          exception_text, traceback, task_id, self.times.ends[info.slot]
+        )
       if blamed_task is not None and blamed_task.key != task._id:
         other_task_id = _sanitize(str(blamed_task.key))
         attributes['blamed_task'] = other_task_id
     result._info = attributes
+    self._emit_task(task)
+
+  def register_task_completion(
+    self, info: RunnableTaskInfo, status: str, time: int,
+    exception_text: str | None = None, traceback: str | None = None
+  ):
+    """Reports to the live feed, if enabled, that a runnable task `succeeded`
+    or `failed` at `time`, as soon as the scheduler knows it, i.e. while its
+    result may still be held by a client. The activity itself is finalized when
+    the result is released, see `Documenter.register_task_success`."""
+
+    if self.feed is None:
+      return
+    task_id = _sanitize(str(info.key))
+    task = self.tasks.get(task_id)
+    if task is None:
+      return
+    if exception_text is not None and 'error' not in task._info:
+      task._info['error'] = self.errors.intern(exception_text, traceback, task_id, time)
+    self._feed_finished(task, status, self.clock.datetime(time))
+
+  def register_output(self, infos: Iterable[RunnableTaskInfo]):
+    """Registers that the value returned by the tasks reached a client or was
+    marked as an output, so the tasks and those upstream of them are retained."""
+
+    if self.pruner is not None:
+      for info in infos:
+        self.pruner.retain(_sanitize(str(info.key)))
+
+  def register_forgotten(self, infos: Iterable[RunnableTaskInfo]):
+    """Registers that the scheduler has forgotten the tasks, and prunes the
+    activities that can no longer contribute to an output."""
+
+    if self.pruner is not None:
+      self._prune(self.pruner.forget(_sanitize(str(info.key)) for info in infos))
+
+  def has_activities(self, keys: Iterable[Key]) -> bool:
+    """Tells if all the tasks are represented by an activity, i.e. none of them
+    has been pruned."""
+
+    return all(_sanitize(str(key)) in self.tasks for key in keys)
+
+  def _prune(self, task_ids: Iterable[str]):
+    """Removes the activities, the values they returned and the entities
+    created for their parameters. Entities shared with other activities are
+    only removed by `Documenter.prune_unreachable`."""
+
+    for task_id in task_ids:
+      task = self.tasks.pop(task_id, None)
+      if task is None:
+        continue
+      self.pruned['activities'] += 1
+      self._stale_records += 1
+      self.activity_extras.pop(task_id, None)
+      self.slots.pop(task_id, None)
+      self._with_dependencies.discard(task_id)
+      self._rdf_pending.discard(task_id)
+      # Their communication relations to this activity are removed later
+      for informant_task in task._prev:
+        self._stale_informants[id(informant_task)] = informant_task
+      prefix = f'{task_id}.'
+      for data in task._outputs + task._inputs:
+        if data._id.startswith(prefix) and self.data.get(data._id) is data:
+          self._prune_entity(data._id)
+    if self._stale_records > len(self.tasks):
+      self._compact()
+
+  def _prune_entity(self, data_id: str):
+    del self.data[data_id]
+    self.entity_extras.pop(data_id, None)
+    self.pruned['entities'] += 1
+    self._stale_records += 1
+
+  def _compact(self):
+    """Removes the pruned records from the lists of the workflow. Records are
+    compared by identity, as a pruned task might be registered again."""
+
+    tasks, data = self.tasks, self.data
+    self.workflow._tasks = [
+      task for task in self.workflow._tasks if tasks.get(task._id) is task
+    ]
+    self.workflow._data = [
+      item for item in self.workflow._data if data.get(item._id) is item
+    ]
+    for informant_task in self._stale_informants.values():
+      informant_task._next = [
+        task for task in informant_task._next if tasks.get(task._id) is task
+      ]
+    self._stale_records = 0
+    self._stale_informants.clear()
+
+  def prune_unreachable(self):
+    """Prunes the activities that didn't contribute to any output, whether
+    their task has been forgotten or not, and the entities no longer used or
+    generated by any activity. The number of pruned records is added to the
+    workflow activity."""
+
+    if self.pruner is None:
+      return
+    self._prune(self.pruner.unreachable())
+    referenced: set[str] = set()
+    for task in self.tasks.values():
+      referenced.update(data._id for data in task._inputs)
+      referenced.update(data._id for data in task._outputs)
+    for data_id in [data_id for data_id in self.data if data_id not in referenced]:
+      self._prune_entity(data_id)
+    self._compact()
+    self.run_attributes['pruned'] = dict(self.pruned)
+
+  def _feed_finished(self, task: Task, status: str, end_time: Any):
+    """Reports a finished activity to the live feed, if enabled."""
+
+    if self.feed is not None:
+      info = task._info
+      start_time, _ = self._task_times(task)
+      self.feed.finished(
+        task._id, str(info.get('group')), status, start_time, end_time,
+        info.get('processed_on'), info.get('error')
+      )
+
+  def _to_document(self) -> dict[str, Any]:
+    """Generates the PROV-JSON document of the workflow and adds to it the
+    attributes that can't be handled by yprov4wfs."""
+
+    clock, starts, ends = self.clock, self.times.starts, self.times.ends
+    for task_id, slot in self.slots.items():
+      task = self.tasks[task_id]
+      task._start_time = clock.isoformat(starts[slot])
+      task._end_time = clock.isoformat(ends[slot])
+    prov_json = self.workflow.to_prov()
+    if prov_json is None:
+      raise ValueError('Failed to serialize the document to JSON.')
+    doc = json.loads(prov_json)
+    activities: dict[str, dict[str, Any]] = doc['activity']
+    for task_id, slot in self.slots.items():
+      activity = activities.get(task_id)
+      if activity is not None:
+        for name, value in self.times.latency_attributes(slot).items():
+          activity[f'yprov4wfs:{name}'] = value
+    for task_id, attributes in self.activity_extras.items():
+      activity = activities.get(task_id)
+      if activity is not None:
+        for name, value in attributes.items():
+          activity[f'yprov4wfs:{name}'] = value
+    entities: dict[str, dict[str, Any]] = doc['entity']
+    for data_id, attributes in self.entity_extras.items():
+      entity = entities.get(data_id)
+      if entity is not None:
+        for name, value in attributes.items():
+          entity[f'yprov4wfs:{name}'] = value
+    workflow_activity = activities[self.workflow._id]
+    if len(self.errors) > 0:
+      self.run_attributes['errors'] = self.errors.to_dict()
+    self.run_attributes['durations'] = self.times.duration_stats()
+    for name, value in self.run_attributes.items():
+      workflow_activity[f'yprov4wfs:{name}'] = value
+    return doc
 
   def serialize(self, destination=None):
     """Serializes the provenance document into `destination`."""
 
     if destination is None and self.destination is not None:
       destination = self.destination
-    self.workflow.prov_to_json(directory_path=destination)
+    self.prune_unreachable()
+    doc = self._to_document()
+    file_path = 'yprov4wfs.json'
+    if self.compression is not None:
+      file_path += EXTENSIONS[self.compression]
+    if destination is not None:
+      os.makedirs(destination, exist_ok=True)
+      file_path = os.path.join(destination, file_path)
+    if self.compression is not None:
+      f = open_writer(file_path, self.compression, self.compression_level)
+    else:
+      f = open(file_path, 'w')
+    with f:
+      json.dump(doc, f, indent=4, ensure_ascii=False)
+
+    if self.rdf is not None:
+      # Activities that never completed are written as they are, after the mark
+      # together with the workflow, so that if the document is serialized again,
+      # e.g. because a task failed after the plugin was closed, they're replaced
+      # instead of being written twice with different values
+      pending = list(self._rdf_pending)
+      self.rdf.mark()
+      for task_id in pending:
+        self._emit_task(self.tasks[task_id])
+      self._rdf_pending.update(pending)
+      self._rdf_written.difference_update(pending)
+      self.rdf.write_resource(
+        self.workflow._id, 'Activity', self.workflow._name, self.run_attributes
+      )
+      self.rdf.close()
@@ -0,0 +1,99 @@
+import re
+from hashlib import blake2b
+from typing import Any
+
+from prov_tracking.clock import UNSET, RunClock
+
+# Parts of exception texts and tracebacks that change between tasks failing for
+# the same reason: memory addresses, tokens of keys and numbers, e.g. indices
+_ADDRESS = re.compile(r'0x[0-9a-fA-F]+')
+_TOKEN = re.compile(r'\b[0-9a-f]{32}\b')
+_NUMBER = re.compile(r'\d+')
+# Addresses in the representations of objects, e.g. `<function f at 0x...>`,
+# which change in every run
+_LOCATION = re.compile(r' at 0x[0-9a-fA-F]+')
+
+def strip_addresses(text: str) -> str:
+  """Returns the text without the addresses in the representations of objects,
+  so that the same value recorded by different runs has the same text."""
+
+  return _LOCATION.sub('', text)
+
+def normalize(text: str) -> str:
+  """Returns the text with addresses, tokens and numbers replaced by
+  placeholders, so that the same error raised by different tasks, e.g. on
+  different chunks, has the same normalized text."""
+
+  text = _ADDRESS.sub('0x?', text)
+  text = _TOKEN.sub('<token>', text)
+  return _NUMBER.sub('#', text)
+
+class ErrorRecord:
+  """An error raised by one or more tasks. The texts are those of the first
+  task that raised it, times are those of a `RunClock`."""
+
+  __slots__ = (
+    'exception_text', 'traceback', 'first_task', 'first_seen', 'last_seen',
+    'count'
+  )
+
+  def __init__(
+    self, exception_text: str, traceback: str | None, task_id: str, time: int
+  ):
+    self.exception_text = exception_text
+    self.traceback = traceback
+    self.first_task = task_id
+    self.first_seen = time
+    self.last_seen = time
+    self.count = 0
+
+  def to_dict(self, clock: RunClock) -> dict[str, Any]:
+    record: dict[str, Any] = { 'exception_text': self.exception_text }
+    if self.traceback is not None:
+      record['traceback'] = self.traceback
+    record['first_task'] = self.first_task
+    record['first_seen'] = str(clock.isoformat(self.first_seen))
+    record['last_seen'] = str(clock.isoformat(self.last_seen))
+    record['count'] = self.count
+    return record
+
+class ErrorTable:
+  """Interns the errors raised by failed tasks by a hash of their normalized
+  exception text and traceback, so that each distinct error is stored once,
+  however many tasks raised it."""
+
+  def __init__(self, clock: RunClock):
+    self.clock = clock
+    self.errors: dict[str, ErrorRecord] = {}
+
+  def __len__(self) -> int:
+    return len(self.errors)
+
+  def intern(
+    self, exception_text: str, traceback: str | None, task_id: str, time: int
+  ) -> str:
+    """Records that the task `task_id` raised an error at `time`. Returns the id
+    of the error in the table."""
+
+    hash = blake2b(digest_size=8)
+    hash.update(normalize(exception_text).encode())
+    if traceback is not None:
+      hash.update(b'\0')
+      hash.update(normalize(traceback).encode())
+    error_id = f'error-{hash.hexdigest()}'
+    record = self.errors.get(error_id)
+    if record is None:
+      record = ErrorRecord(exception_text, traceback, task_id, time)
+      self.errors[error_id] = record
+    elif time != UNSET:
+      if record.first_seen == UNSET or time < record.first_seen:
+        record.first_seen = time
+      if record.last_seen == UNSET or time > record.last_seen:
+        record.last_seen = time
+    record.count += 1
+    return error_id
+
+  def to_dict(self) -> dict[str, dict[str, Any]]:
+    return {
+      error_id: record.to_dict(self.clock) for error_id, record in self.errors.items()
+    }
@@ -0,0 +1,198 @@
+import ast
+from importlib.util import find_spec
+from itertools import chain, product
+from typing import Any, Iterable, Iterator
+
+# A box is an inclusive (start, stop) range for each index of the keys
+type Box = tuple[tuple[int, int], ...]
+# Number of indices from which boxes are computed with numpy, below which the
+# cost of building the arrays exceeds what vectorizing saves
+_ARRAY_THRESHOLD = 512
+# numpy is only imported when a set is large enough, as most modules of the
+# package import this one and don't need it otherwise
+_HAS_NUMPY = find_spec('numpy') is not None
+
+class FanIn:
+  """Compact representation of the results of many tasks of the same group used
+  by a single argument, e.g. all the chunks combined by a tree reduction. Keys
+  are `(group, i, j, ...)` tuples and their indices are stored as a union of
+  boxes, e.g. `mean_chunk-abc[0..511, 0..3]`."""
+
+  __slots__ = ('group', 'boxes', 'size')
+
+  def __init__(self, group: str, boxes: tuple[Box, ...]):
+    self.group = group
+    self.boxes = boxes
+    self.size = 0
+    for box in boxes:
+      count = 1
+      for start, stop in box:
+        count *= stop - start + 1
+      self.size += count
+
+  def __eq__(self, o: object) -> bool:
+    if isinstance(o, FanIn):
+      return self.group == o.group and self.boxes == o.boxes
+    return False
+
+  def __hash__(self) -> int:
+    return hash(('fan_in', self.group, self.boxes))
+
+  def __len__(self) -> int:
+    return self.size
+
+  def __str__(self) -> str:
+    return ' + '.join(
+      f'{self.group}[{", ".join(f"{start}..{stop}" for start, stop in box)}]'
+      for box in self.boxes
+    )
+
+  def keys(self) -> Iterator[tuple]:
+    """Yields the keys of all the tasks in the fan-in."""
+
+    return expand(self.group, self.boxes)
+
+  def ranges(self) -> list[list[list[int]]]:
+    """Returns the boxes as JSON-serializable lists."""
+
+    return [[[start, stop] for start, stop in box] for box in self.boxes]
+
+def expand(group: str, boxes: Iterable[Iterable[Iterable[int]]]) -> Iterator[tuple]:
+  """Yields the keys of all the tasks in a fan-in, given its group and boxes,
+  e.g. as read from the `fan_in_ranges` attribute of a provenance document."""
+
+  for box in boxes:
+    for indices in product(*(range(start, stop + 1) for start, stop in box)):
+      yield (group, *indices)
+
+def member_id(key: Any) -> str:
+  """Returns the identifier of the activity that produced `key`, as it's written
+  by the documenter. The entity of its result is `<id>.return_value`."""
+
+  return str(key).replace('(', '').replace(')', '').replace('\'', '').replace(', ', '_')
+
+def parse_key(string: str) -> Any:
+  """Parses the string representation of a key back into the key. Returns
+  `None` if the string doesn't represent a `(group, i, j, ...)` key."""
+
+  if not string.startswith('('):
+    return None
+  try:
+    key = ast.literal_eval(string)
+  except (ValueError, SyntaxError):
+    return None
+  if (
+    isinstance(key, tuple) and len(key) > 1 and isinstance(key[0], str) and
+    all(type(index) is int for index in key[1:])
+  ):
+    return key
+  return None
+
+def _merge_last(entries: list[tuple[tuple, Box]]) -> list[tuple[tuple, Box]]:
+  """Given pairs `(prefix, box)`, merges the pairs that only differ by
+  consecutive values of the last index of the prefix, which is moved into the
+  box."""
+
+  entries.sort(key=lambda entry: (entry[0][:-1], entry[1], entry[0][-1]))
+  merged: list[list] = []
+  for prefix, box in entries:
+    head, index = prefix[:-1], prefix[-1]
+    if len(merged) > 0:
+      last = merged[-1]
+      if last[0] == head and last[1] == box and last[3] == index - 1:
+        last[3] = index
+        continue
+    merged.append([head, box, index, index])
+  return [(head, ((start, stop),) + box) for head, box, start, stop in merged]
+
+def _boxes_array(indices: list[tuple[int, ...]]) -> tuple[Box, ...]:
+  """Same as `boxes_of`, computed with numpy over the columns of the indices.
+  Each row of the table holds the leading indices not merged yet, followed by
+  the start and the stop of each merged dimension."""
+
+  import numpy as np
+
+  count, length = len(indices), len(indices[0])
+  table = np.fromiter(
+    chain.from_iterable(indices), dtype=np.int64, count=count * length
+  ).reshape(count, length)
+  table = table[np.lexsort(table.T[::-1])]
+  table = table[np.concatenate(([True], np.any(table[1:] != table[:-1], axis=1)))]
+  # Only the last dimension is merged in the first pass, as the rows are sorted
+  head = table.shape[1]
+  while head > 0:
+    last = table[:, head - 1]
+    others = np.delete(table, head - 1, axis=1)
+    if head < table.shape[1]:
+      # Entries that only differ by the last leading index must be adjacent
+      order = np.lexsort([last] + [others[:, c] for c in reversed(range(others.shape[1]))])
+      table, last, others = table[order], last[order], others[order]
+    continues = last[1:] == last[:-1] + 1
+    if others.shape[1] > 0:
+      continues &= np.all(others[1:] == others[:-1], axis=1)
+    starts = np.flatnonzero(np.concatenate(([True], ~continues)))
+    stops = np.append(starts[1:], len(table)) - 1
+    table = np.concatenate((
+      table[starts, :head - 1], table[starts, head - 1:head],
+      table[stops, head - 1:head], table[starts, head:]
+    ), axis=1)
+    head -= 1
+  return tuple(sorted(
+    tuple(zip(row[0::2], row[1::2])) for row in table.tolist()
+  ))
+
+def boxes_of(indices: Iterable[tuple[int, ...]]) -> tuple[Box, ...]:
+  """Covers a set of index tuples, all with the same length, with boxes. Indices
+  are merged one dimension at a time, starting from the last one, so a full
+  grid of indices is always covered by a single box. Large sets are merged with
+  numpy, if it is installed."""
+
+  if _HAS_NUMPY:
+    if not isinstance(indices, (list, tuple)):
+      indices = list(indices)
+    if len(indices) >= _ARRAY_THRESHOLD:
+      return _boxes_array(indices)
+  ordered = sorted(set(indices))
+  if len(ordered) == 0:
+    return ()
+  # The first merge is the one with most entries, and sorting the indices
+  # already puts the consecutive ones next to each other
+  entries: list[tuple[tuple, Box]] = []
+  head, start = ordered[0][:-1], ordered[0][-1]
+  stop = start
+  for index in ordered[1:]:
+    if index[-1] == stop + 1 and index[:-1] == head:
+      stop += 1
+    else:
+      entries.append((head, ((start, stop),)))
+      head, start = index[:-1], index[-1]
+      stop = start
+  entries.append((head, ((start, stop),)))
+  for _ in range(len(ordered[0]) - 1):
+    entries = _merge_last(entries)
+  return tuple(sorted(box for _, box in entries))
+
+def build_fan_ins(keys: Iterable[Any]) -> tuple[list[FanIn], list[Any]]:
+  """Groups `(group, i, j, ...)` keys into fan-ins. A fan-in is only built when
+  its boxes are at most half as many as its keys, i.e. when it's actually more
+  compact. Returns the fan-ins and the keys that were left out."""
+
+  groups: dict[tuple[str, int], list[tuple[int, ...]]] = {}
+  left_out: list[Any] = []
+  for key in keys:
+    if (
+      isinstance(key, tuple) and len(key) > 1 and isinstance(key[0], str) and
+      all(type(index) is int for index in key[1:])
+    ):
+      groups.setdefault((key[0], len(key)), []).append(key[1:])
+    else:
+      left_out.append(key)
+
+  fan_ins: list[FanIn] = []
+  for (group, _), indices in groups.items():
+    boxes = boxes_of(indices)
+    if 2 * len(boxes) <= len(indices):
+      fan_ins.append(FanIn(group, boxes))
+    else:
+      left_out.extend((group, *index) for index in indices)
+  return fan_ins, left_out
@@ -0,0 +1,138 @@
+from array import array
+from typing import Any
+
+from dask.typing import Key
+
+from prov_tracking.clock import UNSET, RunClock
+
+# Bucket i of a histogram counts latencies below 2 ** (i + _MIN_EXPONENT) ns,
+# and at least the upper bound of the previous one: the first bucket holds those
+# below about 1 microsecond, the last one those above about 9 minutes
+_MIN_EXPONENT = 10
+_BUCKETS = 31
+
+class LatencyHistogram:
+  """Histogram of latencies with logarithmic buckets, each one twice as large
+  as the previous one, updated as latencies are recorded."""
+
+  __slots__ = ('counts', 'count', 'total', 'max')
+
+  def __init__(self):
+    self.counts = array('q', bytes(8 * _BUCKETS))
+    self.count = 0
+    self.total = 0
+    self.max = 0
+
+  def add(self, latency: int):
+    bucket = min(max(latency.bit_length() - _MIN_EXPONENT, 0), _BUCKETS - 1)
+    self.counts[bucket] += 1
+    self.count += 1
+    self.total += latency
+    if latency > self.max:
+      self.max = latency
+
+  def to_dict(self) -> dict[str, Any]:
+    """Returns the number of latencies, their mean and maximum, in seconds, and
+    the count of each non-empty bucket, by its upper bound in seconds."""
+
+    if self.count == 0:
+      return { 'count': 0 }
+    buckets: dict[str, int] = {}
+    for i, count in enumerate(self.counts):
+      if count > 0:
+        bound = 'inf' if i == _BUCKETS - 1 else f'{2 ** (i + _MIN_EXPONENT) / 1e9:.6g}'
+        buckets[bound] = count
+    return {
+      'count': self.count, 'mean': self.total / self.count / 1e9,
+      'max': self.max / 1e9, 'buckets': buckets,
+    }
+
+class _Latencies:
+  """Histograms of the two latencies for a task group or a worker."""
+
+  __slots__ = ('queue', 'dispatch')
+
+  def __init__(self):
+    self.queue = LatencyHistogram()
+    self.dispatch = LatencyHistogram()
+
+  def to_dict(self) -> dict[str, Any]:
+    return { 'queue': self.queue.to_dict(), 'dispatch': self.dispatch.to_dict() }
+
+class LatencyTracker:
+  """Timestamps the scheduler states a task goes through before it runs: when
+  it becomes ready, i.e. it leaves `waiting` because its dependencies are in
+  memory, and when it is dispatched to a worker, i.e. it enters `processing`,
+  possibly after being `queued` or in `no-worker`. When the task finishes, the
+  worker reports when it started executing it. Queue latency is the time from
+  ready to dispatch and dispatch latency the time from dispatch to start. Both
+  are added to histograms for the group and the worker as soon as known."""
+
+  def __init__(self, clock: RunClock):
+    self.clock = clock
+    # Time at which each task became ready, until it's dispatched
+    self._ready: dict[Key, int] = {}
+    # Time of the dispatch, queue latency and worker of each task being
+    # processed, as the scheduler unassigns the worker before the task leaves
+    # the processing state
+    self._dispatched: dict[Key, tuple[int, int, str]] = {}
+    self.groups: dict[str, _Latencies] = {}
+    self.workers: dict[str, _Latencies] = {}
+
+  def _latencies(self, table: dict[str, _Latencies], name: str) -> _Latencies:
+    latencies = table.get(name)
+    if latencies is None:
+      latencies = _Latencies()
+      table[name] = latencies
+    return latencies
+
+  def ready(self, key: Key, now: int):
+    """Must be called when `key` leaves the `waiting` state."""
+
+    self._ready[key] = now
+
+  def dispatched(self, key: Key, group: str, worker: str, now: int):
+    """Must be called when `key` enters the `processing` state."""
+
+    ready = self._ready.pop(key, None)
+    queue = now - ready if ready is not None else UNSET
+    if queue != UNSET:
+      self._latencies(self.groups, group).queue.add(queue)
+      self._latencies(self.workers, worker).queue.add(queue)
+    self._dispatched[key] = (now, queue, worker)
+
+  def finished(
+    self, key: Key, group: str, startstops: list[dict[str, Any]] | None
+  ) -> tuple[int, int] | None:
+    """Must be called when `key` leaves the `processing` state. Returns its
+    queue and dispatch latency, either one being `UNSET` if unknown, or `None`
+    if the task wasn't seen being dispatched."""
+
+    dispatched = self._dispatched.pop(key, None)
+    if dispatched is None:
+      return None
+    dispatch_time, queue, worker = dispatched
+    starts = [
+      startstop['start'] for startstop in startstops or ()
+      if startstop.get('action') == 'compute'
+    ]
+    dispatch = UNSET
+    if len(starts) > 0:
+      dispatch = self.clock.from_timestamp(min(starts)) - dispatch_time
+      # The clock of the worker is behind the one of the scheduler
+      if dispatch < 0:
+        dispatch = UNSET
+    if dispatch != UNSET:
+      self._latencies(self.groups, group).dispatch.add(dispatch)
+      self._latencies(self.workers, worker).dispatch.add(dispatch)
+    return queue, dispatch
+
+  def forget(self, key: Key):
+    self._ready.pop(key, None)
+    self._dispatched.pop(key, None)
+
+  def summary(self) -> dict[str, dict[str, Any]]:
+    return {
+      'groups': { name: latencies.to_dict() for name, latencies in self.groups.items() },
+      'workers': { name: latencies.to_dict() for name, latencies in self.workers.items() },
+    }
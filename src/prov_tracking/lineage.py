@@ -0,0 +1,223 @@
+import re
+from collections import deque
+from typing import Iterable
+
+try:
+  import numpy as np
+  from scipy import sparse
+except ImportError as e:
+  raise ImportError(
+    'prov_tracking.lineage requires numpy and scipy, install them with '
+    '`pip install numpy scipy`'
+  ) from e
+
+from prov_tracking.reader import ProvReader
+
+# Identifiers of activities are their sanitized keys, so the chunk coordinates
+# of ('name', i, j) end up as the trailing `_i_j`
+_COORDS = re.compile(r'^(.*?)((?:_-?\d+)+)$')
+
+# A selection of chunks: for each dimension, an index, a slice or None for all
+type Where = tuple[int | slice | None, ...]
+
+def split_id(id: str) -> tuple[str, tuple[int, ...]]:
+  """Splits the identifier of an activity into the name of its key and its
+  chunk coordinates, which are empty if the key has none."""
+
+  match = _COORDS.match(id)
+  if match is None:
+    return id, ()
+  return match.group(1), tuple(int(c) for c in match.group(2)[1:].split('_'))
+
+class ChunkGroup:
+  """The chunks of a group of tasks, i.e. of the tasks whose keys have the same
+  name. Coordinates are stored as an `(n, ndim)` integer array."""
+
+  __slots__ = ('name', 'ids', 'coords', '_rows')
+
+  def __init__(self, name: str, ids: list[str], coords: list[tuple[int, ...]]):
+    self.name = name
+    self.ids = ids
+    ndim = max((len(c) for c in coords), default=0)
+    # Keys of the same name with fewer coordinates are padded with -1
+    self.coords = np.array(
+      [c + (-1,) * (ndim - len(c)) for c in coords], dtype=np.int64
+    ).reshape(len(coords), ndim)
+    self._rows = { id: row for row, id in enumerate(ids) }
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  @property
+  def ndim(self) -> int:
+    return self.coords.shape[1]
+
+  def row(self, id: str) -> int:
+    return self._rows[id]
+
+  def select(self, where: Where | None = None) -> np.ndarray:
+    """Returns the boolean mask of the chunks selected by `where`, e.g.
+    `(slice(0, 4), 2)` selects the chunks with the first coordinate in `[0, 4)`
+    and the second one equal to 2. Missing dimensions select everything."""
+
+    mask = np.ones(len(self), dtype=bool)
+    if where is None:
+      return mask
+    for dim, index in enumerate(where[:self.ndim]):
+      column = self.coords[:, dim]
+      if index is None:
+        continue
+      if isinstance(index, slice):
+        start, stop, step = index.start, index.stop, index.step
+        if start is not None:
+          mask &= column >= start
+        if stop is not None:
+          mask &= column < stop
+        if step is not None:
+          mask &= (column - (start or 0)) % step == 0
+      else:
+        mask &= column == index
+    return mask
+
+class ChunkLineage:
+  """Chunk-level lineage index of a provenance document. Dependencies between
+  two groups are stored as a sparse boolean matrix, with a row for each chunk
+  of the consumer group and a column for each chunk of the producer group, so
+  transitive lineage queries are answered with sparse products over whole
+  groups instead of walking the graph task by task."""
+
+  def __init__(self, groups: dict[str, ChunkGroup], dependencies: dict[tuple[str, str], sparse.csr_matrix]):
+    self.groups = groups
+    # (consumer, producer) -> matrix of shape (len(consumer), len(producer))
+    self.dependencies = dependencies
+    self._producers: dict[str, list[str]] = {}
+    self._consumers: dict[str, list[str]] = {}
+    for consumer, producer in dependencies:
+      self._producers.setdefault(consumer, []).append(producer)
+      self._consumers.setdefault(producer, []).append(consumer)
+
+  @classmethod
+  def from_edges(
+    cls, activity_ids: Iterable[str], edges: Iterable[tuple[str, str]]
+  ) -> 'ChunkLineage':
+    """Builds the index from the identifiers of the activities and the
+    `(consumer, producer)` pairs of activities."""
+
+    members: dict[str, tuple[list[str], list[tuple[int, ...]]]] = {}
+    location: dict[str, tuple[str, int]] = {}
+    for id in activity_ids:
+      name, coords = split_id(id)
+      ids, all_coords = members.setdefault(name, ([], []))
+      location[id] = (name, len(ids))
+      ids.append(id)
+      all_coords.append(coords)
+    groups = { name: ChunkGroup(name, ids, coords) for name, (ids, coords) in members.items() }
+
+    pairs: dict[tuple[str, str], tuple[list[int], list[int]]] = {}
+    for consumer, producer in edges:
+      if consumer not in location or producer not in location:
+        continue
+      consumer_group, row = location[consumer]
+      producer_group, column = location[producer]
+      rows, columns = pairs.setdefault((consumer_group, producer_group), ([], []))
+      rows.append(row)
+      columns.append(column)
+
+    dependencies: dict[tuple[str, str], sparse.csr_matrix] = {}
+    for (consumer, producer), (rows, columns) in pairs.items():
+      matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (np.array(rows), np.array(columns))),
+        shape=(len(groups[consumer]), len(groups[producer]))
+      )
+      dependencies[(consumer, producer)] = matrix
+    return cls(groups, dependencies)
+
+  @classmethod
+  def from_document(cls, path: str) -> 'ChunkLineage':
+    """Builds the index from a saved provenance document. An activity depends on
+    another one if it used an entity generated by it. Fan-ins are expanded."""
+
+    with ProvReader(path) as reader:
+      return cls.from_edges(
+        reader.activity_ids(), reader.communications(expand_fan_ins=True)
+      )
+
+  def group(self, name: str) -> ChunkGroup:
+    """Returns the group `name`. The name can also be a prefix of the name of a
+    single group, e.g. `mean_chunk` instead of `mean_chunk-<token>`."""
+
+    if name in self.groups:
+      return self.groups[name]
+    matches = [group for group in self.groups if group.startswith(name)]
+    if len(matches) != 1:
+      raise KeyError(f'{name} matches {len(matches)} groups')
+    return self.groups[matches[0]]
+
+  def _propagate(
+    self, start: ChunkGroup, mask: np.ndarray, upstream: bool
+  ) -> dict[str, np.ndarray]:
+    """Propagates the selected chunks of `start` through the dependencies, until
+    no group gains new chunks. Returns, for each reached group, the mask of its
+    reached chunks."""
+
+    reached: dict[str, np.ndarray] = { start.name: mask }
+    queue = deque([start.name])
+    while len(queue) > 0:
+      name = queue.popleft()
+      current = reached[name]
+      neighbours = self._producers if upstream else self._consumers
+      for other in neighbours.get(name, []):
+        if upstream:
+          step = self.dependencies[(name, other)].T @ current
+        else:
+          step = self.dependencies[(other, name)] @ current
+        previous = reached.get(other)
+        if previous is None:
+          if step.any():
+            reached[other] = step
+            queue.append(other)
+        elif (step & ~previous).any():
+          reached[other] = previous | step
+          queue.append(other)
+    return reached
+
+  def upstream(
+    self, group: str, source: str, where: Where | None = None
+  ) -> np.ndarray:
+    """Returns the coordinates of the chunks of `source` that contributed,
+    directly or not, to the chunks of `group` selected by `where`."""
+
+    start = self.group(group)
+    target = self.group(source)
+    reached = self._propagate(start, start.select(where), upstream=True)
+    mask = reached.get(target.name)
+    if mask is None:
+      return np.empty((0, target.ndim), dtype=np.int64)
+    return target.coords[mask]
+
+  def downstream(
+    self, group: str, target: str, where: Where | None = None
+  ) -> np.ndarray:
+    """Returns the coordinates of the chunks of `target` that depend, directly
+    or not, on the chunks of `group` selected by `where`."""
+
+    start = self.group(group)
+    end = self.group(target)
+    reached = self._propagate(start, start.select(where), upstream=False)
+    mask = reached.get(end.name)
+    if mask is None:
+      return np.empty((0, end.ndim), dtype=np.int64)
+    return end.coords[mask]
+
+  def lineage(
+    self, group: str, where: Where | None = None, upstream: bool = True
+  ) -> dict[str, np.ndarray]:
+    """Returns, for every group reached from the chunks of `group` selected by
+    `where`, the coordinates of the reached chunks."""
+
+    start = self.group(group)
+    reached = self._propagate(start, start.select(where), upstream)
+    return {
+      name: self.groups[name].coords[mask] for name, mask in reached.items()
+      if name != start.name
+    }
@@ -0,0 +1,185 @@
+from typing import Any, Callable
+
+from prov_tracking.errors import ErrorTable
+
+class RecordLog:
+  """Log of the most recent `capacity` records appended to it, stored in a ring
+  buffer. Each record is identified by its cursor, i.e. the number of records
+  appended before it, so clients keep their position while older records are
+  overwritten."""
+
+  __slots__ = ('capacity', 'records', 'end')
+
+  def __init__(self, capacity: int):
+    self.capacity = capacity
+    self.records: list[Any] = []
+    # Cursor following the last record
+    self.end = 0
+
+  def __len__(self) -> int:
+    return self.end
+
+  @property
+  def base(self) -> int:
+    """Cursor of the oldest record still held."""
+
+    return self.end - len(self.records)
+
+  def append(self, record: Any):
+    if len(self.records) < self.capacity:
+      self.records.append(record)
+    else:
+      self.records[self.end % self.capacity] = record
+    self.end += 1
+
+  def page(self, cursor: int, limit: int) -> tuple[list[Any], int, bool]:
+    """Returns at most `limit` records from `cursor`, the cursor following them
+    and whether some of the records from `cursor` were already overwritten, in
+    which case the page starts from the oldest record held."""
+
+    truncated = cursor < self.base
+    start = max(cursor, self.base)
+    stop = max(min(start + limit, self.end), start)
+    return (
+      [self.records[i % self.capacity] for i in range(start, stop)], stop, truncated
+    )
+
+class LiveFeed:
+  """Aggregates of the provenance recorded so far, maintained incrementally by
+  the documenter, together with the logs of finished activities and of new
+  relations. Clients poll the logs with a cursor, i.e. the number of records
+  they have already seen, and every request costs time proportional to the
+  records returned, not to the size of the graph. Only the last `log_size`
+  records of each log are kept."""
+
+  def __init__(self, log_size: int = 100_000):
+    # For each task group, the number of registered, succeeded and failed tasks
+    self.groups: dict[str, dict[str, int]] = {}
+    # For each worker, the number of tasks that succeeded and failed on it
+    self.workers: dict[str, dict[str, int]] = {}
+    self.activities = RecordLog(log_size)
+    # (relation, subject, object), e.g. ('used', activity, entity)
+    self.edges = RecordLog(log_size)
+
+  def _group(self, group: str) -> dict[str, int]:
+    counts = self.groups.get(group)
+    if counts is None:
+      counts = { 'registered': 0, 'succeeded': 0, 'failed': 0 }
+      self.groups[group] = counts
+    return counts
+
+  def registered(self, group: str, result_id: str, task_id: str):
+    self._group(group)['registered'] += 1
+    self.edges.append(('wasGeneratedBy', result_id, task_id))
+
+  def finished(
+    self, task_id: str, group: str, status: str, start: Any, end: Any,
+    worker: str | None, error: str | None
+  ):
+    self._group(group)[status] += 1
+    if worker is not None:
+      counts = self.workers.get(worker)
+      if counts is None:
+        counts = { 'succeeded': 0, 'failed': 0 }
+        self.workers[worker] = counts
+      counts[status] += 1
+    record = {
+      'id': task_id, 'group': group, 'status': status,
+      'start': str(start) if start is not None else None,
+      'end': str(end) if end is not None else None, 'worker': worker,
+    }
+    if error is not None:
+      record['error'] = error
+    self.activities.append(record)
+
+  def summary(self, errors: dict[str, int]) -> dict[str, Any]:
+    return {
+      'groups': self.groups,
+      'workers': self.workers,
+      'errors': errors,
+      'cursors': { 'activities': len(self.activities), 'edges': len(self.edges) },
+    }
+
+# Returns the feed and the error table of a session, None if it doesn't exist
+type FeedLookup = Callable[[str | None], tuple[LiveFeed, ErrorTable] | None]
+
+# Handlers of the endpoints, created on first use
+_HANDLERS: tuple[type, type, type, type] | None = None
+
+def _handlers() -> tuple[type, type, type, type]:
+  """Creates the request handlers of the summary, activities, edges and errors
+  endpoints. tornado is imported here, as the feed is only served when a live
+  endpoint is enabled."""
+
+  global _HANDLERS
+  if _HANDLERS is not None:
+    return _HANDLERS
+  from tornado import web
+
+  class _FeedHandler(web.RequestHandler):
+    def initialize(self, lookup: FeedLookup):
+      self.lookup = lookup
+
+    def prepare(self):
+      session = self.path_kwargs.get('session')
+      source = self.lookup(session)
+      if source is None:
+        raise web.HTTPError(404, f'Unknown session {session}')
+      self.feed, self.errors = source
+
+    def _page(self, log: RecordLog) -> dict[str, Any]:
+      """Returns the records after the `cursor` query argument, at most `limit`
+      of them, and the cursor from which the next page starts. If the records
+      right after the cursor have already been dropped from the log, the page
+      starts from the oldest one held and `truncated` is true."""
+
+      try:
+        cursor = max(int(self.get_argument('cursor', '0')), 0)
+        limit = min(max(int(self.get_argument('limit', '1000')), 1), 10_000)
+      except ValueError:
+        raise web.HTTPError(400, 'cursor and limit must be integers')
+      records, next, truncated = log.page(cursor, limit)
+      return { 'records': records, 'next': next, 'truncated': truncated }
+
+  class SummaryHandler(_FeedHandler):
+    def get(self, session: str | None = None):
+      counts = { id: record.count for id, record in self.errors.errors.items() }
+      self.write(self.feed.summary(counts))
+
+  class ActivitiesHandler(_FeedHandler):
+    def get(self, session: str | None = None):
+      self.write(self._page(self.feed.activities))
+
+  class EdgesHandler(_FeedHandler):
+    def get(self, session: str | None = None):
+      page = self._page(self.feed.edges)
+      page['records'] = [list(edge) for edge in page['records']]
+      self.write(page)
+
+  class ErrorsHandler(_FeedHandler):
+    def get(self, session: str | None = None):
+      self.write(self.errors.to_dict())
+
+  _HANDLERS = (SummaryHandler, ActivitiesHandler, EdgesHandler, ErrorsHandler)
+  return _HANDLERS
+
+def routes(prefix: str, feed: LiveFeed, errors: ErrorTable) -> list[tuple[str, type, dict[str, Any]]]:
+  """Returns the routes serving the feed under `prefix`, e.g. `/provenance`."""
+
+  return _routes('/' + prefix.strip('/'), lambda session: (feed, errors))
+
+def session_routes(prefix: str, lookup: FeedLookup) -> list[tuple[str, type, dict[str, Any]]]:
+  """Returns the routes serving the feed of each session under `prefix` and
+  the name of the session, e.g. `/provenance/Client-<id>`."""
+
+  return _routes('/' + prefix.strip('/') + '/(?P<session>[^/]+)', lookup)
+
+def _routes(prefix: str, lookup: FeedLookup) -> list[tuple[str, type, dict[str, Any]]]:
+  kwargs = { 'lookup': lookup }
+  SummaryHandler, ActivitiesHandler, EdgesHandler, ErrorsHandler = _handlers()
+  return [
+    (f'{prefix}/summary.json', SummaryHandler, kwargs),
+    (f'{prefix}/activities.json', ActivitiesHandler, kwargs),
+    (f'{prefix}/edges.json', EdgesHandler, kwargs),
+    (f'{prefix}/errors.json', ErrorsHandler, kwargs),
+  ]
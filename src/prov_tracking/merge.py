@@ -0,0 +1,289 @@
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from typing import Any, Callable, Iterable, TextIO
+from uuid import uuid4
+
+from prov_tracking.compression import EXTENSIONS, open_writer
+from prov_tracking.errors import strip_addresses
+from prov_tracking.reader import RELATIONS, ProvReader
+
+# Attributes of relations referring to activities and to entities
+_ACTIVITY_REFERENCES = (
+  'prov:activity', 'prov:informed', 'prov:informant', 'prov:starter',
+  'prov:trigger', 'prov:ender'
+)
+_ENTITY_REFERENCES = (
+  'prov:entity', 'prov:generatedEntity', 'prov:usedEntity'
+)
+
+def _digest(raw: bytes) -> bytes:
+  """Hashes the attributes of a record, regardless of their order and of the
+  addresses in the representations of its values."""
+
+  attributes = json.dumps(json.loads(raw), sort_keys=True, default=str)
+  return blake2b(strip_addresses(attributes).encode(), digest_size=16).digest()
+
+def _owned(id: str, activities: set[str]) -> bool:
+  """Tells if the entity `id` belongs to an activity, i.e. it's named after it
+  as the parameters and the fan-ins of the activity are."""
+
+  prefix = id
+  while '.' in prefix:
+    prefix = prefix.rsplit('.', 1)[0]
+    if prefix in activities:
+      return True
+  return False
+
+def _inputs(reader: ProvReader) -> Iterable[tuple[str, bytes]]:
+  """Yields the id and the undecoded JSON of each input entity of a run, i.e.
+  those neither generated by an activity nor belonging to one, e.g. the data
+  nodes of the graph, such as the chunks of a Zarr store."""
+
+  generated = set(entity for entity, _ in reader.generations())
+  activities = set(reader.activity_ids())
+  for id, raw in reader.records('entity'):
+    if id not in generated and not _owned(id, activities):
+      yield id, raw
+
+def _scan(path: str) -> tuple[str | None, dict[str, bytes]]:
+  """Returns the id of the workflow activity of a run and the digest of each of
+  its input entities."""
+
+  with ProvReader(path) as reader:
+    # The workflow activity is the only one without a group, and the first one
+    workflow = next(
+      (id for id in reader.activity_ids() if 'yprov4wfs:group' not in reader.activity(id)),
+      None
+    )
+    return workflow, { id: _digest(raw) for id, raw in _inputs(reader) }
+
+class _SectionFile:
+  """Temporary file collecting the members of a section of the document."""
+
+  def __init__(self, directory: str, name: str):
+    self.path = os.path.join(directory, name)
+    self.file = open(self.path, 'wb')
+    self.count = 0
+
+  def add(self, id: str, raw: bytes):
+    self.file.write(b',\n' if self.count > 0 else b'\n')
+    self.file.write(json.dumps(id, ensure_ascii=False).encode())
+    self.file.write(b': ')
+    self.file.write(raw)
+    self.count += 1
+
+def _write_shard(
+  runs: list[tuple[str, str]], canonical: dict[str, bytes], output: str,
+  campaign: dict[str, Any], compression: str | None, level: int | None
+) -> dict[str, int]:
+  """Writes the runs assigned to a shard into `output`. Each run is read once:
+  its records are appended to a temporary file for each section, which are then
+  concatenated, so only the index of one run is in memory at a time."""
+
+  counts = { 'activities': 0, 'entities': 0, 'shared': 0, 'conflicts': 0 }
+  prefixes: dict[str, Any] = {}
+  written: set[str] = set()
+  with tempfile.TemporaryDirectory() as directory:
+    sections = {
+      name: _SectionFile(directory, name)
+      for name in ('activity', 'entity', *RELATIONS)
+    }
+    for namespace, path in runs:
+      with ProvReader(path) as reader:
+        for name, value in reader.section('prefix').items():
+          prefixes.setdefault(name, value)
+        # Input entities with the same id and content in every run are shared,
+        # the other ones are namespaced as the activities of the run
+        shared: set[str] = set()
+        for id, raw in _inputs(reader):
+          if canonical.get(id) == _digest(raw):
+            shared.add(id)
+            if id in written:
+              counts['shared'] += 1
+            else:
+              written.add(id)
+              sections['entity'].add(id, raw)
+              counts['entities'] += 1
+          elif id in canonical:
+            counts['conflicts'] += 1
+
+        activities = sections['activity']
+        for id, raw in reader.records('activity'):
+          activities.add(namespace + id, raw)
+          counts['activities'] += 1
+        entities = sections['entity']
+        for id, raw in reader.records('entity'):
+          if id in shared:
+            continue
+          if reader.is_fan_in(id):
+            attributes = json.loads(raw)
+            attributes['yprov4wfs:fan_in_namespace'] = namespace
+            raw = json.dumps(attributes, ensure_ascii=False).encode()
+          entities.add(namespace + id, raw)
+          counts['entities'] += 1
+        for relation in RELATIONS:
+          for id, raw in reader.records(relation):
+            record = json.loads(raw)
+            for name in _ACTIVITY_REFERENCES:
+              if name in record:
+                record[name] = namespace + record[name]
+            for name in _ENTITY_REFERENCES:
+              if name in record and record[name] not in shared:
+                record[name] = namespace + record[name]
+            sections[relation].add(id, json.dumps(record, ensure_ascii=False).encode())
+    sections['activity'].add(campaign['id'], json.dumps(campaign['attributes']).encode())
+
+    f: TextIO = (
+      open_writer(output, compression, level) if compression is not None
+      else open(output, 'w', encoding='utf-8')
+    )
+    with f:
+      f.write('{\n"prefix": ')
+      f.write(json.dumps(prefixes))
+      for name, section in sections.items():
+        section.file.close()
+        f.write(f',\n"{name}": {{')
+        f.flush()
+        with open(section.path, 'rb') as source:
+          shutil.copyfileobj(source, f.buffer)
+        f.write('\n}')
+      f.write('\n}\n')
+  return counts
+
+class MergeSummary:
+  """Outcome of a merge: the files written, the namespace and the workflow id
+  of each run and the number of records written. `shared` counts the input
+  entities that were not written again, as another run of the same file had
+  them, and `conflicts` those with the same id as in another run, but with a
+  different content, which were namespaced."""
+
+  def __init__(self, outputs: list[str], runs: dict[str, str | None]):
+    self.outputs = outputs
+    self.runs = runs
+    self.counts = { 'activities': 0, 'entities': 0, 'shared': 0, 'conflicts': 0 }
+
+  def summary(self) -> str:
+    counts = self.counts
+    return (
+      f'{len(self.runs)} runs merged into {len(self.outputs)} files: '
+      f'{counts["activities"]} activities, {counts["entities"]} entities, '
+      f'{counts["shared"]} shared inputs, {counts["conflicts"]} conflicting inputs'
+    )
+
+def _namespaces(paths: list[str]) -> list[str]:
+  """Names each run after the folder of its document, e.g. `ACCESS-CM2` for
+  `ACCESS-CM2/yprov4wfs.json`, or after the file itself if it's named
+  otherwise. Names are made unique by appending the position of the run."""
+
+  names: list[str] = []
+  for i, path in enumerate(paths):
+    path = os.path.abspath(path)
+    file_name = os.path.basename(path)
+    if file_name.startswith('yprov4wfs.'):
+      name = os.path.basename(os.path.dirname(path))
+    else:
+      name = file_name.split('.')[0]
+    name = name.replace('/', '_') or f'run{i}'
+    if name in names:
+      name = f'{name}-{i}'
+    names.append(name)
+  return names
+
+def merge(
+  paths: list[str], destination: str, names: list[str] | None = None,
+  shards: int = 1, processes: int | None = None,
+  compression: str | None = None, compression_level: int | None = None
+) -> MergeSummary:
+  """Merges the provenance documents of several runs into a campaign-level
+  document, saved in `destination` as `yprov4wfs.json` or, with more than one
+  shard, as `yprov4wfs.<i>.json`. The ids of activities and of the entities
+  belonging to a run are prefixed with the namespace of the run, e.g.
+  `ACCESS-CM2/mean_chunk-<token>_0_1`, while input entities with the same id
+  and content in every run are written once, under their own id. A campaign
+  activity lists the workflow activity of each run.
+
+  Runs are read one at a time, through `ProvReader`, so memory doesn't depend on
+  the number of runs. With `shards`, runs are split among the files, balancing
+  their size, and each file is a self-contained document. With `processes`,
+  runs are scanned and shards are written in parallel."""
+
+  if names is None:
+    names = _namespaces(paths)
+  if len(names) != len(paths):
+    raise ValueError('There must be a name for each document')
+  if len(set(names)) != len(names):
+    raise ValueError('Names must be unique')
+  shards = max(1, min(shards, len(paths)))
+
+  executor = None
+  run: Callable[..., Iterable] = map
+  if processes is not None and processes > 1:
+    executor = ProcessPoolExecutor(max_workers=processes)
+    run = executor.map
+  try:
+    # The first run in which an input entity appears sets its content
+    canonical: dict[str, bytes] = {}
+    workflows: dict[str, str | None] = {}
+    for name, (workflow, digests) in zip(names, run(_scan, paths)):
+      workflows[name] = f'{name}/{workflow}' if workflow is not None else None
+      for id, digest in digests.items():
+        canonical.setdefault(id, digest)
+
+    # Largest runs first, each one to the shard with the least data so far
+    assigned: list[list[tuple[str, str]]] = [[] for _ in range(shards)]
+    sizes = [0] * shards
+    for name, path in sorted(zip(names, paths), key=lambda run: -os.path.getsize(run[1])):
+      shard = sizes.index(min(sizes))
+      assigned[shard].append((f'{name}/', path))
+      sizes[shard] += os.path.getsize(path)
+
+    os.makedirs(destination, exist_ok=True)
+    extension = EXTENSIONS.get(compression or '', '')
+    outputs = [
+      os.path.join(destination, f'yprov4wfs.json{extension}') if shards == 1
+      else os.path.join(destination, f'yprov4wfs.{i}.json{extension}')
+      for i in range(shards)
+    ]
+    campaign = {
+      'id': str(uuid4()),
+      'attributes': {
+        'prov:label': 'campaign', 'prov:type': 'prov:Activity',
+        'yprov4wfs:runs': workflows,
+      },
+    }
+    summary = MergeSummary(outputs, workflows)
+    for counts in run(
+      _write_shard, assigned, [canonical] * shards, outputs, [campaign] * shards,
+      [compression] * shards, [compression_level] * shards
+    ):
+      for name, count in counts.items():
+        summary.counts[name] += count
+    return summary
+  finally:
+    if executor is not None:
+      executor.shutdown()
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(
+    description='Merges the provenance documents of several runs'
+  )
+  parser.add_argument('destination', help='folder of the merged document')
+  parser.add_argument('documents', nargs='+')
+  parser.add_argument('--names', nargs='+', help='namespace of each run, defaults to the folder of its document')
+  parser.add_argument('--shards', type=int, default=1, help='number of files among which runs are split')
+  parser.add_argument('--processes', type=int, default=None, help='number of processes')
+  parser.add_argument('--compression', choices=tuple(EXTENSIONS), default=None)
+  parser.add_argument('--compression-level', type=int, default=None)
+  args = parser.parse_args()
+
+  result = merge(
+    args.documents, args.destination, args.names, args.shards, args.processes,
+    args.compression, args.compression_level
+  )
+  print(result.summary())
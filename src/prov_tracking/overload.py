@@ -0,0 +1,157 @@
+import datetime as dt
+from enum import IntEnum
+from time import perf_counter
+from typing import Any, Callable
+
+class Fidelity(IntEnum):
+  """Levels of detail at which tasks can be tracked, from the most to the least
+  detailed one."""
+
+  # Every task is recorded with its arguments and dependencies
+  FULL = 0
+  # Tasks are recorded as activities, but arguments and entities are not
+  NO_ARGUMENTS = 1
+  # Tasks are only counted within their task group
+  GROUPS = 2
+  # Tasks are only counted
+  COUNTERS = 3
+
+class GroupAggregate:
+  """Counters for the tasks of a group that were not recorded individually."""
+
+  __slots__ = ('tasks', 'succeeded', 'failed', 'first_seen', 'last_seen')
+
+  def __init__(self, now: dt.datetime):
+    self.tasks = 0
+    self.succeeded = 0
+    self.failed = 0
+    self.first_seen = now
+    self.last_seen = now
+
+class OverloadController:
+  """Keeps the cost of provenance tracking within a budget, expressed as the
+  fraction of the scheduler time spent by the plugin. The time spent handling
+  each event is measured and, at the end of every window, the fidelity is
+  lowered by one level if the budget has been exceeded. The cost per event of
+  each level is remembered, so that the fidelity is raised again as soon as the
+  rate of events is low enough for the more detailed level to fit the budget.
+  A burst of events, e.g. a large graph, is handled at a level chosen upfront
+  from the same costs, so that it doesn't exceed the budget before the end of
+  the window."""
+
+  def __init__(
+    self, budget: float = 0.05, window: float = 1.0,
+    clock: Callable[[], float] = perf_counter
+  ):
+    self.budget = budget
+    self.window = window
+    self.level = Fidelity.FULL
+    # Each change of level, as it's reported in the provenance document
+    self.changes: list[dict[str, Any]] = []
+    self.counters = { 'tasks': 0, 'succeeded': 0, 'failed': 0 }
+    self.groups: dict[str, GroupAggregate] = {}
+
+    self._clock = clock
+    self._window_start = clock()
+    self._window_busy = 0.0
+    self._window_events = 0
+    # Total time spent and events handled at each level
+    self._busy = [0.0] * len(Fidelity)
+    self._events = [0] * len(Fidelity)
+    # The same for the events handled in bursts, which cost more than the others
+    self._burst_busy = [0.0] * len(Fidelity)
+    self._burst_events = [0] * len(Fidelity)
+
+  @property
+  def degraded(self) -> bool:
+    """Tells if the fidelity has ever been lowered."""
+
+    return len(self.changes) > 0
+
+  def record(self, elapsed: float, events: int = 1, burst: bool = False):
+    """Records that the plugin spent `elapsed` seconds handling `events` events,
+    part of a burst if `burst`, and, if the current window is over, adjusts the
+    fidelity."""
+
+    self._window_busy += elapsed
+    self._window_events += events
+    self._busy[self.level] += elapsed
+    self._events[self.level] += events
+    if burst:
+      self._burst_busy[self.level] += elapsed
+      self._burst_events[self.level] += events
+    now = self._clock()
+    if now - self._window_start >= self.window:
+      self._adjust(now)
+
+  def _adjust(self, now: float):
+    wall = now - self._window_start
+    load = self._window_busy / wall
+    new_level = self.level
+    if load > self.budget and self.level < Fidelity.COUNTERS:
+      new_level = Fidelity(self.level + 1)
+    elif self.level > Fidelity.FULL:
+      # Estimate the load that the more detailed level would produce with the
+      # current rate of events
+      finer = Fidelity(self.level - 1)
+      if self._events[finer] > 0:
+        cost = self._busy[finer] / self._events[finer]
+        if self._window_events / wall * cost < self.budget * 0.8:
+          new_level = finer
+
+    if new_level != self.level:
+      self._change(new_level, load)
+    self._window_start = now
+    self._window_busy = 0.0
+    self._window_events = 0
+
+  def _change(self, level: Fidelity, load: float):
+    self.changes.append({
+      'time': str(dt.datetime.now()),
+      'from': self.level.name.lower(),
+      'to': level.name.lower(),
+      'load': round(load, 4),
+    })
+    self.level = level
+
+  def level_for(self, events: int) -> Fidelity:
+    """Returns the level at which a burst of `events` events is handled: the
+    current one, unless the cost per event of the bursts handled at it tells
+    that this one alone would exceed the budget of a window, in which case the
+    first coarser level that fits, as far as its cost is known, becomes the
+    current one."""
+
+    level = self.level
+    # Load that the burst would produce at the current level
+    load = 0.0
+    while level < Fidelity.COUNTERS and self._burst_events[level] > 0:
+      cost = self._burst_busy[level] / self._burst_events[level] * events
+      if level == self.level:
+        load = cost / self.window
+      if cost <= self.budget * self.window:
+        break
+      level = Fidelity(level + 1)
+    if level != self.level:
+      self._change(level, load)
+    return level
+
+  def count(self, group: str, outcome: str | None = None):
+    """Counts a task that is not recorded individually. `outcome` is `None` when
+    the task is registered, `'succeeded'` or `'failed'` when it completes."""
+
+    self.counters[outcome or 'tasks'] += 1
+    aggregate = self.groups.get(group)
+    # Groups that are already aggregated are kept up to date at any level
+    if aggregate is None and self.level >= Fidelity.COUNTERS:
+      return
+    now = dt.datetime.now()
+    if aggregate is None:
+      aggregate = GroupAggregate(now)
+      self.groups[group] = aggregate
+    aggregate.last_seen = now
+    if outcome is None:
+      aggregate.tasks += 1
+    elif outcome == 'succeeded':
+      aggregate.succeeded += 1
+    else:
+      aggregate.failed += 1
@@ -1,18 +1,90 @@
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from dask.order import order
 from dask.task_spec import DataNode, Task, TaskRef, Alias
 from dask.typing import Key
 from distributed.diagnostics.plugin import SchedulerPlugin
 from distributed.scheduler import Scheduler, TaskState, TaskStateState as SchedulerTaskState
+from prov_tracking.attempts import AttemptHistory, AttemptTracker
+from prov_tracking.cache import RegistrationCache
+from prov_tracking.data_movement import DataMovementTracker
 from prov_tracking.documenter import Documenter
-from prov_tracking.utils import make_unique_key
+from prov_tracking.errors import ErrorTable
+from prov_tracking.overload import Fidelity, OverloadController
+from prov_tracking.utils import Resolutions, make_unique_key
 from prov_tracking.task_info import RunnableTaskInfo
-from prov_tracking.jupyter_listener import listen
 
-import datetime as dt
-from typing import Any, cast
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, cast
 from traceback import format_exc
 import multiprocessing as mp
+import os
+
+if TYPE_CHECKING:
+  # Optional backends are imported by the branches enabling them, as they are
+  # off by default and some of them load heavy packages, e.g. cloudpickle
+  from prov_tracking.collector import CollectorClient
+  from prov_tracking.latency import LatencyTracker
+  from prov_tracking.live import LiveFeed
+  from prov_tracking.storage_io import StorageIOTracker
+
+# Number of tasks of a graph registered between two checks of the budget
+_BUDGET_CHECK_INTERVAL = 1024
+
+class _BudgetCheck:
+  """Records the time spent registering a graph every few tasks, so that the
+  overload controller can lower the fidelity while the graph is registered."""
+
+  __slots__ = ('overload', 'checked', 'unchecked')
+
+  def __init__(self, overload: OverloadController):
+    self.overload = overload
+    self.checked = perf_counter()
+    self.unchecked = 0
+
+  def tick(self) -> bool:
+    """Counts a task, returning `True` when the budget must be checked."""
+
+    self.unchecked += 1
+    return self.unchecked >= _BUDGET_CHECK_INTERVAL
+
+  def record(self) -> Fidelity:
+    """Records the time spent since the last check and returns the level."""
+
+    now = perf_counter()
+    self.overload.record(now - self.checked, self.unchecked, burst=True)
+    self.checked = now
+    self.unchecked = 0
+    return self.overload.level
+
+class _TrackingFrame:
+  """State of the tracking of a subgraph executed by an expandable task."""
+
+  __slots__ = ('internal_deps', 'nodes', 'pending_tasks')
+
+  def __init__(
+    self, internal_deps: dict[Key, Any],
+    nodes: Iterator[tuple[Key, Task | Alias | DataNode]]
+  ):
+    # Values of the dependencies of the subgraph, by the key used inside it
+    self.internal_deps = internal_deps
+    # Nodes yet to be tracked, None once all have been
+    self.nodes: Iterator[tuple[Key, Task | Alias | DataNode]] | None = nodes
+    # Tasks created while resolving the arguments of the nodes
+    self.pending_tasks: list[tuple[Key, Task]] = []
+
+class Session:
+  """Provenance of the graphs submitted by a single client. Each session is
+  tracked by its own plugin instance, so it has its own document, which is
+  finalized when the client disconnects."""
+
+  __slots__ = ('client', 'tracker', 'keys')
+
+  def __init__(self, client: str, tracker: 'ProvTracker'):
+    self.client = client
+    self.tracker = tracker
+    # Keys registered by the session that the scheduler hasn't forgotten yet
+    self.keys: set[Key] = set()
 
 class ProvTracker(SchedulerPlugin):
   """Provenance tracking plugin"""
@@ -30,18 +102,140 @@ class ProvTracker(SchedulerPlugin):
     provenance document the information about what cell of the notebook generated
     each activity. Defaults to `True`. Notice how this option creaed an additional
     thread that communicates with the Jupyter kernel.
+    - `reuse_cache_size: int`: maximum number of registered tasks whose
+    structure is remembered for reuse. Tasks submitted again with the same key
+    and structure, e.g. when a notebook cell is re-run, reuse the activities and
+    entities already in the document and are recorded as new executions of
+    them. Only this cache is bounded: the plugin keeps the info of every task it
+    registered, as the document keeps its activity, for the whole run. Defaults
+    to `100000`.
+    - `overload_budget: float | None`: maximum fraction of the scheduler time
+    that the plugin can spend tracking provenance, e.g. `0.05`. When the budget
+    is exceeded, the level of detail is progressively lowered: first arguments
+    are no longer recorded, then tasks are only counted within their group, and
+    finally they are only counted. Large graphs are registered at the level
+    whose cost fits the budget, which is also checked while registering them.
+    The detail is raised again when the load drops. Every change is recorded in the document. Defaults to `None`, i.e.
+    the detail is never lowered.
+    - `fan_in_threshold: int | None`: minimum number of results of other tasks
+    that an argument must collect, e.g. in tree reductions, for those coming
+    from the same task group to be recorded as a single fan-in entity, holding
+    the ranges of their chunk indices. Defaults to `64`, `None` disables it.
+    - `attempt_history_size: int | None`: number of execution attempts kept for
+    each task, i.e. times it was sent to a worker, with the worker, the start and
+    end time and the outcome of each one. Only the most recent attempts are
+    kept, and only tasks executed more than once record them. Defaults to `8`,
+    `None` or `0` disables it.
+    - `live_endpoint: str | None`: path under which the scheduler's web server
+    serves, while tracking, JSON summaries of the provenance recorded so far and
+    the activities and relations added since a cursor, e.g. `/provenance`.
+    Defaults to `None`, i.e. disabled.
+    - `live_log_size: int`: number of the most recent activities and relations
+    kept for `live_endpoint`. Pages requested from an older cursor start from
+    the oldest record kept and are flagged as `truncated`. Defaults to
+    `100_000`.
+    - `prune_unreachable: bool`: tells if activities that didn't contribute to
+    any output, i.e. a result gathered or persisted by a client or a task
+    annotated with `retain_provenance=True`, should be left out of the document.
+    They are pruned while tracking, once the scheduler forgets their task, and
+    when the document is serialized. Defaults to `False`.
+    - `per_client_sessions: bool`: tells if the graphs submitted by each client
+    should be tracked separately, each in its own document saved in a sub-folder
+    of `destination` named after the client, e.g. `output/Client-<id>`. The
+    document of a client is saved, and its state released, as soon as the
+    client disconnects. All other options apply to each session. Defaults to
+    `False`.
+    - `collector: str | None`: path of the Unix domain socket of a collector
+    process, started with `python -m prov_tracking.collector <path>`. The
+    scheduler then only forwards the events it receives, in batches and without
+    blocking, and the collector tracks them, with all other options, and saves
+    the document. Events are kept until the collector has stored them, in memory
+    up to `collector_buffer_size` bytes and then in a temporary file, so the
+    collector can be restarted while tracking. Live endpoints and Jupyter
+    tracking are handled by the scheduler. Defaults to `None`, i.e. provenance
+    is tracked by the scheduler.
+    - `collector_buffer_size: int`: see `collector`. Defaults to 64 MiB.
+    - `io_accounting: bool`: tells if the tasks reading blocks of source arrays,
+    e.g. those of `open_dataset` groups, should record the source file or
+    store, the selection, the bytes selected, the chunks of the storage
+    touched and the time spent reading, measured on the workers. Totals for each
+    source, including chunks read more than once and reads not aligned with the
+    chunks, are added to the workflow. Defaults to `False`.
+    - `queueing_latency: bool`: tells if the plugin should record, for each
+    activity, the time its task waited, ready to run, before being dispatched to
+    a worker, and the time between the dispatch and the start of its execution
+    on the worker. Both are also added to histograms for each task group and
+    worker, stored in the workflow. Defaults to `False`, as timestamping each
+    state adds to the cost of every transition.
+    - `rdf_format: str | None`: if `nt` or `ttl`, the document is also streamed
+    as N-Triples or Turtle while tracking. Defaults to `None`.
+    - `rdf_compress: bool`: tells if the RDF stream should be compressed, with
+    `compression` or, if that is not set, with gzip. Defaults to `False`.
+    - `compression: str | None`: if `gzip` or `zstd`, the document is written
+    compressed, in independent frames. Defaults to `None`.
+    - `compression_level: int | None`: level of the codec. Defaults to the
+    default level of the codec.
     You can also provide all kwargs accepted by `prov.model.ProvDocument.serialize`.
     """
 
     name = kwargs.pop('name', __name__)
+    self.sessions: dict[str, Session] | None = None
+    self.forwarder: CollectorClient | None = None
+    self.collector: str | None = kwargs.pop('collector', None)
+    if self.collector is not None:
+      # This instance only forwards the events to the collector process, which
+      # is created on the scheduler, as the plugin is copied to it
+      self.name = name
+      self.track_jupyter = kwargs.pop('jupyter_tracking', True)
+      self.live_endpoint = None
+      if kwargs.pop('live_endpoint', None) is not None:
+        print("""Warning: live endpoints are not served when tracking with a
+        collector, the option will be ignored.""")
+      self.collector_buffer_size: int = kwargs.pop('collector_buffer_size', 64 << 20)
+      # The reads are timed on the workers, while the collector accounts them
+      self.time_reads: bool = kwargs.get('io_accounting', False)
+      self.collector_options = { 'name': name, **kwargs }
+      self.closed = False
+      self.last_cell_id = None
+      return
+    if kwargs.pop('per_client_sessions', False):
+      # This instance only dispatches the events to those tracking each client
+      self.name = name
+      self.track_jupyter = kwargs.pop('jupyter_tracking', True)
+      self.live_endpoint = kwargs.pop('live_endpoint', None)
+      self.time_reads = kwargs.get('io_accounting', False)
+      self.session_options = kwargs
+      self.sessions = {}
+      # Sessions that registered each key. A key is shared by the sessions of
+      # all clients that submitted it
+      self.key_sessions: dict[Key, list[Session]] = {}
+      self.closed = False
+      self.last_cell_id = None
+      return
     self.keep_traceback: bool = kwargs.pop('keep_traceback', False)
     self.track_jupyter: bool = kwargs.pop('jupyter_tracking', True)
+    reuse_cache_size: int = kwargs.pop('reuse_cache_size', 100_000)
+    overload_budget: float | None = kwargs.pop('overload_budget', None)
+    self.fan_in_threshold: int | None = kwargs.pop('fan_in_threshold', 64)
+    attempt_history_size: int | None = kwargs.pop('attempt_history_size', 8)
+    self.live_endpoint: str | None = kwargs.pop('live_endpoint', None)
+    self.live_log_size: int = kwargs.pop('live_log_size', 100_000)
+    prune_unreachable: bool = kwargs.pop('prune_unreachable', False)
+    io_accounting: bool = kwargs.pop('io_accounting', False)
+    self.time_reads = io_accounting
+    queueing_latency: bool = kwargs.pop('queueing_latency', False)
     self.documenter = Documenter(name, **kwargs)
+    if self.live_endpoint is not None:
+      from prov_tracking.live import LiveFeed
+      self.documenter.feed = LiveFeed(self.live_log_size)
+    if prune_unreachable:
+      from prov_tracking.prune import ReachabilityPruner
+      self.documenter.pruner = ReachabilityPruner()
 
     self.closed = False
     # Used to avoid registering multiple times the same task. A task can be put
-    # multiple times in waiting state
-    self.registered_tasks: set[Key] = set()
+    # multiple times in waiting state or be submitted again by a later graph
+    self.registration_cache = RegistrationCache(reuse_cache_size)
     # Info about all tasks encountered
     self.all_tasks: dict[Key, Task | DataNode] = {}
     self.all_runnables: dict[Key, RunnableTaskInfo] = {}
@@ -55,10 +249,60 @@ class ProvTracker(SchedulerPlugin):
     # When Jupyter tracking is enabled, keeps the id of the last executed cell
     # in the notebook
     self.last_cell_id = None
+    # Dependencies transferred between workers, spilling, pauses and stealing
+    self.data_movement = DataMovementTracker()
+    self.overload: OverloadController | None = None
+    if overload_budget is not None:
+      self.overload = OverloadController(overload_budget)
+    # Retries, recomputations and work stealing of each task
+    self.attempts: AttemptTracker | None = None
+    if attempt_history_size is not None and attempt_history_size > 0:
+      self.attempts = AttemptTracker(attempt_history_size, self.documenter.clock)
+    # When pruning, the sub-tasks of each task the scheduler hasn't forgotten yet
+    self.pruning = prune_unreachable
+    self.live_sub_keys: dict[Key, list[Key]] = {}
+    # Reads of source arrays, e.g. Zarr stores and NetCDF files
+    self.storage_io: StorageIOTracker | None = None
+    if io_accounting:
+      from prov_tracking.storage_io import StorageIOTracker
+      self.storage_io = StorageIOTracker()
+    # Time spent ready to run and dispatched before starting
+    self.latency: LatencyTracker | None = None
+    if queueing_latency:
+      from prov_tracking.latency import LatencyTracker
+      self.latency = LatencyTracker(self.documenter.clock)
 
   def start(self, scheduler: Scheduler):
     self._scheduler = scheduler
+    if self.collector is not None:
+      # Imported here, as it loads cloudpickle and the replay machinery
+      from prov_tracking.collector import CollectorClient
+      self.forwarder = CollectorClient(
+        self.collector, self.collector_options, self.collector_buffer_size
+      )
+      self.forwarder.start(scheduler)
+    if self.time_reads and hasattr(scheduler, 'register_worker_plugin'):
+      self._register_read_timer(scheduler)
+    if self.live_endpoint is not None and hasattr(scheduler, 'http_application'):
+      from prov_tracking.live import routes, session_routes
+      if self.sessions is None:
+        handlers = routes(
+          self.live_endpoint, cast('LiveFeed', self.documenter.feed),
+          self.documenter.errors
+        )
+      else:
+        handlers = session_routes(self.live_endpoint, self._session_feed)
+      scheduler.http_application.add_handlers(r'.*', handlers)
     if self.track_jupyter:
+      try:
+        # Imported here, as it loads ipykernel, jupyter_client and zmq
+        from prov_tracking.jupyter_listener import listen
+      except ImportError:
+        self.track_jupyter = False
+        print(f"""Warning: Jupyter tracking is enabled, but its dependencies could
+        not be imported. The tracking will proceed as if jupyter_tracking was set
+        to False:\n{format_exc()}""")
+        return
       plugin_end, listener_end = mp.Pipe(duplex=True)
       self.connection = plugin_end
       self.thread_pool = ThreadPoolExecutor(max_workers=1)
@@ -73,67 +317,140 @@ class ProvTracker(SchedulerPlugin):
         be started for some reason. The tracking will proceed as if
         jupyter_tracking was set to False.""")
 
+  def _register_read_timer(self, scheduler: Scheduler):
+    """Registers on the workers, current and future, the plugin timing the
+    reads of source arrays, see `storage_io.ReadTimer`."""
+
+    try:
+      asyncio.get_running_loop()
+    except RuntimeError:
+      # Without an event loop there are no workers to register it on
+      return
+    from distributed.protocol.pickle import dumps
+    from prov_tracking.storage_io import ReadTimer
+    self._read_timer = asyncio.ensure_future(scheduler.register_worker_plugin(
+      None, dumps(ReadTimer()), name=ReadTimer.name, idempotent=True
+    ))
+
+  def update_graph(
+    self, scheduler: Scheduler, *, client: str, keys: set[Key],
+    tasks: list[Key], annotations: dict[str, dict[Key, Any]],
+    priority: dict[Key, tuple[int | float, ...]], stimulus_id: str, **kwargs
+  ):
+    """Registers all the tasks of a newly submitted graph in a single pass. This
+    is called by the scheduler before any of those tasks is transitioned, so
+    `transition` only has to deal with states and timings."""
+
+    if self.forwarder is not None:
+      last_cell_id = self.last_cell_id
+      if self._poll_jupyter_cell() != last_cell_id:
+        self.forwarder.cell(self.last_cell_id)
+      self.forwarder.update_graph(
+        scheduler, client=client, keys=keys, tasks=tasks,
+        annotations=annotations, priority=priority, stimulus_id=stimulus_id,
+        **kwargs
+      )
+      return
+    if self.sessions is not None:
+      session = self._session(client)
+      session.tracker.last_cell_id = self._poll_jupyter_cell()
+      session.tracker.update_graph(
+        scheduler, client=client, keys=keys, tasks=tasks,
+        annotations=annotations, priority=priority, stimulus_id=stimulus_id,
+        **kwargs
+      )
+      self._add_session_keys(session, tasks)
+      return
+
+    try:
+      # Follow the scheduler priorities, so that activities appear in the
+      # document in the same order in which they are meant to be executed
+      keys_by_priority = sorted(tasks, key=lambda key: priority.get(key, ()))
+      self._register_graph(keys_by_priority, self._poll_jupyter_cell(), budgeted=True)
+      if self.pruning:
+        # Results already in memory are not transitioned again when requested
+        for key in keys:
+          task = scheduler.tasks.get(key)
+          if task is not None and task.state == 'memory':
+            self._register_output(key)
+    except Exception:
+      print(f'Graph {stimulus_id} generated an exception:\n{format_exc()}')
+
   def transition(
     self, key: Key, start: SchedulerTaskState, finish: SchedulerTaskState,
     *args, **kwargs
+  ):
+    # Intervals in which the worker computed the task, when it finishes
+    startstops = kwargs.get('startstops')
+    if self.forwarder is not None:
+      self.forwarder.transition(key, start, finish, *args, **kwargs)
+    elif self.sessions is not None:
+      self._dispatch_transition(key, start, finish, startstops)
+    elif self.overload is None:
+      self._transition(key, start, finish, startstops)
+    else:
+      started = perf_counter()
+      self._transition(key, start, finish, startstops)
+      self.overload.record(perf_counter() - started)
+
+  def _transition(
+    self, key: Key, start: SchedulerTaskState, finish: SchedulerTaskState,
+    startstops: list[dict[str, Any]] | None = None
   ):
     try:
       task = self._scheduler.tasks[key]
 
-      # Here tasks are seen in reverse dependency order, i.e. tasks with no
-      # dependencies are seen before tasks which depend on them
-      if start == 'waiting' and key not in self.registered_tasks:
+      # Tasks are normally registered in bulk by update_graph. Those that, for
+      # some reason, didn't pass through it are registered here one by one, as
+      # are those recomputed after their result has been lost
+      if start == 'waiting' and key not in self.macro_tasks:
         if finish == 'released' and not ProvTracker._has_erred_dep(task):
           # Ignore this task as one of its dependent tasks has failed and
           # hence this will no longer be executed
           return
+        self._register_graph([key], self._poll_jupyter_cell())
 
-        self.registered_tasks.add(key)
-        if isinstance(task.run_spec, DataNode):
-          self.all_tasks[key] = task.run_spec
-          self.documenter.register_data(task.run_spec)
-        elif isinstance(task.run_spec, Task):
-          # Retrieve Jupyter-related info
-          cell_id: int | None = self.last_cell_id
-          if self.track_jupyter and self.connection.poll():
-            cell_id = self.connection.recv()
-            while self.connection.poll():
-              cell_id = self.connection.recv()
-            self.last_cell_id = cell_id
-          infos = self._record_task(key, task.group_key, task.run_spec)
-          self.macro_tasks[key] = []
-          for sub_key, info in infos.items():
-            self.macro_tasks[key].append(sub_key)
-            info.jupyter_cell = cell_id
-            self.all_runnables[sub_key] = info
-            self.documenter.register_task(info)
-        else:
-          target = cast(Alias, task.run_spec).target
-          self.all_tasks[key] = self.all_tasks[target]
-
-      elif start == 'processing' and key in self.macro_tasks:
-        now = dt.datetime.now()
-        specs = cast(Task, task.run_spec)
-        infos = self._track_task(key, task.group_key, specs)
-        for sub_key, info in infos.items():
-          self.macro_tasks[key].append(sub_key)
-          self.all_runnables[sub_key] = info
-          self.documenter.register_task(info)
-        for sub_key in self.macro_tasks[key]:
-          info = self.all_runnables[sub_key]
-          info.start_time = now
-          self.documenter.register_task_dependencies(info)
+      if self.latency is not None:
+        self._track_latency(key, task, start, finish, startstops)
+
+      if finish == 'processing' and key in self.macro_tasks:
+        self.data_movement.task_dispatched(task)
+        if self.attempts is not None and task.processing_on is not None:
+          self.attempts.started(
+            key, task.processing_on.address, self.documenter.clock.now()
+          )
+
+      if start == 'processing' and key in self.macro_tasks:
+        now = self.documenter.clock.now()
+        for info in self._macro_infos(key):
+          self.documenter.times.start(info.slot, now)
+          info.executions += 1
+        movement = self.data_movement.task_finished(key, self._scheduler.workers)
+        if movement is not None:
+          # Movements concern the whole macro task, so they are attributed to
+          # the sub-task that produces its output
+          info = self.all_runnables[self.macro_tasks[key][-1]]
+          self.documenter.register_task_movement(info, movement.attributes())
+        if finish == 'memory' and self.storage_io is not None:
+          for sub_key, attributes in self.storage_io.finished(key):
+            self.documenter.register_task_io(self.all_runnables[sub_key], attributes)
+        if finish in ('memory', 'erred'):
+          self._report_completion(key, task, finish, now)
+        if self.attempts is not None:
+          history = self.attempts.finished(key, finish, now)
+          if history is not None:
+            self._register_attempts(key, history)
 
       elif start == 'memory' and key in self.macro_tasks:
-        now = dt.datetime.now()
+        now = self.documenter.clock.now()
         for sub_key in self.macro_tasks[key][:-1]:
           info = self.all_runnables[sub_key]
-          info.finish_time = now
+          self.documenter.times.end(info.slot, now)
           self.documenter.register_task_success(info, None, None)
         dtype = task.type
         nbytes = task.nbytes
         info = self.all_runnables[self.macro_tasks[key][-1]]
-        info.finish_time = now
+        self.documenter.times.end(info.slot, now)
         self.documenter.register_task_success(info, dtype, nbytes)
         self.macro_tasks.pop(key) # Avoid registering two times the same activity
 
@@ -141,14 +458,17 @@ class ProvTracker(SchedulerPlugin):
         # It's impossible to detect what task has failed, so if this macro task
         # has many sub-tasks, all are represented as erroneous in the provenance
         # document
-        now = dt.datetime.now()
+        now = self.documenter.clock.now()
+        if finish == 'erred':
+          # Tasks failing without being processed, e.g. blamed on a dependency
+          self._report_completion(key, task, finish, now)
         for sub_key in self.macro_tasks[key][:-1]:
           info = self.all_runnables[sub_key]
-          info.finish_time = now
+          self.documenter.times.end(info.slot, now)
           self.documenter.register_task_failure(info, None, None, None)
         # The task is finished with an error, so register the exception
         info = self.all_runnables[self.macro_tasks[key][-1]]
-        info.finish_time = now
+        self.documenter.times.end(info.slot, now)
         text = task.exception_text or ''
         blamed_task = task.exception_blame
         traceback = None
@@ -162,9 +482,35 @@ class ProvTracker(SchedulerPlugin):
         if self.closed:
           self.documenter.serialize()
 
+      elif (
+        self.overload is not None and self.overload.degraded and
+        start == 'processing' and key not in self.macro_tasks and
+        isinstance(task.run_spec, Task)
+      ):
+        # The task was registered while tracking with low fidelity
+        if finish == 'memory':
+          self.overload.count(task.group_key, 'succeeded')
+        elif finish == 'erred':
+          self.overload.count(task.group_key, 'failed')
+
+      if finish == 'forgotten':
+        if self.storage_io is not None:
+          self.storage_io.forget(key)
+        if self.attempts is not None:
+          self.attempts.forget(key)
+
+      if self.pruning:
+        if finish in ('memory', 'erred') and ProvTracker._is_output(task):
+          self._register_output(key)
+        elif finish == 'forgotten' and key in self.live_sub_keys:
+          self.documenter.register_forgotten(
+            self.all_runnables[sub_key] for sub_key in self.live_sub_keys.pop(key)
+          )
+
       # Every time a task being processed passed through the scheduler, register
       # the worker who is executing it. Multiple workers might execute the same
-      # task at different times, the last one is the one that matters
+      # task at different times: the last one is recorded here, while all of
+      # them are kept in the attempt history
       if task.processing_on is not None and key in self.macro_tasks:
         processing_on = f'{task.processing_on.address}/{task.processing_on.name}'
         for sub_key in self.macro_tasks[key]:
@@ -174,19 +520,427 @@ class ProvTracker(SchedulerPlugin):
     except Exception:
       print(f'Task {key} generated an exception:\n{format_exc()}')
 
+  def log_event(self, topic: str, msg: Any):
+    if self.forwarder is not None:
+      self.forwarder.log_event(topic, msg)
+      return
+    if self.sessions is not None:
+      # Stealing events concern a single task, while the others, i.e. changes
+      # of status of the workers and read times, are handled by every session,
+      # which ignores the tasks it didn't register
+      sessions: Iterable[Session] = list(self.sessions.values())
+      if topic == 'stealing' and isinstance(msg, tuple) and len(msg) >= 2:
+        sessions = self.key_sessions.get(msg[1], ())
+      for session in sessions:
+        session.tracker.log_event(topic, msg)
+      return
+    try:
+      self.data_movement.handle_event(topic, msg, self._scheduler.tasks)
+      if self.attempts is not None:
+        stolen = self.attempts.handle_event(
+          topic, msg, self.documenter.clock.now()
+        )
+        if stolen is not None:
+          self._register_attempts(*stolen)
+      if self.storage_io is not None:
+        self.storage_io.handle_event(topic, msg)
+    except Exception:
+      print(f'Event {topic} generated an exception:\n{format_exc()}')
+
   async def close(self):
     self.closed = True
-    if not self.connection.closed:
+    if self.track_jupyter and not self.connection.closed:
       self.thread_pool.shutdown(wait=False)
       self.connection.send(True)
       self.connection.close()
       self.jupyter_listener = None
 
+    if self.forwarder is not None:
+      await self.forwarder.close()
+      return
+    if self.sessions is not None:
+      for client in list(self.sessions):
+        self._end_session(client)
+      return
+    self._finalize()
+
+  def remove_client(self, scheduler: Scheduler, client: str):
+    """With per-client sessions, saves the document of the client and releases
+    its state. The scheduler has already released the keys it wanted."""
+
+    if self.forwarder is not None:
+      self.forwarder.remove_client(scheduler, client)
+    elif self.sessions is not None:
+      try:
+        self._end_session(client)
+      except Exception:
+        print(f'Client {client} generated an exception:\n{format_exc()}')
+
+  def _finalize(self):
+    """Adds the run aggregates to the document and serializes it."""
+
     try:
+      self.documenter.run_attributes['data_movement'] = self.data_movement.summary()
+      if self.latency is not None:
+        self.documenter.run_attributes['latency'] = self.latency.summary()
+      if self.storage_io is not None:
+        storage_io = self.storage_io.summary()
+        if len(storage_io) > 0:
+          self.documenter.run_attributes['storage_io'] = storage_io
+      if self.attempts is not None:
+        self.documenter.run_attributes['attempts'] = self.attempts.summary()
+      if self.overload is not None and self.overload.degraded:
+        self.documenter.register_overload(self.overload)
       self.documenter.serialize()
     except Exception as e:
       print(f'Close: {e}')
 
+  def _session(self, client: str) -> Session:
+    """Returns the session of `client`, creating it on its first graph."""
+
+    sessions = cast(dict[str, Session], self.sessions)
+    session = sessions.get(client)
+    if session is None:
+      options = dict(self.session_options)
+      destination = options.pop('destination', './output')
+      tracker = ProvTracker(
+        name=f'{self.name}-{client}', jupyter_tracking=False,
+        destination=os.path.join(destination or '.', client), **options
+      )
+      if self.live_endpoint is not None:
+        from prov_tracking.live import LiveFeed
+        tracker.documenter.feed = LiveFeed(tracker.live_log_size)
+      tracker._scheduler = self._scheduler
+      session = Session(client, tracker)
+      sessions[client] = session
+    return session
+
+  def _add_session_keys(self, session: Session, keys: Iterable[Key]):
+    for key in keys:
+      if key not in session.keys:
+        session.keys.add(key)
+        self.key_sessions.setdefault(key, []).append(session)
+
+  def _dispatch_transition(
+    self, key: Key, start: SchedulerTaskState, finish: SchedulerTaskState,
+    startstops: list[dict[str, Any]] | None
+  ):
+    """Hands the transition to the sessions that registered the key. Keys
+    that didn't pass through `update_graph` go to the sessions of the clients
+    that want them."""
+
+    try:
+      sessions = self.key_sessions.get(key)
+      if sessions is None:
+        task = self._scheduler.tasks.get(key)
+        if start != 'waiting' or task is None or not task.who_wants:
+          return
+        clients = cast(dict[str, Session], self.sessions)
+        for client in task.who_wants:
+          session = clients.get(client.client_key)
+          if session is not None:
+            self._add_session_keys(session, (key,))
+        sessions = self.key_sessions.get(key, [])
+      # Each session handles its own exceptions
+      for session in sessions:
+        session.tracker.transition(key, start, finish, startstops=startstops)
+      if finish == 'forgotten':
+        for session in self.key_sessions.pop(key, ()):
+          session.keys.discard(key)
+    except Exception:
+      print(f'Task {key} generated an exception:\n{format_exc()}')
+
+  def _end_session(self, client: str):
+    """Saves the document of a session and forgets it."""
+
+    session = cast(dict[str, Session], self.sessions).pop(client, None)
+    if session is None:
+      return
+    for key in session.keys:
+      sessions = self.key_sessions[key]
+      sessions.remove(session)
+      if len(sessions) == 0:
+        del self.key_sessions[key]
+    session.keys.clear()
+    session.tracker.closed = True
+    session.tracker._finalize()
+
+  def _report_completion(self, key: Key, task: TaskState, finish: str, now: int):
+    """Reports to the live feed that the sub-tasks of a macro task succeeded or
+    failed, when the task enters `memory` or `erred`. Activities are finalized
+    only when the result is released, which may never happen while a client
+    holds it."""
+
+    if self.documenter.feed is None:
+      return
+    output = self.all_runnables[self.macro_tasks[key][-1]]
+    for info in self._macro_infos(key):
+      if finish == 'memory':
+        self.documenter.register_task_completion(info, 'succeeded', now)
+      elif info is not output:
+        self.documenter.register_task_completion(info, 'failed', now)
+      else:
+        traceback = task.traceback_text if self.keep_traceback else None
+        self.documenter.register_task_completion(
+          info, 'failed', now, task.exception_text or '', traceback
+        )
+
+  def _session_feed(self, client: str | None) -> tuple['LiveFeed', ErrorTable] | None:
+    session = cast(dict[str, Session], self.sessions).get(cast(str, client))
+    if session is None:
+      return None
+    documenter = session.tracker.documenter
+    return cast('LiveFeed', documenter.feed), documenter.errors
+
+  @staticmethod
+  def _is_output(task: TaskState) -> bool:
+    """Tells if the result of the task is wanted by a client, i.e. it is
+    gathered or persisted, or the task has been marked as an output."""
+
+    return bool(task.who_wants) or bool(task.annotations.get('retain_provenance'))
+
+  def _register_output(self, key: Key):
+    """Retains the sub-tasks of a task producing an output and all those
+    upstream of them. Tasks not represented by activities, e.g. aliases such as
+    those finalizing a collection, pass the output on to their dependencies."""
+
+    scheduler_tasks = self._scheduler.tasks
+    stack = [key]
+    visited = set(stack)
+    while len(stack) > 0:
+      key = stack.pop()
+      sub_keys = self.live_sub_keys.get(key)
+      if sub_keys is not None and len(sub_keys) > 0:
+        # Synthesized sub-tasks come after the one producing the output, and
+        # all of them contribute to it
+        self.documenter.register_output(
+          self.all_runnables[sub_key] for sub_key in sub_keys
+        )
+        continue
+      task = scheduler_tasks.get(key)
+      if task is None:
+        continue
+      for dep in task.dependencies:
+        if dep.key not in visited:
+          visited.add(dep.key)
+          stack.append(dep.key)
+
+  def _track_latency(
+    self, key: Key, task: TaskState, start: SchedulerTaskState,
+    finish: SchedulerTaskState, startstops: list[dict[str, Any]] | None
+  ):
+    """Timestamps the states of the task before its execution. Once it leaves
+    `processing`, its latencies are recorded for all its sub-tasks."""
+
+    latency = cast('LatencyTracker', self.latency)
+    if start == 'waiting' and finish in ('processing', 'queued', 'no-worker'):
+      latency.ready(key, self.documenter.clock.now())
+    if finish == 'processing' and task.processing_on is not None:
+      latency.dispatched(
+        key, str(task.group_key), task.processing_on.address,
+        self.documenter.clock.now()
+      )
+    elif start == 'processing':
+      latencies = latency.finished(key, str(task.group_key), startstops)
+      if latencies is not None and key in self.macro_tasks:
+        for info in self._macro_infos(key):
+          self.documenter.times.latencies(info.slot, *latencies)
+    elif finish == 'forgotten':
+      latency.forget(key)
+
+  def _register_attempts(self, key: Key, history: AttemptHistory):
+    """Registers the attempts of a macro task executed more than once. As for
+    data movements, they are attributed to the sub-task producing its output."""
+
+    if history.count > 1 and key in self.macro_tasks:
+      info = self.all_runnables[self.macro_tasks[key][-1]]
+      attempts = cast(AttemptTracker, self.attempts)
+      self.documenter.register_task_attempts(
+        info, attempts.to_list(history), history.count
+      )
+
+  def _poll_jupyter_cell(self) -> int | None:
+    """Returns the id of the last executed notebook cell. If Jupyter tracking is
+    disabled, returns `None`."""
+
+    if self.track_jupyter and self.connection.poll():
+      cell_id = self.connection.recv()
+      while self.connection.poll():
+        cell_id = self.connection.recv()
+      self.last_cell_id = cell_id
+    return self.last_cell_id
+
+  def _register_graph(
+    self, keys: list[Key], cell_id: int | None, budgeted: bool = False
+  ):
+    """Registers the given tasks in the plugin and in the provenance document.
+    DataNodes, Tasks and Aliases are resolved together and the corresponding
+    entities and activities are handed to the documenter in bulk. If
+    `budgeted`, the time spent is recorded by the overload controller, which
+    chooses the fidelity of the graph from its size and lowers it while the
+    graph is being registered, if it exceeds the budget."""
+
+    scheduler_tasks = self._scheduler.tasks
+    cache = self.registration_cache
+    level = Fidelity.FULL
+    budget: _BudgetCheck | None = None
+    if self.overload is not None:
+      level = self.overload.level
+      if budgeted:
+        level = self.overload.level_for(len(keys))
+        budget = _BudgetCheck(self.overload)
+    datanodes: list[DataNode] = []
+    infos: list[RunnableTaskInfo] = []
+    # The level can be lowered while the graph is being registered
+    reduced: list[RunnableTaskInfo] = []
+    aliases: list[tuple[Key, Alias]] = []
+    runnables: list[tuple[Key, Key, Task]] = []
+    for key in keys:
+      if budget is not None and budget.tick():
+        # Records are handed over as they are created, so that their cost is
+        # part of the check
+        self.documenter.register_data_nodes(datanodes)
+        self.documenter.register_tasks(infos)
+        datanodes.clear()
+        infos.clear()
+        level = budget.record()
+      task = scheduler_tasks.get(key)
+      if task is None or task.run_spec is None:
+        continue
+
+      specs = task.run_spec
+      entry = cache.lookup(key, specs)
+      if (
+        entry is not None and self.pruning and
+        not self.documenter.has_activities(entry.sub_keys)
+      ):
+        # Its activities have been pruned, so the task is registered again
+        cache.discard(key)
+        entry = None
+      if (
+        entry is not None and entry.counted and level < Fidelity.GROUPS and
+        task.state in ('released', 'waiting')
+      ):
+        # It was only counted, and it's about to be executed again with more
+        # detail. Tasks already being executed stay counted
+        cache.discard(key)
+        entry = None
+      if entry is not None:
+        # Already registered: a new execution is linked to the existing records
+        # without expanding the task again. Persisted results that are only
+        # referenced by the new graph are not executed again.
+        if (
+          len(entry.sub_keys) > 0 and key not in self.macro_tasks and
+          task.state not in ('memory', 'erred')
+        ):
+          self.macro_tasks[key] = list(entry.sub_keys)
+        if self.pruning:
+          self.live_sub_keys[key] = entry.sub_keys
+        continue
+
+      if level >= Fidelity.GROUPS:
+        # Only keep what is needed to resolve references from tasks registered
+        # after the fidelity is raised again
+        self.all_tasks[key] = specs
+        cache.add(key, specs, [], counted=True)
+        if isinstance(specs, Task):
+          cast(OverloadController, self.overload).count(task.group_key)
+      elif isinstance(specs, DataNode):
+        self.all_tasks[key] = specs
+        datanodes.append(specs)
+        cache.add(key, specs, [])
+      elif isinstance(specs, Task):
+        sub_infos = self._record_task(key, task.group_key, specs)
+        for sub_key, info in sub_infos.items():
+          # Tasks evicted from the cache are expanded again, but keep counting
+          # the executions of their activities
+          previous = self.all_runnables.get(sub_key)
+          if previous is not None:
+            info.executions = previous.executions
+        self.macro_tasks[key] = list(sub_infos)
+        cache.add(key, specs, self.macro_tasks[key])
+        if self.pruning:
+          # Shared with macro_tasks, as synthesized sub-tasks are added later
+          self.live_sub_keys[key] = self.macro_tasks[key]
+        for info in sub_infos.values():
+          info.jupyter_cell = cell_id
+        self.all_runnables.update(sub_infos)
+        infos.extend(sub_infos.values())
+        if level == Fidelity.FULL:
+          runnables.append((key, task.group_key, specs))
+        else:
+          reduced.extend(sub_infos.values())
+      else:
+        aliases.append((key, cast(Alias, specs)))
+        cache.add(key, specs, [])
+
+    self._resolve_aliases(aliases)
+    self.documenter.register_data_nodes(datanodes)
+    self.documenter.register_tasks(infos)
+
+    # Dependencies can be tracked only once every task of the graph is known
+    for key, group_key, specs in runnables:
+      if budget is not None and budget.tick():
+        level = budget.record()
+      if level > Fidelity.FULL:
+        reduced.extend(self._macro_infos(key))
+        continue
+      try:
+        self._track_dependencies(key, group_key, specs)
+      except Exception:
+        print(f'Task {key} generated an exception:\n{format_exc()}')
+    for info in reduced:
+      self.documenter.register_task_fidelity(info, Fidelity.NO_ARGUMENTS)
+    if budget is not None:
+      budget.record()
+
+  def _track_dependencies(self, key: Key, group_key: Key, specs: Task):
+    """Tracks the dependencies of a registered task and records them in the
+    provenance document, together with any task synthesized along the way."""
+
+    new_infos = self._track_task(key, group_key, specs)
+    if len(new_infos) > 0:
+      self.macro_tasks[key].extend(new_infos)
+      self.all_runnables.update(new_infos)
+      self.documenter.register_tasks(new_infos.values())
+    for sub_key in self.macro_tasks[key]:
+      info = self.all_runnables[sub_key]
+      if self.fan_in_threshold is not None:
+        info.compact_fan_ins(self.fan_in_threshold)
+      self.documenter.register_task_dependencies(info)
+      if self.storage_io is not None:
+        self.storage_io.register(key, info)
+
+  def _macro_infos(self, key: Key) -> list[RunnableTaskInfo]:
+    """Returns the infos of all the sub-tasks of a macro task. Aliases share the
+    info of their target, so each info is returned only once."""
+
+    infos: dict[int, RunnableTaskInfo] = {}
+    for sub_key in self.macro_tasks[key]:
+      info = self.all_runnables[sub_key]
+      infos[id(info)] = info
+    return list(infos.values())
+
+  def _resolve_aliases(self, aliases: list[tuple[Key, Alias]]):
+    """Makes each alias point to the same task as its target. Aliases can target
+    other aliases, so they are resolved until no more progress can be made."""
+
+    pending = aliases
+    while len(pending) > 0:
+      unresolved: list[tuple[Key, Alias]] = []
+      for key, alias in pending:
+        if alias.target in self.all_tasks:
+          self.all_tasks[key] = self.all_tasks[alias.target]
+        else:
+          unresolved.append((key, alias))
+      if len(unresolved) == len(pending):
+        for key, alias in unresolved:
+          # Let a later transition try again, the target might show up later
+          self.registration_cache.discard(key)
+          print(f'Non existent alias target {key} -> {alias.target}')
+        break
+      pending = unresolved
+
   def _record_task(self, key: Key, group_key: str, specs: Task) -> dict[Key, RunnableTaskInfo]:
     """Records the existance of this task and all its subtasks, if any, in both
     the provenance document and the plugin itself. Returns a dictionary in which
@@ -213,46 +967,59 @@ class ProvTracker(SchedulerPlugin):
   ) -> dict[Key, RunnableTaskInfo]:
     """If the task can be expanded, i.e. this task embedes other subtasks that
     must be recorded, find all such tasks and returns their infos paired with
-    their unique key."""
+    their unique key. Nested subgraphs are expanded with an explicit stack, in
+    the same order in which they appear, so any depth of nesting is fine."""
 
     infos: dict[Key, RunnableTaskInfo] = {}
-    inner_dsk = cast(dict[Key, Task | Alias | DataNode], specs.args[0])
-    outkey: Key = specs.args[1]
-    refkey = unique_keys[key] # Key used as reference to make subkeys unique
-    
-    priorities = order(inner_dsk)
-    for key, node in sorted(inner_dsk.items(), key=lambda it: priorities[it[0]]):
-      if isinstance(node, DataNode):
-        self.documenter.register_data(node)
-        self.all_tasks[node.key] = node
-      elif isinstance(node, Alias):
-        unique_key = make_unique_key(refkey, key)
-        unique_keys[key] = unique_key
-        unique_target = unique_keys.get(node.target, node.target)
-        self.all_tasks[unique_key] = self.all_tasks[unique_target]
-        if isinstance(self.all_tasks[unique_key], Task):
-          if unique_target in infos:
-            infos[unique_key] = infos[unique_target]
-          elif unique_target in self.all_runnables:
-            infos[unique_key] = self.all_runnables[unique_target]
+    # Each frame holds the key used as reference to make subkeys unique, the
+    # output key of the subgraph and its nodes that are yet to be recorded
+    stack = [ProvTracker._subgraph_frame(unique_keys.get(key, key), specs)]
+    while len(stack) > 0:
+      refkey, outkey, nodes = stack[-1]
+      for key, node in nodes:
+        if isinstance(node, DataNode):
+          self.documenter.register_data(node)
+          self.all_tasks[node.key] = node
+        elif isinstance(node, Alias):
+          unique_key = make_unique_key(refkey, key)
+          unique_keys[key] = unique_key
+          unique_target = unique_keys.get(node.target, node.target)
+          self.all_tasks[unique_key] = self.all_tasks[unique_target]
+          if isinstance(self.all_tasks[unique_key], Task):
+            if unique_target in infos:
+              infos[unique_key] = infos[unique_target]
+            elif unique_target in self.all_runnables:
+              infos[unique_key] = self.all_runnables[unique_target]
+            else:
+              print(f'Non existent alias to runnable task {unique_key} -> {unique_target}')
+        else:
+          unique_key = make_unique_key(refkey, key)
+          unique_keys[key] = unique_key
+          if ProvTracker._is_expandable_task(node):
+            # Continue with this subgraph once the nested one is recorded
+            stack.append(ProvTracker._subgraph_frame(unique_key, node))
+            break
           else:
-            print(f'Non existent alias to runnable task {unique_key} -> {unique_target}')
+            self.all_tasks[unique_key] = node
+            infos[unique_key] = RunnableTaskInfo(unique_key, group_key, node)
       else:
-        unique_key = make_unique_key(refkey, key)
-        unique_keys[key] = unique_key
-        if ProvTracker._is_expandable_task(node):
-          infos.update(self._record_expandable_task(
-            key=unique_key, group_key=group_key, specs=node,
-            unique_keys=unique_keys
-          ))
-        else:
-          self.all_tasks[unique_key] = node
-          infos[unique_key] = RunnableTaskInfo(unique_key, group_key, node)
-
-    outkey = unique_keys.get(outkey, outkey)
-    self.all_tasks[refkey] = self.all_tasks[outkey]
+        stack.pop()
+        outkey = unique_keys.get(outkey, outkey)
+        self.all_tasks[refkey] = self.all_tasks[outkey]
     return infos
 
+  @staticmethod
+  def _subgraph_frame(
+    refkey: Key, specs: Task
+  ) -> tuple[Key, Key, Iterator[tuple[Key, Task | Alias | DataNode]]]:
+    """Returns the reference key, the output key and the iterator over the nodes,
+    sorted by priority, of the subgraph executed by an expandable task."""
+
+    inner_dsk = cast(dict[Key, Task | Alias | DataNode], specs.args[0])
+    priorities = order(inner_dsk)
+    nodes = iter(sorted(inner_dsk.items(), key=lambda it: priorities[it[0]]))
+    return refkey, specs.args[1], nodes
+
   def _track_task(self, key: Key, group_key: Key, specs: Task) -> dict[Key, RunnableTaskInfo]:
     """Given a task that has already been recorded, tracks all its dependencies.
     It might happen that among the dependencies (actually among the arguments to
@@ -263,19 +1030,25 @@ class ProvTracker(SchedulerPlugin):
     new_infos = {}
     pending_tasks: list[tuple[Key, Task]] = []
     task_unique_keys = self.unique_keys[key]
+    # References resolved while tracking the sub-tasks of this macro task
+    resolutions: Resolutions = {}
     if ProvTracker._is_expandable_task(specs):
       new_infos.update(self._track_expandable_task(
-        specs=specs, group_key=group_key, unique_keys=task_unique_keys
+        specs=specs, group_key=group_key, unique_keys=task_unique_keys,
+        resolutions=resolutions
       ))
     else:
       info = self.all_runnables[key]
+      if info.record_flat_dependencies(self.all_tasks):
+        return new_infos
       dependencies: dict[Key, Task | DataNode | Alias] = {}
       for dep_key in cast(set[Key], specs.dependencies):
         unique_key = task_unique_keys.get(dep_key, dep_key)
         dependencies[dep_key] = self.all_tasks[unique_key]
       info.record_dependencies(
         dependencies=dependencies, all_tasks=self.all_tasks,
-        unique_keys=task_unique_keys, pending_tasks=pending_tasks
+        unique_keys=task_unique_keys, pending_tasks=pending_tasks,
+        resolutions=resolutions
       )
       if len(pending_tasks) > 0:
         while len(pending_tasks) > 0:
@@ -288,7 +1061,7 @@ class ProvTracker(SchedulerPlugin):
           if ProvTracker._is_expandable_task(new_task):
             new_infos.update(self._track_expandable_task(
               group_key=group_key, specs=new_task, unique_keys=task_unique_keys,
-              parent_internal_deps={}
+              parent_internal_deps={}, resolutions=resolutions
             ))
           else:
             self.all_tasks[new_key] = new_task
@@ -298,7 +1071,8 @@ class ProvTracker(SchedulerPlugin):
             )
             info.record_dependencies(
               dependencies=new_task_deps, all_tasks=self.all_tasks,
-              unique_keys=task_unique_keys, pending_tasks=pending_tasks
+              unique_keys=task_unique_keys, pending_tasks=pending_tasks,
+              resolutions=resolutions
             )
             new_infos[new_key] = info
     return new_infos
@@ -319,9 +1093,93 @@ class ProvTracker(SchedulerPlugin):
     self, group_key: Key, specs: Task,
     unique_keys: dict[Key, Key] = {},
     parent_internal_deps: dict[Key, Task | DataNode] = {},
+    resolutions: Resolutions | None = None
   ) -> dict[Key, RunnableTaskInfo]:
     """Tracks dependecies for an expandable tasks, i.e. tracks the dependecies
-    of all tasks embedded in an expandable task."""
+    of all tasks embedded in an expandable task. Nested subgraphs, including
+    those of pending tasks, are tracked with an explicit stack of frames."""
+
+    infos: dict[Key, RunnableTaskInfo] = {}
+    stack = [self._tracking_frame(specs, unique_keys, parent_internal_deps)]
+    while len(stack) > 0:
+      frame = stack[-1]
+      nested: _TrackingFrame | None = None
+      if frame.nodes is not None:
+        for key, node in frame.nodes:
+          # DataNode and Alias cases happens only if node comes from a pending
+          # task identified by RunnableTaskInfo.record_dependencies, and only if
+          # that node is expandable
+          if isinstance(node, DataNode):
+            if node.key not in self.all_tasks:
+              self.documenter.register_data(node)
+              self.all_tasks[node.key] = node
+          elif isinstance(node, Alias):
+            if node.key not in self.all_tasks:
+              unique_key = unique_keys[node.key]
+              unique_target = unique_keys.get(node.target, node.target)
+              target = self.all_tasks[unique_target]
+              if isinstance(target, Task):
+                if unique_target in infos:
+                  infos[unique_key] = infos[unique_target]
+                elif unique_target in self.all_runnables:
+                  infos[unique_key] = self.all_runnables[unique_target]
+                else:
+                  print(f'Non existent alias to runnable task {unique_key} -> {unique_target}')
+          else:
+            unique_key = unique_keys[key]
+            if ProvTracker._is_expandable_task(node):
+              nested = self._tracking_frame(node, unique_keys, frame.internal_deps)
+              break
+            node_deps = {}
+            for dep in cast(set[Key], node.dependencies):
+              if dep in frame.internal_deps:
+                node_deps[dep] = frame.internal_deps[dep]
+              else:
+                unique_dep_key = unique_keys.get(dep, dep)
+                node_deps[dep] = self.all_tasks[unique_dep_key]
+            self.all_runnables[unique_key].record_dependencies(
+              dependencies=node_deps, all_tasks=self.all_tasks,
+              unique_keys=unique_keys, pending_tasks=frame.pending_tasks,
+              resolutions=resolutions
+            )
+        else:
+          frame.nodes = None
+
+      # Here, any pending task identified by RunnableTaskInfo.record_dependencies
+      # is recorded into the prov document and the plugin
+      while nested is None and frame.nodes is None and len(frame.pending_tasks) > 0:
+        new_key, new_task = frame.pending_tasks.pop()
+        unique_keys[new_key] = new_key
+        new_task_deps: dict[Key, Any] = {}
+        for dep_key in cast(set[Key], new_task.dependencies):
+          unique_key = unique_keys.get(dep_key, dep_key)
+          new_task_deps[dep_key] = self.all_tasks[unique_key]
+        if ProvTracker._is_expandable_task(new_task):
+          nested = self._tracking_frame(new_task, unique_keys, frame.internal_deps)
+        else:
+          self.all_tasks[new_key] = new_task
+          # Record the new task
+          info = RunnableTaskInfo(
+            key=new_key, specs=new_task, group_key=group_key
+          )
+          info.record_dependencies(
+            dependencies=new_task_deps, all_tasks=self.all_tasks,
+            unique_keys=unique_keys, pending_tasks=frame.pending_tasks,
+            resolutions=resolutions
+          )
+          infos[new_key] = info
+
+      if nested is not None:
+        stack.append(nested)
+      elif frame.nodes is None and len(frame.pending_tasks) == 0:
+        stack.pop()
+    return infos
+
+  def _tracking_frame(
+    self, specs: Task, unique_keys: dict[Key, Key],
+    parent_internal_deps: dict[Key, Any]
+  ) -> '_TrackingFrame':
+    """Prepares the tracking of the subgraph executed by an expandable task."""
 
     # These are all tasks that will be executed by _execute_subgraph
     inner_dsk = cast(dict[Key, Task | Alias | DataNode], specs.args[0])
@@ -345,77 +1203,10 @@ class ProvTracker(SchedulerPlugin):
         # As this value is actually ready and doesn't come from any other
         # recognizable task, just take the raw value
         internal_deps[key] = dep.value
-    
-    pending_tasks: list[tuple[Key, Task]] = []
+
     priorities = order(inner_dsk)
-    infos: dict[Key, RunnableTaskInfo] = {}
-    for key, node in sorted(inner_dsk.items(), key=lambda it: priorities[it[0]]):
-      # DataNode and Alias cases happens only if node comes from a pending task
-      # identified by RunnableTaskInfo.record_dependencies, and only if that
-      # node is expandable
-      if isinstance(node, DataNode):
-        if node.key not in self.all_tasks:
-          self.documenter.register_data(node)
-          self.all_tasks[node.key] = node
-      elif isinstance(node, Alias):
-        if node.key not in self.all_tasks:
-          unique_key = unique_keys[node.key]
-          unique_target = unique_keys.get(node.target, node.target)
-          target = self.all_tasks[unique_target]
-          if isinstance(target, Task):
-            if unique_target in infos:
-              infos[unique_key] = infos[unique_target]
-            elif unique_target in self.all_runnables:
-              infos[unique_key] = self.all_runnables[unique_target]
-            else:
-              print(f'Non existent alias to runnable task {unique_key} -> {unique_target}')
-      else:
-        unique_key = unique_keys[key]
-        if ProvTracker._is_expandable_task(node):
-          infos.update(self._track_expandable_task(
-            group_key=group_key, specs=node, unique_keys=unique_keys,
-            parent_internal_deps=internal_deps
-          ))
-        else:
-          node_deps = {}
-          for dep in cast(set[Key], node.dependencies):
-            if dep in internal_deps:
-              node_deps[dep] = internal_deps[dep]
-            else:
-              unique_dep_key = unique_keys.get(dep, dep)
-              node_deps[dep] = self.all_tasks[unique_dep_key]
-          self.all_runnables[unique_key].record_dependencies(
-            dependencies=node_deps, all_tasks=self.all_tasks,
-            unique_keys=unique_keys, pending_tasks=pending_tasks
-          )
-    
-    # Here, any pending task identified by RunnableTaskInfo.record_dependencies
-    # is recorded into the prov document and the plugin
-    if len(pending_tasks) > 0:      
-      while len(pending_tasks) > 0:
-        new_key, new_task = pending_tasks.pop()
-        unique_keys[new_key] = new_key
-        new_task_deps: dict[Key, Any] = {}
-        for dep_key in cast(set[Key], new_task.dependencies):
-          unique_key = unique_keys.get(dep_key, dep_key)
-          new_task_deps[dep_key] = self.all_tasks[unique_key]
-        if ProvTracker._is_expandable_task(new_task):
-          infos.update(self._track_expandable_task(
-            group_key=group_key, specs=new_task, unique_keys=unique_keys,
-            parent_internal_deps=internal_deps
-          ))
-        else:
-          self.all_tasks[new_key] = new_task
-          # Record the new task
-          info = RunnableTaskInfo(
-            key=new_key, specs=new_task, group_key=group_key
-          )
-          info.record_dependencies(
-            dependencies=new_task_deps, all_tasks=self.all_tasks,
-            unique_keys=unique_keys, pending_tasks=pending_tasks
-          )
-          infos[new_key] = info
-    return infos
+    nodes = iter(sorted(inner_dsk.items(), key=lambda it: priorities[it[0]]))
+    return _TrackingFrame(internal_deps, nodes)
 
   @staticmethod
   def _has_erred_dep(task: TaskState) -> bool:
@@ -0,0 +1,100 @@
+from typing import Iterable
+
+class ReachabilityPruner:
+  """Keeps track of which activities contributed to the outputs of the run,
+  i.e. the results that reached a client, being gathered or persisted, or that
+  were explicitly marked. Activities are retained when they can be reached
+  backwards from an output, following the results they used.
+
+  Activities whose task has been forgotten by the scheduler can't get any new
+  consumer, so they are pruned as soon as they are not retained and all their
+  consumers have been pruned. Pruning an activity releases one consumer of each
+  of its producers, so pruning cascades backwards through dead subgraphs. What
+  is still unreachable when the run ends is pruned by `unreachable`."""
+
+  def __init__(self):
+    # Reverse edges: the activities whose results have been used by each one
+    self.producers: dict[str, tuple[str, ...]] = {}
+    # Number of activities not yet pruned that used the results of each one.
+    # Its keys are the activities known to the pruner
+    self.consumers: dict[str, int] = {}
+    # Activities producing outputs and those upstream of them
+    self.roots: set[str] = set()
+    self.retained: set[str] = set()
+    # Activities whose task has been forgotten, but that can't be pruned yet
+    self.closed: set[str] = set()
+
+  def add_activity(self, task_id: str):
+    self.consumers.setdefault(task_id, 0)
+
+  def add_edges(self, task_id: str, producers: Iterable[str]):
+    """Records that `task_id` used the results of `producers`. It must be called
+    once for each activity."""
+
+    unique = tuple(dict.fromkeys(producers))
+    self.producers[task_id] = unique
+    consumers = self.consumers
+    for producer in unique:
+      consumers[producer] = consumers.get(producer, 0) + 1
+    if task_id in self.retained:
+      self._retain(unique)
+
+  def retain(self, task_id: str):
+    """Marks `task_id` as producing an output of the run."""
+
+    self.roots.add(task_id)
+    self._retain((task_id,))
+
+  def _retain(self, task_ids: Iterable[str]):
+    retained, producers = self.retained, self.producers
+    stack = list(task_ids)
+    while len(stack) > 0:
+      task_id = stack.pop()
+      if task_id in retained:
+        continue
+      retained.add(task_id)
+      self.closed.discard(task_id)
+      stack.extend(producers.get(task_id, ()))
+
+  def forget(self, task_ids: Iterable[str]) -> list[str]:
+    """Must be called when the task of `task_ids` is forgotten by the scheduler.
+    Returns the activities that can be pruned as a consequence."""
+
+    consumers, producers = self.consumers, self.producers
+    pruned: list[str] = []
+    stack: list[str] = []
+    for task_id in task_ids:
+      if task_id in consumers and task_id not in self.retained:
+        self.closed.add(task_id)
+        stack.append(task_id)
+    while len(stack) > 0:
+      task_id = stack.pop()
+      if task_id not in self.closed or consumers[task_id] > 0:
+        continue
+      self.closed.discard(task_id)
+      del consumers[task_id]
+      pruned.append(task_id)
+      for producer in producers.pop(task_id, ()):
+        if producer in consumers:
+          consumers[producer] -= 1
+          stack.append(producer)
+    return pruned
+
+  def unreachable(self) -> list[str]:
+    """Returns the known activities that can't be reached backwards from any
+    output, whether their task has been forgotten or not, and forgets them."""
+
+    reachable: set[str] = set()
+    stack = list(self.roots)
+    while len(stack) > 0:
+      task_id = stack.pop()
+      if task_id in reachable:
+        continue
+      reachable.add(task_id)
+      stack.extend(self.producers.get(task_id, ()))
+    pruned = [task_id for task_id in self.consumers if task_id not in reachable]
+    for task_id in pruned:
+      del self.consumers[task_id]
+      self.producers.pop(task_id, None)
+      self.closed.discard(task_id)
+    return pruned
@@ -0,0 +1,333 @@
+import json
+import os
+from typing import Any, Iterator
+
+from prov_tracking.compression import CODECS, EXTENSIONS, open_writer
+from prov_tracking.reader import ProvReader
+
+# Namespace of the attributes linking the levels, as in the reduced documents
+# of the examples
+ANALYTICS = 'analytics4yprov'
+MANIFEST = 'pyramid.json'
+# Name and type of the nodes of each level
+LEVELS = (
+  ('chunks', None), ('pipelines', 'reduced_pipeline'),
+  ('groups', 'reduced_group'), ('calls', 'reduced_call'),
+)
+
+def _time(value: Any) -> str | None:
+  # Times that were not recorded are written as 'None'
+  return value if value not in (None, 'None') else None
+
+def _cell_number(value: Any) -> int | float:
+  # Cells are written as strings, e.g. '10', so they're compared as numbers,
+  # with those that aren't numbers coming last
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return float('inf')
+
+class _Node:
+  """What the coarser levels need to know about a node of a level: its task
+  groups, the number of activities it stands for, their earliest start time,
+  latest end time and statuses, and the first notebook cell they come from."""
+
+  __slots__ = ('members', 'groups', 'count', 'start', 'end', 'statuses', 'cell')
+
+  def __init__(self):
+    self.members: list[str] = []
+    self.groups: dict[str, None] = {}
+    self.count = 0
+    self.start: str | None = None
+    self.end: str | None = None
+    self.statuses: set[str] = set()
+    # As written in the document, which may be a string
+    self.cell: Any = None
+
+  @staticmethod
+  def activity(attributes: dict[str, Any]) -> '_Node':
+    node = _Node()
+    node.groups[str(attributes['yprov4wfs:group'])] = None
+    node.count = 1
+    node.start = _time(attributes.get('prov:startTime'))
+    node.end = _time(attributes.get('prov:endTime'))
+    status = attributes.get('yprov4wfs:status')
+    if status not in (None, 'None'):
+      node.statuses.add(status)
+    node.cell = attributes.get('yprov4wfs:jupyter_cell')
+    return node
+
+  def add(self, id: str, node: '_Node'):
+    self.members.append(id)
+    self.groups.update(node.groups)
+    self.count += node.count
+    if node.start is not None and (self.start is None or node.start < self.start):
+      self.start = node.start
+    if node.end is not None and (self.end is None or node.end > self.end):
+      self.end = node.end
+    self.statuses.update(node.statuses)
+    if node.cell is not None and (
+      self.cell is None or _cell_number(node.cell) < _cell_number(self.cell)
+    ):
+      self.cell = node.cell
+
+  def attributes(self, level: int, source: str) -> dict[str, Any]:
+    attributes: dict[str, Any] = {
+      'prov:type': LEVELS[level][1],
+      f'{ANALYTICS}:level': level,
+      f'{ANALYTICS}:source': source,
+      f'{ANALYTICS}:aggregates': self.members,
+      'yprov4wfs:groups': list(self.groups),
+      'yprov4wfs:activities': self.count,
+      'prov:startTime': str(self.start),
+      'prov:endTime': str(self.end),
+    }
+    if self.cell is not None:
+      attributes['yprov4wfs:jupyter_cell'] = self.cell
+    if 'failure' in self.statuses:
+      attributes['yprov4wfs:status'] = 'failure'
+    elif len(self.statuses) > 0:
+      attributes['yprov4wfs:status'] = min(self.statuses)
+    return attributes
+
+# Relations between the nodes of a level, as `(informed, informant)` pairs, i.e.
+# from the consumer to the producer, with the number of relations of the finer
+# level each one stands for
+Edges = dict[tuple[str, str], int]
+
+def _pipelines(nodes: dict[str, _Node], edges: Edges) -> dict[str, str]:
+  """Maps each activity to its pipeline, i.e. the maximal chain in which each
+  activity is the only consumer of the previous one, which is in turn its only
+  producer, e.g. the steps applied to the same chunk."""
+
+  producers: dict[str, list[str]] = {}
+  consumers: dict[str, list[str]] = {}
+  for informed, informant in edges:
+    producers.setdefault(informed, []).append(informant)
+    consumers.setdefault(informant, []).append(informed)
+  def continues(id: str) -> bool:
+    own = producers.get(id, ())
+    return len(own) == 1 and len(consumers[own[0]]) == 1
+
+  mapping: dict[str, str] = {}
+  count = 0
+  for id in nodes:
+    if continues(id):
+      continue
+    pipeline = f'pipeline_{count}'
+    count += 1
+    mapping[id] = pipeline
+    while len(consumers.get(id, ())) == 1 and continues(consumers[id][0]):
+      id = consumers[id][0]
+      mapping[id] = pipeline
+  # Cycles have no head, which can't happen in a document of a Dask graph
+  for id in nodes:
+    mapping.setdefault(id, f'pipeline_{id}')
+  return mapping
+
+def _groups(nodes: dict[str, _Node], edges: Edges) -> dict[str, str]:
+  """Maps each pipeline to the task groups it goes through, e.g. `open-mean`
+  for the pipelines reading and averaging chunks."""
+
+  return { id: '-'.join(node.groups) for id, node in nodes.items() }
+
+def _calls(nodes: dict[str, _Node], edges: Edges) -> dict[str, str]:
+  """Maps each task group to the notebook cell that submitted its first task.
+  If cells were not tracked, it maps each group to its compute call instead,
+  i.e. to the connected part of the graph it belongs to."""
+
+  if any(node.cell is not None for node in nodes.values()):
+    return {
+      id: f'cell_{node.cell}' if node.cell is not None else 'cell_unknown'
+      for id, node in nodes.items()
+    }
+  parents = { id: id for id in nodes }
+  def find(id: str) -> str:
+    while parents[id] != id:
+      parents[id] = parents[parents[id]]
+      id = parents[id]
+    return id
+  for informed, informant in edges:
+    parents[find(informed)] = find(informant)
+  roots: dict[str, str] = {}
+  return {
+    id: roots.setdefault(find(id), f'call_{len(roots)}') for id in nodes
+  }
+
+_COLLAPSE = (None, _pipelines, _groups, _calls)
+
+def _write_level(
+  path: str, prefixes: dict[str, str], activities: dict[str, Any], edges: Edges,
+  compression: str | None
+):
+  f = open_writer(path, compression) if compression is not None else open(path, 'w')
+  with f:
+    json.dump({
+      'prefix': { **prefixes, ANALYTICS: 'http://example.org' },
+      'activity': activities,
+      # Each relation counts the relations of the finer level it stands for
+      'wasInformedBy': {
+        f'{informed}<-{informant}': {
+          'prov:informed': informed, 'prov:informant': informant,
+          f'{ANALYTICS}:count': count,
+        }
+        for (informed, informant), count in edges.items()
+      },
+    }, f, indent=4, ensure_ascii=False)
+
+def build(
+  path: str, destination: str | None = None, compression: str | None = None
+) -> str:
+  """Builds the coarser levels of the provenance document at `path`, i.e. of
+  level 0, with an activity for each chunk, and returns the path of the
+  manifest listing the file of each level:
+  - level 1 collapses pipelines, i.e. chains of activities each one consuming
+    only the result of the previous one;
+  - level 2 collapses the pipelines going through the same task groups;
+  - level 3 collapses the groups submitted by the same notebook cell or, if
+    cells were not tracked, by the same compute call.
+
+  Each node lists the nodes of the finer level it stands for, in
+  `analytics4yprov:aggregates`, with the file holding them, in
+  `analytics4yprov:source`, and sums up their groups, number of activities,
+  times and status. Files are written in `destination`, which defaults to the
+  folder of the document, as `yprov4wfs.level<k>.json`."""
+
+  if compression is not None and compression not in CODECS:
+    raise ValueError(f'Unsupported codec {compression}, use one of {", ".join(CODECS)}')
+  if destination is None:
+    destination = os.path.dirname(os.path.abspath(path))
+  os.makedirs(destination, exist_ok=True)
+
+  nodes: dict[str, _Node] = {}
+  edges: Edges = {}
+  with ProvReader(path) as reader:
+    prefixes = reader.section('prefix')
+    for id in reader.activity_ids():
+      attributes = reader.activity(id)
+      # The workflow activity is the only one without a group
+      if 'yprov4wfs:group' in attributes:
+        nodes[id] = _Node.activity(attributes)
+    # Relations are (consumer, producer) pairs, as written in each level
+    for consumer, producer in reader.communications(expand_fan_ins=True):
+      if consumer in nodes and producer in nodes and consumer != producer:
+        edges[(consumer, producer)] = 1
+
+  source = os.path.relpath(os.path.abspath(path), destination)
+  levels = [{ 'level': 0, 'name': LEVELS[0][0], 'file': source, 'nodes': len(nodes) }]
+  for level in range(1, len(LEVELS)):
+    mapping = _COLLAPSE[level](nodes, edges)
+    coarse: dict[str, _Node] = {}
+    for id, node in nodes.items():
+      coarse.setdefault(mapping[id], _Node()).add(id, node)
+    coarse_edges: Edges = {}
+    for (informed, informant), count in edges.items():
+      pair = (mapping[informed], mapping[informant])
+      if pair[0] != pair[1]:
+        coarse_edges[pair] = coarse_edges.get(pair, 0) + count
+
+    file_name = f'yprov4wfs.level{level}.json' + EXTENSIONS.get(compression or '', '')
+    _write_level(
+      os.path.join(destination, file_name), prefixes,
+      { id: node.attributes(level, source) for id, node in coarse.items() },
+      coarse_edges, compression
+    )
+    levels.append({
+      'level': level, 'name': LEVELS[level][0], 'file': file_name, 'nodes': len(coarse)
+    })
+    nodes, edges, source = coarse, coarse_edges, file_name
+
+  manifest = os.path.join(destination, MANIFEST)
+  with open(manifest, 'w') as f:
+    json.dump({ 'levels': levels }, f, indent=4)
+  return manifest
+
+class Pyramid:
+  """Access to the levels of a pyramid built by `build`. Levels are opened
+  lazily with `ProvReader`, so a viewer can start from the coarsest one and
+  only load the finer ones for the nodes it expands."""
+
+  def __init__(self, manifest: str):
+    with open(manifest) as f:
+      self.levels: list[dict[str, Any]] = json.load(f)['levels']
+    self.directory = os.path.dirname(os.path.abspath(manifest))
+    self._readers: dict[int, ProvReader] = {}
+    # Parent of each node of a level, built when first needed
+    self._parents: dict[int, dict[str, str]] = {}
+
+  def __len__(self) -> int:
+    return len(self.levels)
+
+  def __enter__(self) -> 'Pyramid':
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    for reader in self._readers.values():
+      reader.close()
+    self._readers.clear()
+
+  def reader(self, level: int) -> ProvReader:
+    if level not in self._readers:
+      path = os.path.join(self.directory, self.levels[level]['file'])
+      self._readers[level] = ProvReader(path)
+    return self._readers[level]
+
+  def nodes(self, level: int) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Yields the id and the attributes of each node of a level. At level 0,
+    the workflow activity is skipped."""
+
+    reader = self.reader(level)
+    for id in reader.activity_ids():
+      attributes = reader.activity(id)
+      if level > 0 or 'yprov4wfs:group' in attributes:
+        yield id, attributes
+
+  def children(self, level: int, id: str) -> list[str]:
+    """Returns the ids of the nodes of level `level - 1` that the node `id`
+    stands for."""
+
+    if level == 0:
+      return []
+    return self.reader(level).activity(id)[f'{ANALYTICS}:aggregates']
+
+  def parent(self, level: int, id: str) -> str | None:
+    """Returns the id of the node of level `level + 1` standing for the node
+    `id`, or `None` if `level` is the coarsest one or `id` is not in it."""
+
+    if level + 1 >= len(self.levels):
+      return None
+    if level not in self._parents:
+      self._parents[level] = {
+        child: parent for parent, attributes in self.nodes(level + 1)
+        for child in attributes[f'{ANALYTICS}:aggregates']
+      }
+    return self._parents[level].get(id)
+
+  def expand(self, level: int, id: str, to_level: int = 0) -> list[str]:
+    """Returns the ids of the nodes of `to_level` that the node `id` stands
+    for."""
+
+    ids = [id]
+    while level > to_level:
+      ids = [child for id in ids for child in self.children(level, id)]
+      level -= 1
+    return ids
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(
+    description='Builds the coarser levels of a provenance document'
+  )
+  parser.add_argument('document')
+  parser.add_argument('destination', nargs='?', default=None, help='defaults to the folder of the document')
+  parser.add_argument('--compression', choices=CODECS, default=None)
+  args = parser.parse_args()
+
+  manifest = build(args.document, args.destination, args.compression)
+  with open(manifest) as f:
+    for level in json.load(f)['levels']:
+      print(f'level {level["level"]} ({level["name"]}): {level["nodes"]} nodes in {level["file"]}')
@@ -0,0 +1,156 @@
+import datetime as dt
+import json
+import os
+from typing import Any, TextIO
+from urllib.parse import quote
+
+from prov_tracking.compression import open_writer
+
+PROV = 'http://www.w3.org/ns/prov#'
+# Same namespace declared by the vocabulary in dask-prov.ttl
+DSKP = 'file://./dask-prov.ttl'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+RDFS = 'http://www.w3.org/2000/01/rdf-schema#'
+# Namespace of the identifiers of activities and entities, as declared by the
+# default prefix of the PROV-JSON documents
+DEFAULT = 'http://anotherexample.org/'
+
+# Attributes whose name in the vocabulary differs from the one used in the
+# PROV-JSON document
+_TERMS = { 'nbytes': 'nbyte' }
+
+def _escape(string: str) -> str:
+  """Escapes a string so that it can be used as an N-Triples/Turtle literal."""
+
+  return (
+    string.replace('\\', '\\\\').replace('"', '\\"')
+    .replace('\n', '\\n').replace('\r', '\\r')
+  )
+
+class TripleWriter:
+  """Streams RDF triples into an N-Triples (`nt`) or Turtle (`ttl`) file, using
+  the `dskp:` vocabulary for the Dask-specific attributes. Triples are written
+  as soon as they are produced, so memory usage doesn't depend on the size of
+  the document. The file can optionally be compressed in frames with `codec`,
+  see `prov_tracking.compression`."""
+
+  def __init__(
+    self, path: str, format: str = 'nt', codec: str | None = None,
+    level: int | None = None
+  ):
+    if format not in ('nt', 'ttl'):
+      raise ValueError(f'Unsupported RDF format {format}, use nt or ttl')
+    self.path = path
+    self.format = format
+    self.codec = codec
+    self.level = level
+    self._file: TextIO | None = None
+    # Files are appended to when reopened after having been closed
+    self._mode = 'w'
+    # Size of the file when `mark` was last called
+    self._mark: int | None = None
+
+  def _open(self) -> TextIO:
+    if self._file is None:
+      directory = os.path.dirname(self.path)
+      if directory != '':
+        os.makedirs(directory, exist_ok=True)
+      if self._mode == 'a' and self._mark is not None:
+        # What was written after the mark is replaced by what is written now
+        os.truncate(self.path, self._mark)
+      empty = (
+        self._mode == 'w' or not os.path.exists(self.path)
+        or os.path.getsize(self.path) == 0
+      )
+      if self.codec is not None:
+        # Appending to a compressed file adds new frames, which is still valid
+        self._file = open_writer(
+          self.path, self.codec, self.level, append=self._mode == 'a'
+        )
+      else:
+        self._file = open(self.path, self._mode, encoding='utf-8')
+      self._mode = 'a'
+      if self.format == 'ttl' and empty:
+        self._file.write(
+          f'@prefix prov: <{PROV}> .\n@prefix dskp: <{DSKP}> .\n'
+          f'@prefix rdfs: <{RDFS}> .\n@prefix xsd: <{XSD}> .\n\n'
+        )
+    return self._file
+
+  def _name(self, namespace: str, prefix: str, term: str) -> str:
+    if self.format == 'ttl':
+      return f'{prefix}:{term}'
+    return f'<{namespace}{term}>'
+
+  def prov(self, term: str) -> str:
+    return self._name(PROV, 'prov', term)
+
+  def dskp(self, term: str) -> str:
+    return self._name(DSKP, 'dskp', _TERMS.get(term, term))
+
+  def node(self, id: str) -> str:
+    """Returns the IRI of an activity or entity given its identifier."""
+
+    return f'<{DEFAULT}{quote(id, safe="-._~")}>'
+
+  def literal(self, value: Any) -> str:
+    if isinstance(value, bool):
+      return f'"{str(value).lower()}"^^{self._name(XSD, "xsd", "boolean")}'
+    if isinstance(value, int):
+      return f'"{value}"^^{self._name(XSD, "xsd", "integer")}'
+    if isinstance(value, float):
+      return f'"{value}"^^{self._name(XSD, "xsd", "double")}'
+    if isinstance(value, dt.datetime):
+      return f'"{value.isoformat()}"^^{self._name(XSD, "xsd", "dateTime")}'
+    if isinstance(value, (dict, list, tuple)):
+      value = json.dumps(value, default=str)
+    return f'"{_escape(str(value))}"'
+
+  def write(self, subject: str, properties: list[tuple[str, str]]):
+    """Writes all the given `(predicate, object)` pairs for `subject`. Terms
+    must have been produced by the other methods of the writer."""
+
+    if len(properties) == 0:
+      return
+    file = self._open()
+    if self.format == 'ttl':
+      body = ' ;\n  '.join(f'{p} {o}' for p, o in properties)
+      file.write(f'{subject} {body} .\n')
+    else:
+      file.writelines(f'{subject} {p} {o} .\n' for p, o in properties)
+
+  def write_resource(
+    self, id: str, type: str, label: str | None, attributes: dict[str, Any]
+  ):
+    """Writes an activity or entity, i.e. its PROV type, label and attributes.
+    Attributes are expressed with the `dskp:` vocabulary, lists are written as
+    one triple for each item."""
+
+    rdf_type = 'a' if self.format == 'ttl' else f'<{RDF}type>'
+    properties = [(rdf_type, self.prov(type))]
+    if label is not None:
+      properties.append((self._name(RDFS, 'rdfs', 'label'), self.literal(label)))
+    for name, value in attributes.items():
+      if value is None:
+        continue
+      if isinstance(value, list) and all(not isinstance(v, (dict, list)) for v in value):
+        properties.extend((self.dskp(name), self.literal(v)) for v in value)
+      else:
+        properties.append((self.dskp(name), self.literal(value)))
+    self.write(self.node(id), properties)
+
+  def mark(self):
+    """Closes the file and marks its end. Triples written from now on until the
+    file is closed again, e.g. the aggregates of the run, are discarded when the
+    file is reopened, so that they can be written again with updated values."""
+
+    self.close()
+    self._mark = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+  def close(self):
+    """Flushes and closes the file. Writing again reopens it in append mode."""
+
+    if self._file is not None:
+      self._file.close()
+      self._file = None
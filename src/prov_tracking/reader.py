@@ -0,0 +1,456 @@
+import datetime as dt
+import json
+import mmap
+import re
+import tempfile
+from array import array
+from typing import Any, BinaryIO, Iterator, cast
+
+from prov_tracking.compression import CHUNK_SIZE, FrameReader, decompress_into, detect
+from prov_tracking.fan_in import expand, member_id
+
+# A JSON string, an opening or a closing bracket
+_TOKEN = re.compile(rb'(?P<s>"(?:[^"\\]|\\.)*")|(?P<o>[{\[])|(?P<c>[}\]])')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"')
+_SCALAR = re.compile(rb'[^,}\]\s]+')
+# The key of a member of an object, preceded by the separator from the previous
+# member, if any
+_KEY = re.compile(rb'\s*,?\s*("(?:[^"\\]|\\.)*")\s*:\s*')
+_WHITESPACE = re.compile(rb'\s*')
+_CLOSE = re.compile(rb'\s*[}\]]')
+_GROUP = re.compile(rb'"yprov4wfs:group"\s*:\s*("(?:[^"\\]|\\.)*")')
+_START_TIME = re.compile(rb'"prov:startTime"\s*:\s*("(?:[^"\\]|\\.)*")')
+_END_TIME = re.compile(rb'"prov:endTime"\s*:\s*("(?:[^"\\]|\\.)*")')
+_FAN_IN = re.compile(rb'"yprov4wfs:fan_in_group"')
+_ENTITY = re.compile(rb'"prov:entity"\s*:\s*("(?:[^"\\]|\\.)*")')
+_ACTIVITY = re.compile(rb'"prov:activity"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+# Sections of a PROV-JSON document holding relations
+RELATIONS = (
+  'used', 'wasGeneratedBy', 'wasInformedBy', 'wasAssociatedWith',
+  'wasAttributedTo', 'actedOnBehalfOf', 'wasDerivedFrom'
+)
+
+def _skip_value(buf: Any, pos: int) -> int:
+  """Given the offset at which a JSON value starts, returns the offset right
+  after its end. Raises `ValueError` if the value is not terminated."""
+
+  first = buf[pos:pos + 1]
+  if first not in (b'{', b'['):
+    match = (_STRING if first == b'"' else _SCALAR).match(buf, pos)
+    if match is None:
+      raise ValueError(f'Unterminated JSON value at offset {pos}')
+    return match.end()
+  depth = 0
+  for match in _TOKEN.finditer(buf, pos):
+    if match.lastgroup == 'o':
+      depth += 1
+    elif match.lastgroup == 'c':
+      depth -= 1
+      if depth == 0:
+        return match.end()
+  raise ValueError(f'Unterminated JSON value at offset {pos}')
+
+# Content held after the position being scanned, so that keys and scalars are
+# never cut by the end of the window
+_MARGIN = 1 << 16
+
+class _Window:
+  """Content of a document scanned from `base` on. Documents compressed in
+  frames are decompressed a chunk at a time as the scan proceeds, and what has
+  been scanned is released, so only the frames being scanned are held in
+  memory. Other documents are memory-mapped as a whole. Offsets passed to and
+  returned by the methods are offsets in the whole document."""
+
+  def __init__(self, source: FrameReader | mmap.mmap, base: int = 0):
+    self.source = source
+    self.data: Any
+    if isinstance(source, FrameReader):
+      self.base = base
+      self.data = bytearray()
+      self.eof = base >= source.size
+    else:
+      self.base = 0
+      self.data = source
+      self.eof = True
+
+  def _extend(self) -> bool:
+    if self.eof:
+      return False
+    source = cast(FrameReader, self.source)
+    end = self.base + len(self.data)
+    # Doubling the window keeps rescanning large values linear
+    stop = min(end + max(CHUNK_SIZE, len(self.data)), source.size)
+    self.data += source.read(end, stop)
+    self.eof = stop >= source.size
+    return True
+
+  def _ensure(self, pos: int):
+    while pos + _MARGIN > self.base + len(self.data) and self._extend():
+      pass
+
+  def release(self, pos: int):
+    """Releases the content before `pos`, which won't be scanned again."""
+
+    if isinstance(self.data, bytearray) and pos - self.base > CHUNK_SIZE:
+      del self.data[:pos - self.base]
+      self.base = pos
+
+  def match(self, pattern: re.Pattern, pos: int) -> re.Match | None:
+    """Matches `pattern` at `pos`. Offsets of the match are relative to `base`."""
+
+    self._ensure(pos)
+    while True:
+      match = pattern.match(self.data, pos - self.base)
+      if match is not None and match.end() == len(self.data) and self._extend():
+        continue
+      return match
+
+  def skip_value(self, pos: int) -> int:
+    """Returns the offset right after the end of the JSON value at `pos`."""
+
+    self._ensure(pos)
+    while True:
+      try:
+        end: int | None = _skip_value(self.data, pos - self.base)
+      except ValueError:
+        end = None
+      if end is not None and (end < len(self.data) or self.eof):
+        return self.base + end
+      if not self._extend():
+        raise ValueError(f'Unterminated JSON value at offset {pos}')
+
+  def first(self, pos: int) -> bytes:
+    """Returns the byte at `pos`."""
+
+    self._ensure(pos)
+    return bytes(self.data[pos - self.base:pos - self.base + 1])
+
+  def slice(self, start: int, end: int) -> bytes:
+    return bytes(self.data[start - self.base:end - self.base])
+
+def _members(window: _Window, start: int) -> Iterator[tuple[str, int, int]]:
+  """Given the offset of the opening brace of a JSON object, yields the key and
+  the offsets of the value of each of its members, without decoding values.
+  Each value is held by the window until the next one is requested."""
+
+  pos = start + 1
+  while True:
+    match = window.match(_KEY, pos)
+    if match is None:
+      return
+    value_start = window.base + match.end()
+    value_end = window.skip_value(value_start)
+    yield json.loads(match.group(1)), value_start, value_end
+    window.release(value_end)
+    pos = value_end
+
+def _timestamp(buf: Any, pattern: re.Pattern, start: int, end: int) -> float:
+  """Searches a time attribute within a record and returns it as a POSIX
+  timestamp, or NaN if it's missing."""
+
+  match = pattern.search(buf, start, end)
+  if match is None:
+    return float('nan')
+  try:
+    return dt.datetime.fromisoformat(json.loads(match.group(1))).timestamp()
+  except ValueError:
+    return float('nan')
+
+class _Index:
+  """Offsets of the records of a section of the document."""
+
+  def __init__(self):
+    self.ids: list[str] = []
+    self.positions: dict[str, int] = {}
+    self.starts = array('q')
+    self.ends = array('q')
+
+  def add(self, id: str, start: int, end: int) -> int:
+    position = len(self.starts)
+    self.ids.append(id)
+    self.positions[id] = position
+    self.starts.append(start)
+    self.ends.append(end)
+    return position
+
+class ProvReader:
+  """Lazy reader for provenance documents, indexed in a single pass, which only
+  records the offsets of activities, entities and relation sections, together
+  with the group and the start and end time of each activity and the activity
+  that generated each entity. Records are
+  decoded only when requested, so documents larger than memory can be
+  analysed. Plain documents are memory-mapped. Documents compressed in frames,
+  see `prov_tracking.compression`, are read through `FrameReader`, so each
+  record is read by decompressing only the frame holding it. Documents
+  compressed by other tools are streamed into a temporary file first."""
+
+  def __init__(self, path: str):
+    self.path = path
+    self.codec = detect(path)
+    self._frames: FrameReader | None = None
+    self._file: BinaryIO | None = None
+    if self.codec is not None:
+      try:
+        self._frames = FrameReader(path)
+      except ValueError:
+        self._file = tempfile.TemporaryFile()
+        decompress_into(path, self._file)
+        self._file.flush()
+    else:
+      self._file = open(path, 'rb')
+    self._buf: mmap.mmap | None = None
+    if self._file is not None:
+      self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    self._activities = _Index()
+    self._entities = _Index()
+    self._sections: dict[str, tuple[int, int]] = {}
+    self._groups: dict[str, array] = {}
+    self._start_times = array('d')
+    self._end_times = array('d')
+    # Entities standing for the results of many tasks, see prov_tracking.fan_in
+    self._fan_ins: set[str] = set()
+    # Position of the activity that generated each entity, or -1
+    self._generators = array('q')
+    self._build_index()
+
+  def _window(self, start: int = 0) -> _Window:
+    return _Window(self._frames if self._frames is not None else cast(mmap.mmap, self._buf), start)
+
+  def _build_index(self):
+    window = self._window()
+    # Generations whose entity or activity comes later in the document
+    deferred: list[tuple[str, str]] = []
+    pos = window.match(_WHITESPACE, 0).end() + 1
+    while True:
+      match = window.match(_KEY, pos)
+      if match is None:
+        break
+      section = json.loads(match.group(1))
+      value_start = window.base + match.end()
+      if window.first(value_start) != b'{':
+        value_end = window.skip_value(value_start)
+      else:
+        # Sections are scanned record by record, so that they are never held
+        # as a whole, and only those of activities and entities are indexed
+        last = value_start + 1
+        for id, record_start, record_end in _members(window, value_start):
+          last = record_end
+          start, end = record_start - window.base, record_end - window.base
+          if section == 'activity':
+            position = self._activities.add(id, record_start, record_end)
+            group = _GROUP.search(window.data, start, end)
+            if group is not None:
+              name = json.loads(group.group(1))
+              if name not in self._groups:
+                self._groups[name] = array('q')
+              self._groups[name].append(position)
+            self._start_times.append(_timestamp(window.data, _START_TIME, start, end))
+            self._end_times.append(_timestamp(window.data, _END_TIME, start, end))
+          elif section == 'entity':
+            self._entities.add(id, record_start, record_end)
+            self._generators.append(-1)
+            if _FAN_IN.search(window.data, start, end) is not None:
+              self._fan_ins.add(id)
+          elif section == 'wasGeneratedBy':
+            entity = _ENTITY.search(window.data, start, end)
+            activity = _ACTIVITY.search(window.data, start, end)
+            if entity is not None and activity is not None:
+              pair = (json.loads(entity.group(1)), json.loads(activity.group(1)))
+              if not self._generate(*pair):
+                deferred.append(pair)
+        close = window.match(_CLOSE, last)
+        if close is None:
+          raise ValueError(f'Unterminated JSON value at offset {value_start}')
+        value_end = window.base + close.end()
+      self._sections[section] = (value_start, value_end)
+      pos = value_end
+    for entity, activity in deferred:
+      self._generate(entity, activity)
+
+  def _generate(self, entity: str, activity: str) -> bool:
+    """Records that `activity` generated `entity`, returning `False` if either
+    of them hasn't been indexed yet."""
+
+    position = self._entities.positions.get(entity)
+    generator = self._activities.positions.get(activity)
+    if position is None or generator is None:
+      return False
+    self._generators[position] = generator
+    return True
+
+  def close(self):
+    if self._frames is not None:
+      self._frames.close()
+    if self._buf is not None:
+      self._buf.close()
+    if self._file is not None:
+      self._file.close()
+
+  def __enter__(self) -> 'ProvReader':
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _read(self, start: int, end: int) -> bytes:
+    if self._frames is not None:
+      return self._frames.read(start, end)
+    return cast(mmap.mmap, self._buf)[start:end]
+
+  def _decode(self, start: int, end: int) -> Any:
+    return json.loads(self._read(start, end))
+
+  def __len__(self) -> int:
+    return len(self._activities.starts) + len(self._entities.starts)
+
+  def activity_ids(self) -> Iterator[str]:
+    return iter(self._activities.ids)
+
+  def entity_ids(self) -> Iterator[str]:
+    return iter(self._entities.ids)
+
+  def activity(self, id: str) -> dict[str, Any]:
+    """Returns the attributes of the activity `id`. Raises `KeyError` if there is
+    no such activity."""
+
+    position = self._activities.positions[id]
+    return self._decode(self._activities.starts[position], self._activities.ends[position])
+
+  def entity(self, id: str) -> dict[str, Any]:
+    """Returns the attributes of the entity `id`. Raises `KeyError` if there is
+    no such entity."""
+
+    position = self._entities.positions[id]
+    return self._decode(self._entities.starts[position], self._entities.ends[position])
+
+  def has_activity(self, id: str) -> bool:
+    return id in self._activities.positions
+
+  def has_entity(self, id: str) -> bool:
+    return id in self._entities.positions
+
+  def groups(self) -> list[str]:
+    """Returns the names of the task groups found in the document."""
+
+    return list(self._groups)
+
+  def _activities_at(self, positions) -> Iterator[tuple[str, dict[str, Any]]]:
+    ids = self._activities.ids
+    for position in positions:
+      yield ids[position], self._decode(
+        self._activities.starts[position], self._activities.ends[position]
+      )
+
+  def group(self, name: str) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Yields the id and the attributes of each activity of the task group
+    `name`."""
+
+    return self._activities_at(self._groups.get(name, array('q')))
+
+  def between(
+    self, start: dt.datetime, end: dt.datetime
+  ) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Yields the id and the attributes of each activity that was running at
+    some point between `start` and `end`."""
+
+    lower, upper = start.timestamp(), end.timestamp()
+    starts, ends = self._start_times, self._end_times
+    # NaN comparisons are always False, so activities without times are skipped
+    positions = [
+      i for i in range(len(starts)) if starts[i] <= upper and ends[i] >= lower
+    ]
+    return self._activities_at(positions)
+
+  def edges(self, relation: str) -> Iterator[dict[str, str]]:
+    """Yields each record of the relation section `relation`, e.g. `used` or
+    `wasInformedBy`."""
+
+    if relation not in self._sections:
+      return
+    section_start, _ = self._sections[relation]
+    window = self._window(section_start)
+    for _, start, end in _members(window, section_start):
+      yield json.loads(window.slice(start, end))
+
+  def records(self, section: str) -> Iterator[tuple[str, bytes]]:
+    """Yields the id and the undecoded JSON of each record of a section, e.g.
+    `activity` or `used`."""
+
+    if section not in self._sections:
+      return
+    section_start, _ = self._sections[section]
+    window = self._window(section_start)
+    for id, start, end in _members(window, section_start):
+      yield id, window.slice(start, end)
+
+  def is_fan_in(self, id: str) -> bool:
+    return id in self._fan_ins
+
+  def fan_in_members(self, id: str) -> list[str]:
+    """Returns the ids of the activities whose results are represented by the
+    fan-in entity `id`, or an empty list if `id` is not a fan-in. In merged
+    documents, ids are prefixed with the namespace of their run."""
+
+    if id not in self._fan_ins:
+      return []
+    entity = self.entity(id)
+    namespace = entity.get('yprov4wfs:fan_in_namespace', '')
+    return [
+      namespace + member_id(key) for key in
+      expand(entity['yprov4wfs:fan_in_group'], entity['yprov4wfs:fan_in_ranges'])
+    ]
+
+  def used(self, expand_fan_ins: bool = False) -> Iterator[tuple[str, str]]:
+    """Yields `(activity, entity)` pairs for each used relation. If
+    `expand_fan_ins`, fan-in entities are replaced by the results of all the
+    tasks they represent."""
+
+    for edge in self.edges('used'):
+      activity, entity = edge['prov:activity'], edge['prov:entity']
+      if expand_fan_ins and entity in self._fan_ins:
+        for member in self.fan_in_members(entity):
+          yield activity, f'{member}.return_value'
+      else:
+        yield activity, entity
+
+  def generator(self, entity: str) -> str | None:
+    """Returns the id of the activity that generated `entity`, or `None` if it
+    wasn't generated by an activity of the document, e.g. an input."""
+
+    position = self._entities.positions.get(entity)
+    if position is None or self._generators[position] < 0:
+      return None
+    return self._activities.ids[self._generators[position]]
+
+  def generations(self) -> Iterator[tuple[str, str]]:
+    """Yields `(entity, activity)` pairs for each wasGeneratedBy relation."""
+
+    for edge in self.edges('wasGeneratedBy'):
+      yield edge['prov:entity'], edge['prov:activity']
+
+  def communications(self, expand_fan_ins: bool = False) -> Iterator[tuple[str, str]]:
+    """Yields `(informed, informant)` pairs, i.e. `(consumer, producer)` as in
+    PROV, for each activity that used the result of another one. Pairs are
+    derived from the used and wasGeneratedBy relations, as the wasInformedBy
+    relations written by yprov4wfs point from the producer to the consumer. If
+    `expand_fan_ins`, the producers of the results represented by fan-in
+    entities are yielded too. A pair is yielded for each used relation, so it
+    can be yielded more than once."""
+
+    for edge in self.edges('used'):
+      activity, entity = edge['prov:activity'], edge['prov:entity']
+      if entity in self._fan_ins:
+        if expand_fan_ins:
+          for member in self.fan_in_members(entity):
+            yield activity, member
+        continue
+      producer = self.generator(entity)
+      if producer is not None:
+        yield activity, producer
+
+  def section(self, name: str) -> Any:
+    """Decodes a whole top-level section of the document, e.g. `prefix`."""
+
+    start, end = self._sections[name]
+    return self._decode(start, end)
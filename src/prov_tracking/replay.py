@@ -0,0 +1,435 @@
+import asyncio
+import pickle
+import struct
+from time import perf_counter
+from typing import Any, BinaryIO, Iterator, cast
+
+import cloudpickle
+from dask.task_spec import DataNode
+from dask.tokenize import tokenize
+from dask.typing import Key
+from distributed.diagnostics.plugin import SchedulerPlugin
+from distributed.scheduler import Scheduler
+
+from prov_tracking.documenter import _serialize_value
+from prov_tracking.storage_io import SourceArray
+from prov_tracking.utils import ValueShadow
+
+MAGIC = b'PROVREC1'
+_LENGTH = struct.Struct('<I')
+# Number of transitions encoded in the same frame
+BATCH_SIZE = 512
+# Values of data nodes that are recorded as they are
+_PLAIN = (
+  int, float, complex, bool, str, bytes, type(None), slice, range, list, tuple,
+  dict
+)
+
+def _identity(key: Any, value: Any) -> str:
+  """Returns a token telling apart the value of a data node without hashing its
+  content, which would take the scheduler about a second per GB: the key of the
+  node, usually derived from the content, together with the identity, type,
+  shape and size of the value. Equal values in distinct objects get distinct
+  tokens, so graphs holding them are never taken for the same graph."""
+
+  return tokenize(
+    key, id(value), type(value).__qualname__, getattr(value, 'shape', None),
+    str(getattr(value, 'dtype', None)), getattr(value, 'nbytes', None)
+  )
+
+def _shadow(spec: Any) -> Any:
+  """Returns the specs of a task, with the value of a data node replaced by a
+  `ValueShadow` unless it's a plain value, so that large values, such as
+  in-memory arrays, are neither pickled nor sent. The description of arrays
+  only walks their wrappers, see `SourceArray`."""
+
+  if not isinstance(spec, DataNode) or isinstance(spec.value, _PLAIN):
+    return spec
+  value = spec.value
+  source = SourceArray(value, str(spec.key)) if hasattr(value, 'shape') else None
+  return DataNode(spec.key, ValueShadow(
+    _serialize_value(value), spec.typ, _identity(spec.key, value), source
+  ))
+
+def _unshadow(spec: Any) -> Any:
+  """Restores the type of a data node whose value is a `ValueShadow`, which is
+  lost when the node is unpickled."""
+
+  if isinstance(spec, DataNode) and isinstance(spec.value, ValueShadow):
+    spec.typ = spec.value.typ
+  return spec
+
+class TransitionRecorder(SchedulerPlugin):
+  """Scheduler plugin that records, in a compact binary file, the stream of
+  graphs, transitions and events seen by the scheduler, together with the fields
+  of the task states read by `ProvTracker`. The file can then be replayed with
+  `replay`, without a cluster.
+
+  The file starts with `MAGIC` and is made of frames, each one being a pickled
+  event preceded by its length as a 4-byte little-endian integer. Events are:
+  - `('graph', client, keys, tasks, priority, stimulus_id)`, with `tasks` being
+  a list of `(key, run_spec, group_key, state, dependencies)`;
+  - `('transition', key, start, finish, fields)`, with `fields` holding only the
+  fields of the task state that are needed to reproduce it;
+  - `('transitions', records)`, with up to `BATCH_SIZE` transitions as
+  `(key, start, finish, fields)` records;
+  - `('event', topic, msg)`;
+  - `('remove-client', client)`.
+
+  Events holding specs are pickled with cloudpickle, as specs can hold functions
+  defined in the client, while transitions are batched and pickled with the
+  standard pickle, which is much faster. Values of data nodes, except plain ones,
+  are replaced by a `ValueShadow`.
+  """
+
+  name = 'transition-recorder'
+
+  def __init__(self, path: str):
+    self.path = path
+    self._file: BinaryIO | None = None
+    # Keys whose specs have already been recorded
+    self._known: set[Key] = set()
+    # Worker to which each task being processed has been dispatched
+    self._dispatched: dict[Key, str] = {}
+    # Transitions not written yet
+    self._batch: list[tuple] = []
+
+  def start(self, scheduler: Scheduler):
+    self._scheduler = scheduler
+    self._file = open(self.path, 'wb')
+    self._file.write(MAGIC)
+
+  def _write(self, event: tuple):
+    # Transitions recorded so far come first
+    self._write_batch()
+    # Objects shared by the tasks of a graph are pickled only once per frame
+    payload = cloudpickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+    self._emit(_LENGTH.pack(len(payload)) + payload)
+
+  def _write_batch(self):
+    """Writes the transitions recorded so far in a single frame."""
+
+    if len(self._batch) == 0:
+      return
+    event = ('transitions', self._batch)
+    self._batch = []
+    try:
+      payload = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+      # Annotations holding objects that only cloudpickle handles, e.g. lambdas
+      payload = cloudpickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+    self._emit(_LENGTH.pack(len(payload)) + payload)
+
+  def _emit(self, frame: bytes):
+    """Stores a frame, i.e. a pickled event preceded by its length."""
+
+    if self._file is not None:
+      self._file.write(frame)
+
+  def update_graph(
+    self, scheduler: Scheduler, *, client: str, keys: set[Key],
+    tasks: list[Key], annotations: dict[str, dict[Key, Any]],
+    priority: dict[Key, tuple[int | float, ...]], stimulus_id: str, **kwargs
+  ):
+    snapshots = []
+    for key in tasks:
+      ts = scheduler.tasks.get(key)
+      if ts is None:
+        continue
+      snapshots.append((
+        key, _shadow(ts.run_spec), ts.group_key, ts.state,
+        [dep.key for dep in ts.dependencies]
+      ))
+      self._known.add(key)
+    self._write((
+      'graph', client, list(keys), snapshots,
+      { key: priority[key] for key in tasks if key in priority }, stimulus_id
+    ))
+
+  def transition(self, key: Key, start: str, finish: str, *args, **kwargs):
+    ts = self._scheduler.tasks.get(key)
+    if ts is None:
+      return
+    fields: dict[str, Any] = {}
+    if key not in self._known:
+      fields['run_spec'] = _shadow(ts.run_spec)
+      fields['group_key'] = ts.group_key
+      fields['dependencies'] = [dep.key for dep in ts.dependencies]
+      self._known.add(key)
+    if ts.processing_on is not None:
+      fields['processing_on'] = (ts.processing_on.address, ts.processing_on.name)
+      if finish == 'processing':
+        self._dispatched[key] = ts.processing_on.address
+        # Where the dependencies live tells which ones must be transferred
+        fields['who_has'] = {
+          dep.key: ([ws.address for ws in dep.who_has], dep.nbytes)
+          for dep in ts.dependencies
+        }
+    if start == 'processing' and key in self._dispatched:
+      # The task is no longer assigned to the worker, which is still needed
+      address = self._dispatched.pop(key)
+      worker = self._scheduler.workers.get(address)
+      if worker is not None:
+        fields['spilled'] = (address, worker.memory.spilled)
+    if finish in ('memory', 'erred') or start == 'waiting':
+      # Tells if the result reached a client, see ProvTracker._is_output, and
+      # which clients the task belongs to, see ProvTracker._dispatch_transition
+      fields['who_wants'] = [cs.client_key for cs in ts.who_wants or ()]
+      if ts.annotations:
+        fields['annotations'] = ts.annotations
+    if finish == 'memory':
+      fields['type'] = ts.type
+      fields['nbytes'] = ts.nbytes
+      if kwargs.get('startstops'):
+        fields['startstops'] = kwargs['startstops']
+    elif finish == 'erred':
+      fields['exception_text'] = ts.exception_text
+      fields['traceback_text'] = ts.traceback_text
+      if ts.exception_blame is not None:
+        fields['exception_blame'] = ts.exception_blame.key
+    if 'run_spec' in fields:
+      self._write(('transition', key, start, finish, fields))
+      return
+    self._batch.append((key, start, finish, fields))
+    if len(self._batch) >= BATCH_SIZE:
+      self._write_batch()
+
+  def log_event(self, topic: str, msg: Any):
+    try:
+      self._write(('event', topic, msg))
+    except Exception:
+      # Events that can't be pickled are not needed for the replay
+      pass
+
+  def remove_client(self, scheduler: Scheduler, client: str):
+    self._write(('remove-client', client))
+
+  async def close(self):
+    self._write_batch()
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+class StubMemory:
+  __slots__ = ('spilled',)
+
+  def __init__(self):
+    self.spilled = 0
+
+class StubWorker:
+  """Stands for `distributed.scheduler.WorkerState`."""
+
+  __slots__ = ('address', 'name', 'memory')
+
+  def __init__(self, address: str, name: str):
+    self.address = address
+    self.name = name
+    self.memory = StubMemory()
+
+class StubClient:
+  """Stands for `distributed.scheduler.ClientState`."""
+
+  __slots__ = ('client_key',)
+
+  def __init__(self, client_key: str):
+    self.client_key = client_key
+
+class StubTaskState:
+  """Stands for `distributed.scheduler.TaskState`, with only the fields read by
+  the plugin."""
+
+  __slots__ = (
+    'key', 'run_spec', 'group_key', 'state', 'dependencies', 'who_has',
+    'processing_on', 'type', 'nbytes', 'exception_text', 'exception_blame',
+    'traceback_text', 'who_wants', 'annotations'
+  )
+
+  def __init__(self, key: Key):
+    self.key = key
+    self.run_spec: Any = None
+    self.group_key: str = ''
+    self.state = 'released'
+    self.dependencies: set[StubTaskState] = set()
+    self.who_has: set[StubWorker] = set()
+    self.processing_on: StubWorker | None = None
+    self.type: str | None = None
+    self.nbytes = -1
+    self.exception_text = ''
+    self.exception_blame: StubTaskState | None = None
+    self.traceback_text = ''
+    self.who_wants: set[StubClient] = set()
+    self.annotations: dict[str, Any] = {}
+
+class StubScheduler:
+  """Stands for `distributed.scheduler.Scheduler`, with only the state read by
+  the plugin."""
+
+  def __init__(self):
+    self.tasks: dict[Key, StubTaskState] = {}
+    self.workers: dict[str, StubWorker] = {}
+    self.clients: dict[str, StubClient] = {}
+
+  def task(self, key: Key) -> StubTaskState:
+    ts = self.tasks.get(key)
+    if ts is None:
+      ts = StubTaskState(key)
+      self.tasks[key] = ts
+    return ts
+
+  def worker(self, address: str, name: str | None = None) -> StubWorker:
+    ws = self.workers.get(address)
+    if ws is None:
+      ws = StubWorker(address, name if name is not None else address)
+      self.workers[address] = ws
+    return ws
+
+  def client(self, client_key: str) -> StubClient:
+    cs = self.clients.get(client_key)
+    if cs is None:
+      cs = StubClient(client_key)
+      self.clients[client_key] = cs
+    return cs
+
+  def apply(self, fields: dict[str, Any], ts: StubTaskState):
+    """Updates the state of a task with the recorded fields."""
+
+    if 'run_spec' in fields:
+      ts.run_spec = _unshadow(fields['run_spec'])
+      ts.group_key = fields['group_key']
+      ts.dependencies = { self.task(dep) for dep in fields['dependencies'] }
+    processing_on = fields.get('processing_on')
+    ts.processing_on = self.worker(*processing_on) if processing_on is not None else None
+    if 'who_has' in fields:
+      for dep_key, (addresses, nbytes) in fields['who_has'].items():
+        dep = self.task(dep_key)
+        dep.who_has = { self.worker(address) for address in addresses }
+        dep.nbytes = nbytes
+    if 'spilled' in fields:
+      address, spilled = fields['spilled']
+      self.worker(address).memory.spilled = spilled
+    if 'type' in fields:
+      ts.type = fields['type']
+      ts.nbytes = fields['nbytes']
+    if 'who_wants' in fields:
+      ts.who_wants = { self.client(client_key) for client_key in fields['who_wants'] }
+      ts.annotations = fields.get('annotations', {})
+    if 'exception_text' in fields:
+      ts.exception_text = fields['exception_text']
+      ts.traceback_text = fields['traceback_text']
+      blame = fields.get('exception_blame')
+      ts.exception_blame = self.task(blame) if blame is not None else None
+
+class Replayer:
+  """Feeds recorded events into a plugin, against a stub scheduler that is
+  updated with the fields recorded with each event."""
+
+  def __init__(self, plugin: SchedulerPlugin):
+    self.plugin = plugin
+    self.scheduler = StubScheduler()
+    self.transitions = 0
+    plugin.start(cast(Scheduler, self.scheduler))
+
+  def transition(self, key: Key, start: str, finish: str, fields: dict[str, Any]):
+    scheduler = self.scheduler
+    ts = scheduler.task(key)
+    scheduler.apply(fields, ts)
+    ts.state = finish
+    self.plugin.transition(key, start, finish, startstops=fields.get('startstops'))
+    if finish == 'forgotten':
+      del scheduler.tasks[key]
+    self.transitions += 1
+
+  def apply(self, event: tuple):
+    scheduler, plugin = self.scheduler, self.plugin
+    kind = event[0]
+    if kind == 'transition':
+      self.transition(*event[1:])
+    elif kind == 'transitions':
+      for record in event[1]:
+        self.transition(*record)
+    elif kind == 'graph':
+      _, client, keys, snapshots, priority, stimulus_id = event
+      for key, run_spec, group_key, state, dependencies in snapshots:
+        ts = scheduler.task(key)
+        ts.run_spec = _unshadow(run_spec)
+        ts.group_key = group_key
+        ts.state = state
+        ts.dependencies = { scheduler.task(dep) for dep in dependencies }
+      plugin.update_graph(
+        cast(Scheduler, scheduler), client=client, keys=set(keys),
+        tasks=[snapshot[0] for snapshot in snapshots], annotations={},
+        priority=priority, stimulus_id=stimulus_id
+      )
+    elif kind == 'event':
+      plugin.log_event(event[1], event[2])
+    elif kind == 'remove-client':
+      plugin.remove_client(cast(Scheduler, scheduler), event[1])
+
+def read_events(path: str) -> Iterator[tuple]:
+  """Yields the events recorded in the file at `path`. Batches of transitions
+  are yielded as they are, see `TransitionRecorder`."""
+
+  with open(path, 'rb') as file:
+    if file.read(len(MAGIC)) != MAGIC:
+      raise ValueError(f'{path} is not a recording of the transition stream')
+    while True:
+      header = file.read(_LENGTH.size)
+      if len(header) < _LENGTH.size:
+        return
+      (length,) = _LENGTH.unpack(header)
+      yield pickle.loads(file.read(length))
+
+def replay(path: str, plugin: SchedulerPlugin, close: bool = True) -> dict[str, float]:
+  """Feeds the events recorded in the file at `path` into `plugin`, as fast as
+  possible, against a stub scheduler. Events are all decoded before the replay,
+  so that only the time spent by the plugin is measured. If `close`, the plugin
+  is closed at the end, which for `ProvTracker` means serializing the document.
+  Returns the number of events and the time spent replaying and closing.
+
+  `ProvTracker` should be created with `jupyter_tracking=False`."""
+
+  events = list(read_events(path))
+  # Transitions of a batch count as separate events
+  count = sum(len(event[1]) if event[0] == 'transitions' else 1 for event in events)
+  replayer = Replayer(plugin)
+
+  started = perf_counter()
+  for event in events:
+    replayer.apply(event)
+  elapsed = perf_counter() - started
+
+  closing = 0.0
+  if close:
+    started = perf_counter()
+    asyncio.run(plugin.close())
+    closing = perf_counter() - started
+  return {
+    'events': count,
+    'transitions': replayer.transitions,
+    'elapsed': elapsed,
+    'events_per_second': count / elapsed if elapsed > 0 else float('inf'),
+    'close': closing,
+  }
+
+if __name__ == '__main__':
+  import argparse
+  import cProfile
+  import pstats
+  from prov_tracking.plugin import ProvTracker
+
+  parser = argparse.ArgumentParser(
+    description='Replays a recorded transition stream into ProvTracker'
+  )
+  parser.add_argument('recording')
+  parser.add_argument('--destination', default='./output')
+  parser.add_argument('--profile', action='store_true', help='profile the replay')
+  args = parser.parse_args()
+
+  tracker = ProvTracker(destination=args.destination, jupyter_tracking=False)
+  if args.profile:
+    profiler = cProfile.Profile()
+    stats = profiler.runcall(replay, args.recording, tracker)
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+  else:
+    stats = replay(args.recording, tracker)
+  print(stats)
@@ -0,0 +1,364 @@
+import os
+from functools import wraps
+from itertools import product
+from numbers import Integral
+from time import perf_counter
+from typing import Any, Callable
+
+from dask.typing import Key
+from distributed.diagnostics.plugin import WorkerPlugin
+
+from prov_tracking.task_info import RunnableTaskInfo
+from prov_tracking.utils import GeneratedValue, ValueShadow
+
+# Functions of dask.array that read a block of an array-like, e.g. the Zarr
+# arrays and NetCDF variables wrapped by xarray in `open_dataset` groups
+_GETTERS = ('getter', 'getter_nofancy', 'getter_inline')
+# Maximum depth of the wrappers around the array holding the data
+_MAX_WRAPPERS = 16
+# Topic of the events sent by the workers with the time spent reading
+READ_TIME_TOPIC = 'prov-tracking-read-time'
+
+def is_source_read(func: Callable) -> bool:
+  """Tells if tasks running `func` read data from a source array."""
+
+  return (
+    getattr(func, '__module__', None) == 'dask.array.core' and
+    getattr(func, '__name__', None) in _GETTERS
+  )
+
+def _timed(func: Callable) -> Callable:
+  """Wraps a getter so that the time spent in it by a task is sent to the
+  scheduler. The wrapper keeps the module and name of the getter, so that it is
+  pickled by reference and still recognized by `is_source_read`."""
+
+  from distributed.worker import get_worker, thread_state
+
+  @wraps(func)
+  def timed(*args, **kwargs):
+    start = perf_counter()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      # Only the reads of the tasks run by a worker are reported
+      key = getattr(thread_state, 'key', None)
+      if key is not None:
+        try:
+          worker = get_worker()
+        except ValueError:
+          worker = None
+        if worker is not None:
+          worker.log_event(READ_TIME_TOPIC, { 'key': key, 'time': perf_counter() - start })
+  timed._prov_timed = True # type: ignore[attr-defined]
+  return timed
+
+class ReadTimer(WorkerPlugin):
+  """Replaces the getters of `dask.array` on the workers with wrappers timing
+  them, see `_timed`. The getters are replaced once per process, so they are
+  shared by the workers running in the same process."""
+
+  name = 'prov-tracking-read-timer'
+  idempotent = True
+
+  def setup(self, worker):
+    import dask.array.core
+    for name in _GETTERS:
+      func = getattr(dask.array.core, name)
+      if not getattr(func, '_prov_timed', False):
+        setattr(dask.array.core, name, _timed(func))
+
+def _store_uri(store: Any) -> str:
+  text = str(store)
+  if '://' in text and ' at 0x' not in text:
+    return text
+  # Stores without a meaningful representation, e.g. those of Zarr 2
+  for name in ('root', 'path', 'url'):
+    value = getattr(store, name, None)
+    if isinstance(value, (str, os.PathLike)):
+      return os.fspath(value)
+  return text
+
+class SourceArray:
+  """Storage location and layout of an array read by getter tasks. When the
+  storage can't be found, e.g. for in-memory arrays, `uri` is the id of the
+  entity holding the array and `chunks` is `None`."""
+
+  __slots__ = ('uri', 'variable', 'chunks', 'shape', 'itemsize')
+
+  def __init__(self, array: Any, name: str):
+    self.uri = name
+    self.variable: str | None = None
+    self.chunks: tuple[int, ...] | None = None
+    shape = getattr(array, 'shape', None)
+    self.shape: tuple[int, ...] | None = tuple(shape) if shape is not None else None
+    self.itemsize: int = getattr(getattr(array, 'dtype', None), 'itemsize', 0)
+
+    # xarray wraps backend arrays in several lazy arrays, each one holding the
+    # next one in `array`, down to the backend wrapper and the actual array
+    node = array
+    for _ in range(_MAX_WRAPPERS):
+      datastore = getattr(node, 'datastore', None)
+      if datastore is not None:
+        # NetCDF variables, whose layout is only known by opening the file
+        filename = getattr(datastore, '_filename', None) or getattr(datastore, 'filename', None)
+        if filename is not None:
+          self.uri = str(filename)
+        self.variable = getattr(node, 'variable_name', None)
+      chunks = getattr(node, 'chunks', None)
+      store = getattr(node, 'store', None)
+      file = getattr(node, 'file', None)
+      if store is not None and chunks is not None:
+        # Zarr arrays
+        self.uri = _store_uri(store)
+        self.variable = self.variable or getattr(node, 'path', None)
+        self.chunks = tuple(chunks)
+        break
+      if hasattr(file, 'filename'):
+        # HDF5 datasets, whose chunks are None if they are contiguous
+        self.uri = str(file.filename)
+        self.variable = self.variable or getattr(node, 'name', None)
+        self.chunks = tuple(chunks) if chunks is not None else None
+        break
+      inner = getattr(node, 'array', None)
+      if inner is None:
+        inner = getattr(node, '_array', None)
+      if inner is None or inner is node:
+        break
+      node = inner
+
+  @property
+  def name(self) -> str:
+    return self.uri if self.variable is None else f'{self.uri}:{self.variable}'
+
+def _bounds(selection: Any, shape: tuple[int, ...]) -> list[tuple[int, int]] | None:
+  """Returns the start and stop index along each dimension of a basic
+  selection, i.e. made of contiguous slices and integers, or `None` for any
+  other selection."""
+
+  if not isinstance(selection, tuple):
+    selection = (selection,)
+  if len(selection) > len(shape):
+    return None
+  selection = selection + (slice(None),) * (len(shape) - len(selection))
+  bounds: list[tuple[int, int]] = []
+  for index, size in zip(selection, shape):
+    if isinstance(index, slice):
+      start, stop, step = index.indices(size)
+      if step != 1:
+        return None
+      bounds.append((start, max(start, stop)))
+    elif isinstance(index, Integral):
+      index = int(index) + size if index < 0 else int(index)
+      bounds.append((index, index + 1))
+    else:
+      return None
+  return bounds
+
+class SourceRead:
+  """A block of a source array read by a task, with the chunks of the storage
+  it touches. A read is aligned if it starts and ends on chunk boundaries, or at
+  the end of the array, so no chunk is only partially used."""
+
+  __slots__ = ('source', 'bounds', 'bytes', 'chunks', 'chunk_bytes', 'aligned')
+
+  def __init__(self, source: SourceArray, bounds: list[tuple[int, int]] | None):
+    self.source = source
+    self.bounds = bounds
+    self.bytes = 0
+    # Grid coordinates of the chunks touched, if the layout is known
+    self.chunks: list[tuple[int, ...]] = []
+    self.chunk_bytes = 0
+    self.aligned = True
+    if bounds is None:
+      return
+    elements = 1
+    for start, stop in bounds:
+      elements *= stop - start
+    self.bytes = elements * source.itemsize
+    if source.chunks is None or source.shape is None or len(source.chunks) != len(bounds):
+      return
+    ranges: list[range] = []
+    for (start, stop), chunk, size in zip(bounds, source.chunks, source.shape):
+      ranges.append(range(start // chunk, -(-stop // chunk)))
+      if start % chunk != 0 or (stop % chunk != 0 and stop != size):
+        self.aligned = False
+    self.chunks = list(product(*ranges))
+    for coordinates in self.chunks:
+      elements = 1
+      for index, chunk, size in zip(coordinates, source.chunks, source.shape):
+        elements *= min(chunk, size - index * chunk)
+      self.chunk_bytes += elements * source.itemsize
+
+  def attributes(self) -> dict[str, Any]:
+    attributes: dict[str, Any] = { 'io_source': self.source.uri }
+    if self.source.variable is not None:
+      attributes['io_variable'] = self.source.variable
+    if self.bounds is not None:
+      attributes['io_selection'] = [list(bound) for bound in self.bounds]
+      attributes['io_bytes'] = self.bytes
+    if len(self.chunks) > 0:
+      attributes['io_chunks'] = len(self.chunks)
+      attributes['io_chunk_bytes'] = self.chunk_bytes
+      if not self.aligned:
+        attributes['io_aligned'] = False
+    return attributes
+
+class SourceTotals:
+  """Aggregate reads of a single source array. `repeated_chunks` counts the
+  chunks read again after having already been read by another task that the
+  scheduler still holds, e.g. because two blocks of the Dask array share them
+  or because a result was recomputed. The chunks read are forgotten once none
+  of the tasks reading the source is held anymore."""
+
+  __slots__ = (
+    'reads', 'bytes', 'chunks', 'chunk_bytes', 'repeated_chunks',
+    'misaligned_reads', 'read_time', '_seen', '_held'
+  )
+
+  def __init__(self):
+    self.reads = 0
+    self.bytes = 0
+    self.chunks = 0
+    self.chunk_bytes = 0
+    self.repeated_chunks = 0
+    self.misaligned_reads = 0
+    # Seconds spent by the workers in the reads, when they are timed
+    self.read_time = 0.0
+    self._seen: set[tuple[int, ...]] = set()
+    # Registered reads whose task hasn't been forgotten yet
+    self._held = 0
+
+  def add(self, read: SourceRead, read_time: float | None = None):
+    self.reads += 1
+    if read_time is not None:
+      self.read_time += read_time
+    self.bytes += read.bytes
+    self.chunks += len(read.chunks)
+    self.chunk_bytes += read.chunk_bytes
+    if not read.aligned:
+      self.misaligned_reads += 1
+    for coordinates in read.chunks:
+      if coordinates in self._seen:
+        self.repeated_chunks += 1
+      else:
+        self._seen.add(coordinates)
+
+  def hold(self):
+    self._held += 1
+
+  def release(self):
+    self._held -= 1
+    if self._held == 0:
+      self._seen = set()
+
+  def to_dict(self) -> dict[str, Any]:
+    totals = {
+      name: getattr(self, name) for name in SourceTotals.__slots__
+      if not name.startswith('_')
+    }
+    if self.bytes > 0 and self.chunk_bytes > 0:
+      # Data decoded from the storage for each byte actually selected
+      totals['amplification'] = self.chunk_bytes / self.bytes
+    return totals
+
+class StorageIOTracker:
+  """Recognizes the tasks reading blocks of source arrays, e.g. the `getter`
+  tasks of `open_dataset` groups, and records for each one the source, the
+  selection, the bytes selected and the chunks of the storage touched, and the
+  time spent reading, as reported by the workers, see `ReadTimer`. Reads are
+  added to the totals of their source when the task succeeds, and released when
+  the scheduler forgets it."""
+
+  def __init__(self):
+    # Reads of the registered tasks, by the key of the macro task and of the
+    # sub-task, kept in case the task is recomputed
+    self.reads: dict[Key, dict[Key, SourceRead]] = {}
+    self.sources: dict[str, SourceTotals] = {}
+    # Arrays already described, by the id of the entity holding them
+    self._arrays: dict[str, SourceArray] = {}
+    # Seconds spent reading by the macro tasks, reported before they finish
+    self.read_times: dict[Key, float] = {}
+
+  def register(self, key: Key, info: RunnableTaskInfo):
+    """Must be called once the dependencies of the sub-task `info` of the macro
+    task `key` have been recorded."""
+
+    if not is_source_read(info.func) or len(info.args_dict) < 2:
+      return
+    array, selection = list(info.args_dict.values())[:2]
+    if isinstance(array, (GeneratedValue, set)) or isinstance(selection, (GeneratedValue, set)):
+      # Blocks of arrays computed by other tasks are not storage reads
+      return
+    # Arrays that are not in a data node are told apart by their task group
+    name = getattr(array, 'key', None) or str(info.group)
+    source = self._arrays.get(name)
+    if source is None:
+      value = array.value
+      if isinstance(value, ValueShadow) and value.source is not None:
+        # Arrays forwarded to a collector are described before being sent
+        source = value.source
+      else:
+        source = SourceArray(value, name)
+      self._arrays[name] = source
+    bounds = _bounds(selection.value, source.shape) if source.shape is not None else None
+    reads = self.reads.setdefault(key, {})
+    if info.key not in reads:
+      totals = self.sources.get(source.name)
+      if totals is None:
+        totals = SourceTotals()
+        self.sources[source.name] = totals
+      totals.hold()
+    reads[info.key] = SourceRead(source, bounds)
+
+  def handle_event(self, topic: str, msg: Any):
+    """Handles an event logged on the scheduler, see
+    `DataMovementTracker.handle_event`. The workers report the time spent in a
+    getter by a task in the `READ_TIME_TOPIC` topic, before the task finishes."""
+
+    if topic != READ_TIME_TOPIC or not isinstance(msg, dict):
+      return
+    key = msg.get('key')
+    if isinstance(key, list):
+      # Tuple keys are turned into lists when the event is sent
+      key = tuple(key)
+    if key in self.reads:
+      self.read_times[key] = self.read_times.get(key, 0.0) + msg.get('time', 0.0)
+
+  def finished(self, key: Key) -> list[tuple[Key, dict[str, Any]]]:
+    """Must be called when the macro task `key` succeeds. Returns the key and
+    the attributes of the read of each of its sub-tasks reading from a source."""
+
+    reads = self.reads.get(key)
+    read_time = self.read_times.pop(key, None)
+    if reads is None:
+      return []
+    total_bytes = sum(read.bytes for read in reads.values())
+    attributes = []
+    for sub_key, read in reads.items():
+      share = None
+      if read_time is not None:
+        # The time is measured for the whole macro task, so it is split among
+        # its reads by the bytes they selected
+        share = read_time * (read.bytes / total_bytes if total_bytes > 0 else 1 / len(reads))
+      self.sources[read.source.name].add(read, share)
+      read_attributes = read.attributes()
+      if share is not None:
+        read_attributes['io_read_time'] = share
+      attributes.append((sub_key, read_attributes))
+    return attributes
+
+  def forget(self, key: Key):
+    """Must be called when the scheduler forgets the macro task `key`."""
+
+    self.read_times.pop(key, None)
+    for read in self.reads.pop(key, {}).values():
+      self.sources[read.source.name].release()
+
+  def summary(self) -> dict[str, dict[str, Any]]:
+    """Returns the aggregate reads of each source, the most read first."""
+
+    return {
+      name: totals.to_dict() for name, totals in
+      sorted(self.sources.items(), key=lambda item: -item[1].chunk_bytes - item[1].bytes)
+      if totals.reads > 0
+    }
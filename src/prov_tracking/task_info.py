@@ -1,9 +1,64 @@
 import inspect
-from datetime import datetime
-from dask.task_spec import Alias, DataNode, List, Task
+import weakref
+from dask.task_spec import Alias, DataNode, GraphNode, List, Task, TaskRef
 from dask.typing import Key
+from typing import Any, Callable
 
-from prov_tracking.utils import GeneratedValue, Value, get_value, get_values_from_list
+from prov_tracking.fan_in import FanIn, build_fan_ins, parse_key
+from prov_tracking.utils import (
+  GeneratedValue, RawValue, ReadyValue, Resolutions, Value, get_value,
+  get_values_from_list
+)
+
+# Parameter names of the functions seen so far, or None if their signature is
+# not inspectable. Functions are usually shared by many tasks, e.g. by all those
+# created by client.map, while inspecting their signature is expensive.
+_parameter_names: weakref.WeakKeyDictionary[Callable, list[str] | None] = weakref.WeakKeyDictionary()
+
+def parameter_names(func: Callable) -> list[str] | None:
+  """Returns the names of the parameters of `func` that can be bound to
+  positional arguments, the last one being the variadic one, if any. Returns
+  `None` if its signature is not inspectable."""
+
+  try:
+    return _parameter_names[func]
+  except (KeyError, TypeError):
+    # TypeError is raised by callables that can't be weakly referenced
+    pass
+  try:
+    names = []
+    for parameter in inspect.signature(func).parameters.values():
+      if parameter.kind in (parameter.KEYWORD_ONLY, parameter.VAR_KEYWORD):
+        break
+      names.append(parameter.name)
+      # Keyword-only parameters follow, e.g. typ in _identity_cast(*args, typ)
+      if parameter.kind == parameter.VAR_POSITIONAL:
+        break
+  except ValueError:
+    names = None
+  try:
+    _parameter_names[func] = names
+  except TypeError:
+    pass
+  return names
+
+def _flat_value(value: Any, all_tasks: dict[Key, Task | DataNode]) -> Value | None:
+  """Returns the representation of an argument of a flat task, i.e. a literal or
+  a direct reference to a known task or data node. Returns `None` for any other
+  argument."""
+
+  if isinstance(value, TaskRef):
+    spec = all_tasks.get(value.key)
+    # References resolved through aliases or to the output of a subgraph point
+    # to a spec with a different key, which need the general path
+    if spec is None or spec.key != value.key:
+      return None
+    if isinstance(spec, DataNode):
+      return ReadyValue(str(spec.key), spec.value)
+    return GeneratedValue(str(spec.key), spec.key)
+  if isinstance(value, GraphNode):
+    return None
+  return RawValue(value)
 
 class RunnableTaskInfo:
   """Container class holding info about a runnable task."""
@@ -13,28 +68,68 @@ class RunnableTaskInfo:
     self.group = group_key
     self.func = specs.func
     self._specs = specs
-    self.start_time: datetime | None = None
-    self.finish_time: datetime | None = None
-    self.args_dict: dict[str, Value | set[Value]] = {}
+    # Index of the start and end times of the activity in the TimestampStore of
+    # the documenter, assigned when the activity is registered
+    self.slot: int = -1
+    self.args_dict: dict[str, Value | set[Value | FanIn]] = {}
     self.informants: list[Key] = []
     self.processed_on: str | None = None
+    # Number of times the task has been sent for execution. It's greater than
+    # one when the result had to be computed again, e.g. a notebook cell re-run
+    self.executions: int = 0
     self.jupyter_cell: int | None = None
 
+  def record_flat_dependencies(self, all_tasks: dict[Key, Task | DataNode]) -> bool:
+    """Fast path of `RunnableTaskInfo.record_dependencies` for flat tasks, i.e.
+    tasks whose arguments are all literals or direct references to known tasks
+    or data nodes, as those created by `client.submit` and `client.map`.
+    Arguments and informants are recorded in a single pass. If the task turns
+    out not to be flat, nothing is recorded and `False` is returned."""
+
+    args = self._specs.args
+    param_names = parameter_names(self.func)
+    if param_names is None:
+      param_names = [f'arg_{i}' for i in range(len(args))]
+    elif len(args) > len(param_names):
+      # Variadic arguments are grouped in a set by the general path
+      return False
+
+    args_dict: dict[str, Value | set[Value | FanIn]] = {}
+    informants: list[Key] = []
+    for name, arg in zip(param_names, args):
+      value = _flat_value(arg, all_tasks)
+      if value is None:
+        return False
+      args_dict[name] = value
+      if isinstance(value, GeneratedValue):
+        informants.append(value.generatedBy)
+    for name, arg in self._specs.kwargs.items():
+      value = _flat_value(arg, all_tasks)
+      if value is None:
+        return False
+      args_dict[name] = value
+      if isinstance(value, GeneratedValue):
+        informants.append(value.generatedBy)
+
+    self.args_dict = args_dict
+    self.informants = informants
+    return True
+
   def record_dependencies(
     self,
     dependencies: dict[Key, Task | DataNode | Alias],
     all_tasks: dict[Key, Task | DataNode],
     unique_keys: dict[Key, Key],
-    pending_tasks: list[tuple[Key, Task]]
+    pending_tasks: list[tuple[Key, Task]],
+    resolutions: Resolutions | None = None
   ):
     """Updates the object recording its dependencies, i.e. what values are used
     for each argument or what task must be looked at to retrive them and also
-    what tasks are informant to this one."""
+    what tasks are informant to this one. References already resolved by other
+    sub-tasks of the same macro task are taken from `resolutions`."""
 
-    param_names = []
-    try:
-      param_names = list(inspect.signature(self.func).parameters)
-    except ValueError:
+    param_names = parameter_names(self.func)
+    if param_names is None:
       # The signature in non-inspectable
       param_names = [f'arg_{i}' for i in range(len(self._specs.args))]
 
@@ -43,28 +138,28 @@ class RunnableTaskInfo:
         # Multiple tasks cooperate to produce this value. Maybe it's a list of
         # values returned by some tasks
         values = set()
-        get_values_from_list(value, values, all_tasks, dependencies, unique_keys, pending_tasks, self.key)
+        get_values_from_list(value, values, all_tasks, dependencies, unique_keys, pending_tasks, self.key, resolutions)
         self.args_dict[name] = values
       else:
-        self.args_dict[name] = get_value(value, all_tasks, dependencies, unique_keys, pending_tasks, self.key)
+        self.args_dict[name] = get_value(value, all_tasks, dependencies, unique_keys, pending_tasks, self.key, resolutions)
 
     if len(self._specs.args) > len(param_names):
       values = set()
       values.add(self.args_dict[param_names[-1]])
       for value in self._specs.args[len(param_names):]:
         if isinstance(value, List):
-          get_values_from_list(value, values, all_tasks, dependencies, unique_keys, pending_tasks, self.key)
+          get_values_from_list(value, values, all_tasks, dependencies, unique_keys, pending_tasks, self.key, resolutions)
         else:
-          values.add(get_value(value, all_tasks, dependencies, unique_keys, pending_tasks, self.key))
+          values.add(get_value(value, all_tasks, dependencies, unique_keys, pending_tasks, self.key, resolutions))
       self.args_dict[param_names[-1]] = values
 
     for name, value in self._specs.kwargs.items():
       if isinstance(value, List):
         values = set()
-        get_values_from_list(value, values, all_tasks, dependencies, unique_keys, pending_tasks, self.key)
+        get_values_from_list(value, values, all_tasks, dependencies, unique_keys, pending_tasks, self.key, resolutions)
         self.args_dict[name] = values
       else:
-        self.args_dict[name] = get_value(value, all_tasks, dependencies, unique_keys, pending_tasks, self.key)
+        self.args_dict[name] = get_value(value, all_tasks, dependencies, unique_keys, pending_tasks, self.key, resolutions)
 
     for v in self.args_dict.values():
       if isinstance(v, set):
@@ -73,4 +168,35 @@ class RunnableTaskInfo:
             self.informants.append(item.generatedBy)
       else:
         if isinstance(v, GeneratedValue):
-          self.informants.append(v.generatedBy)
\ No newline at end of file
+          self.informants.append(v.generatedBy)
+
+  def compact_fan_ins(self, threshold: int):
+    """Replaces the results of tasks of the same group collected by an argument
+    with a `FanIn`, if the argument collects at least `threshold` results. The
+    informants that are part of a fan-in are dropped, as they can be recovered
+    by expanding it."""
+
+    compacted: set[str] = set()
+    for name, values in self.args_dict.items():
+      if not isinstance(values, set) or len(values) < threshold:
+        continue
+      generated: dict[Key, GeneratedValue] = {}
+      for value in values:
+        if isinstance(value, GeneratedValue):
+          key = value.key if value.key is not None else parse_key(value.generatedBy)
+          if key is not None:
+            generated[key] = value
+      if len(generated) < threshold:
+        continue
+      fan_ins, left_out = build_fan_ins(generated)
+      if len(fan_ins) == 0:
+        continue
+      kept = values.difference(generated.values())
+      kept.update(generated[key] for key in left_out)
+      kept.update(fan_ins)
+      for fan_in in fan_ins:
+        compacted.update(generated[key].generatedBy for key in fan_in.keys())
+      self.args_dict[name] = kept
+
+    if len(compacted) > 0:
+      self.informants = [key for key in self.informants if key not in compacted]
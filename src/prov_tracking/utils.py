@@ -1,7 +1,8 @@
-from uuid import uuid4
 from dask.task_spec import Task, DataNode, Alias, TaskRef, List
+from dask.tokenize import tokenize
 from dask.typing import Key
-from typing import Any
+from dask.utils import funcname
+from typing import Any, Iterator, cast
 
 class RawValue:
   """A value already available and is not associated to a `DataNode`, e.g. an
@@ -36,8 +37,10 @@ class ReadyValue:
 class GeneratedValue:
   """A value which has been generated by another task."""
 
-  def __init__(self, generator: str):
+  def __init__(self, generator: str, key: Key | None = None):
     self.generatedBy = generator
+    # Key of the generator, when known, which is cheaper than parsing it back
+    self.key = key
 
   def __eq__(self, o: object) -> bool:
     if isinstance(o, GeneratedValue):
@@ -47,14 +50,53 @@ class GeneratedValue:
   def __hash__(self) -> int:
     return hash(('generatedBy', self.generatedBy))
 
+class ValueShadow:
+  """Stands for the value of a `DataNode` forwarded by a recorder, e.g. an
+  in-memory array, with only what the plugin reads from it: its text, its type,
+  its token and, for arrays read by getter tasks, the description of the
+  source, see `storage_io.SourceArray`."""
+
+  __slots__ = ('text', 'typ', 'token', 'source')
+
+  def __init__(self, text: str, typ: type, token: str, source: Any = None):
+    self.text = text
+    self.typ = typ
+    self.token = token
+    self.source = source
+
+  def __str__(self) -> str:
+    return self.text
+
+  def __repr__(self) -> str:
+    return self.text
+
+  def __eq__(self, o: object) -> bool:
+    if isinstance(o, ValueShadow):
+      return self.token == o.token
+    return False
+
+  def __hash__(self) -> int:
+    return hash(self.token)
+
+  def __dask_tokenize__(self) -> str:
+    return self.token
+
+def value_type(value: Any) -> type:
+  """Returns the type of a value, or the one of the value a shadow stands for."""
+
+  return value.typ if isinstance(value, ValueShadow) else type(value)
+
 type Value = GeneratedValue | ReadyValue | RawValue
 
+type Resolutions = dict[tuple[Key, int], Value]
+
 def get_value(
   obj: Any, all_tasks: dict[Key, Task | DataNode],
   dependencies: dict[Key, Task | DataNode | Alias | Any],
   unique_keys: dict[Key, Key],
   pending_tasks: list[tuple[Key, Task]],
-  refkey: Key
+  refkey: Key,
+  resolutions: Resolutions | None = None
 ) -> Value:
   """Given a parameter value creates a suitable representation for it. If the
   value comes from another task, returns a `GeneratedValue`, otherwise returns
@@ -62,73 +104,116 @@ def get_value(
   
   It might happen that a value references a task that doesn't exist in the
   system. In that case a new task is created and is put into `pending_tasks`.
-  The key created for the task is unique and used `refkey` as parent key. The
-  newly created tasks will have to be registered with both the plugin and the
-  provenance document."""
-
-  if isinstance(obj, TaskRef):
-    task = None
-    if obj.key in dependencies:
-      task = dependencies[obj.key]
-    else:
-      key = unique_keys.get(obj.key, obj.key)
-      task = all_tasks[key]
-    if hasattr(task, 'key'):# and task.key not in all_tasks:
-      unique_obj_key = unique_keys.get(obj.key, obj.key)
-      unique_task_key = unique_keys.get(task.key, task.key)
-      if unique_task_key not in all_tasks and unique_obj_key in all_tasks:
-        # This is safe, as if task.key was in unique_key, we would have found
-        # unique_task_key in all_tasks
-        unique_keys[task.key] = unique_obj_key
-        v = get_value(task, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
-        # Remove it as task.key might be mapped to different obj.key
-        unique_keys.pop(task.key)
-        return v
-    return get_value(task, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
-  elif isinstance(obj, Alias):
-    target = unique_keys.get(obj.target, obj.target)
-    task = None
-    if target in dependencies:
-      task = dependencies[target]
-    else:
-      task = all_tasks[target]
-    return get_value(task, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
-  elif isinstance(obj, Task):
-    key = unique_keys.get(obj.key, obj.key)
-    if key in all_tasks:
-      return GeneratedValue(str(key))
-    else:
-      # Create a new key and later register the new task
-      func_name = obj.func.__name__
-      new_key = make_unique_key(refkey, f'{func_name}-{uuid4()}')
-      if obj.key is not None:
-        unique_keys[obj.key] = new_key
-      new_task = Task(new_key, obj.func, *obj.args, **obj.kwargs)
-      pending_tasks.append((new_key, new_task))
-      return GeneratedValue(str(new_key))
-  elif isinstance(obj, DataNode):
-    if obj.key in all_tasks:
-      return ReadyValue(str(obj.key), obj.value)
-    else:
-      return RawValue(obj.value)
-  else:
-    return RawValue(obj)
+  The key created for the task is unique and used `refkey` as parent key. It is
+  derived from the content of the task, so that the same graph produces the
+  same keys in every run. The newly created tasks will have to be registered
+  with both the plugin and the provenance document.
+
+  Chains of references and aliases are followed iteratively, so they can be
+  arbitrarily long. If `resolutions` is provided, references resolved to known
+  tasks or data nodes are memoized there, indexed by the key and the identity
+  of the referenced node. It must only be shared by tasks that also share
+  `unique_keys`, i.e. the sub-tasks of the same macro task."""
+
+  memo_key = None
+  if resolutions is not None and isinstance(obj, TaskRef):
+    node = dependencies.get(obj.key)
+    if node is None:
+      node = all_tasks.get(unique_keys.get(obj.key, obj.key))
+    memo_key = (obj.key, id(node))
+    value = resolutions.get(memo_key)
+    if value is not None:
+      return value
+
+  # Keys temporarily mapped to the key through which their task was reached
+  remapped: list[Key] = []
+  try:
+    while True:
+      if isinstance(obj, TaskRef):
+        task = None
+        if obj.key in dependencies:
+          task = dependencies[obj.key]
+        else:
+          key = unique_keys.get(obj.key, obj.key)
+          task = all_tasks[key]
+        if hasattr(task, 'key'):# and task.key not in all_tasks:
+          unique_obj_key = unique_keys.get(obj.key, obj.key)
+          unique_task_key = unique_keys.get(task.key, task.key)
+          if unique_task_key not in all_tasks and unique_obj_key in all_tasks:
+            # This is safe, as if task.key was in unique_key, we would have found
+            # unique_task_key in all_tasks. The mapping is removed once the value
+            # is resolved, as task.key might be mapped to different obj.key
+            unique_keys[task.key] = unique_obj_key
+            remapped.append(task.key)
+        obj = task
+      elif isinstance(obj, Alias):
+        target = unique_keys.get(obj.target, obj.target)
+        if target in dependencies:
+          task = dependencies[target]
+        else:
+          task = all_tasks[target]
+        # The target might be an expanded task, recorded under its reference
+        # key but carrying the key of its output sub-task, as for references
+        if hasattr(task, 'key') and target in all_tasks:
+          unique_task_key = unique_keys.get(task.key, task.key)
+          if unique_task_key not in all_tasks:
+            unique_keys[task.key] = target
+            remapped.append(task.key)
+        obj = task
+      elif isinstance(obj, Task):
+        key = unique_keys.get(obj.key, obj.key)
+        if key in all_tasks:
+          value = GeneratedValue(str(key), key)
+          break
+        # Create a new key and later register the new task. The token also
+        # covers refkey, as equal tasks in different macro tasks are distinct
+        token = tokenize(refkey, obj.func, obj.args, obj.kwargs)
+        new_key = make_unique_key(refkey, f'{funcname(obj.func)}-{token}')
+        if obj.key is not None:
+          unique_keys[obj.key] = new_key
+        new_task = Task(new_key, obj.func, *obj.args, **obj.kwargs)
+        pending_tasks.append((new_key, new_task))
+        # Tasks created here are never memoized
+        return GeneratedValue(str(new_key), new_key)
+      elif isinstance(obj, DataNode):
+        if obj.key in all_tasks:
+          value = ReadyValue(str(obj.key), obj.value)
+        else:
+          return RawValue(obj.value)
+        break
+      else:
+        return RawValue(obj)
+  finally:
+    for key in reversed(remapped):
+      unique_keys.pop(key, None)
+
+  if memo_key is not None:
+    cast(Resolutions, resolutions)[memo_key] = value
+  return value
 
 def get_values_from_list(
   obj: Any, items: set, all_tasks: dict[Key, Task | DataNode],
   dependencies: dict[Key, Task | DataNode | Alias | Any],
   unique_keys: dict[Key, Key],
   pending_tasks: list[tuple[Key, Task]],
-  refkey: Key
+  refkey: Key,
+  resolutions: Resolutions | None = None
 ):
-  """Recursively takes all items from a list and its sublists. See get_value for
-  additional information about the parameters."""
-
-  if isinstance(obj, List):
-    for item in obj:
-      get_values_from_list(item, items, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
-  else:
-    items.add(get_value(obj, all_tasks, dependencies, unique_keys, pending_tasks, refkey))
+  """Takes all items from a list and its sublists, at any depth. See get_value
+  for additional information about the parameters."""
+
+  if not isinstance(obj, List):
+    items.add(get_value(obj, all_tasks, dependencies, unique_keys, pending_tasks, refkey, resolutions))
+    return
+  stack: list[Iterator[Any]] = [iter(obj)]
+  while len(stack) > 0:
+    for item in stack[-1]:
+      if isinstance(item, List):
+        stack.append(iter(item))
+        break
+      items.add(get_value(item, all_tasks, dependencies, unique_keys, pending_tasks, refkey, resolutions))
+    else:
+      stack.pop()
 
 def make_unique_key(parent: Key, child: Key) -> Key:
   """Takes the key of a task `child` which has been started by `parent`, i.e.
@@ -0,0 +1,73 @@
+"""Measures the trade-off between write time and size of the codecs supported by
+`prov_tracking.compression`, on the documents of the climatology example. Each
+document is written as the documenter does, i.e. with `json.dump`, uncompressed
+and with each codec and level, and then indexed again by `ProvReader`. zstd is
+skipped if `zstandard` is not installed."""
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+from importlib.util import find_spec
+from time import perf_counter
+
+from prov_tracking.compression import EXTENSIONS, open_writer
+from prov_tracking.reader import ProvReader
+
+EXAMPLES = os.path.join(
+  os.path.dirname(__file__), '..', '..', 'examples', 'climatology'
+)
+LEVELS = { 'gzip': (1, 6, 9), 'zstd': (1, 3, 9, 19) }
+
+def measure(doc: dict, path: str, codec: str | None, level: int | None, repeat: int) -> tuple[float, float, int]:
+  """Returns the best write and read time over `repeat` runs, in seconds, and
+  the size of the file."""
+
+  write_time = read_time = float('inf')
+  for _ in range(repeat):
+    started = perf_counter()
+    f = open_writer(path, codec, level) if codec is not None else open(path, 'w')
+    with f:
+      json.dump(doc, f, indent=4, ensure_ascii=False)
+    write_time = min(write_time, perf_counter() - started)
+    started = perf_counter()
+    with ProvReader(path) as reader:
+      len(reader)
+    read_time = min(read_time, perf_counter() - started)
+  return write_time, read_time, os.path.getsize(path)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    'documents', nargs='*', help='documents to compress, defaults to those of the climatology example'
+  )
+  parser.add_argument('--repeat', type=int, default=3, help='runs per configuration')
+  args = parser.parse_args()
+
+  documents = args.documents or [
+    os.path.join(EXAMPLES, 'output', 'yprov4wfs.json'),
+    *sorted(glob.glob(os.path.join(EXAMPLES, 'reduced', 'greedy', '*.json')))[:1],
+  ]
+  configurations: list[tuple[str | None, int | None]] = [(None, None)]
+  for codec, levels in LEVELS.items():
+    if codec == 'zstd' and find_spec('zstandard') is None:
+      print('zstandard is not installed, zstd is skipped')
+      continue
+    configurations.extend((codec, level) for level in levels)
+
+  with tempfile.TemporaryDirectory() as directory:
+    for document in documents:
+      with open(document) as f:
+        doc = json.load(f)
+      print(os.path.relpath(document))
+      print(f'  {"codec":<8}{"level":>6}{"size [KiB]":>12}{"ratio":>8}{"write [s]":>11}{"read [s]":>10}')
+      plain_size = None
+      for codec, level in configurations:
+        path = os.path.join(directory, 'yprov4wfs.json' + EXTENSIONS.get(codec or '', ''))
+        write_time, read_time, size = measure(doc, path, codec, level, args.repeat)
+        plain_size = plain_size or size
+        print(
+          f'  {codec or "none":<8}{level if level is not None else "-":>6}'
+          f'{size / 1024:>12.1f}{plain_size / size:>8.2f}{write_time:>11.3f}{read_time:>10.3f}'
+        )
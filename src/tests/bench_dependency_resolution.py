@@ -0,0 +1,133 @@
+"""Compares the iterative dependency resolution engine with the recursive
+implementation it replaced, on long alias chains, deeply nested lists and
+repeated references within a macro task. Also tracks deeply nested fused
+subgraphs through the plugin, which the recursive implementation could not
+handle past the recursion limit."""
+
+import argparse
+import tempfile
+from time import perf_counter
+from typing import Any, Callable
+
+from dask.task_spec import Alias, DataNode, List, Task, TaskRef
+from prov_tracking import ProvTracker
+from prov_tracking.replay import StubScheduler
+from prov_tracking.utils import GeneratedValue, RawValue, ReadyValue, get_value, get_values_from_list
+
+def recursive_get_value(obj, all_tasks, dependencies, unique_keys, pending_tasks, refkey):
+  """The recursive implementation, without the synthesis of pending tasks."""
+
+  if isinstance(obj, TaskRef):
+    if obj.key in dependencies:
+      task = dependencies[obj.key]
+    else:
+      task = all_tasks[unique_keys.get(obj.key, obj.key)]
+    if hasattr(task, 'key'):
+      unique_obj_key = unique_keys.get(obj.key, obj.key)
+      unique_task_key = unique_keys.get(task.key, task.key)
+      if unique_task_key not in all_tasks and unique_obj_key in all_tasks:
+        unique_keys[task.key] = unique_obj_key
+        v = recursive_get_value(task, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
+        unique_keys.pop(task.key)
+        return v
+    return recursive_get_value(task, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
+  elif isinstance(obj, Alias):
+    target = unique_keys.get(obj.target, obj.target)
+    task = dependencies[target] if target in dependencies else all_tasks[target]
+    return recursive_get_value(task, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
+  elif isinstance(obj, Task):
+    return GeneratedValue(str(unique_keys.get(obj.key, obj.key)))
+  elif isinstance(obj, DataNode):
+    if obj.key in all_tasks:
+      return ReadyValue(str(obj.key), obj.value)
+    return RawValue(obj.value)
+  return RawValue(obj)
+
+def recursive_get_values_from_list(obj, items, all_tasks, dependencies, unique_keys, pending_tasks, refkey):
+  if isinstance(obj, List):
+    for item in obj:
+      recursive_get_values_from_list(item, items, all_tasks, dependencies, unique_keys, pending_tasks, refkey)
+  else:
+    items.add(recursive_get_value(obj, all_tasks, dependencies, unique_keys, pending_tasks, refkey))
+
+def inc(a):
+  return a + 1
+
+def measure(name: str, run: Callable[[], Any]):
+  try:
+    started = perf_counter()
+    run()
+    print(f'{name}: {perf_counter() - started:.4f}s')
+  except RecursionError:
+    print(f'{name}: RecursionError')
+
+def alias_chain(length: int) -> tuple[dict, TaskRef]:
+  all_tasks: dict[Any, Any] = { 'base': Task('base', inc, 1) }
+  target = 'base'
+  for i in range(length):
+    all_tasks[f'alias-{i}'] = Alias(f'alias-{i}', target)
+    target = f'alias-{i}'
+  return all_tasks, TaskRef(target)
+
+def nested_list(depth: int, width: int) -> tuple[dict, List]:
+  all_tasks = { f'x-{i}': Task(f'x-{i}', inc, i) for i in range(width) }
+  value = List(*(TaskRef(key) for key in all_tasks))
+  for _ in range(depth):
+    value = List(value, TaskRef('x-0'))
+  return all_tasks, value
+
+def nested_subgraph(depth: int) -> Task:
+  """Fuses `depth` tasks, each one nested in the subgraph of the next one."""
+
+  fused = Task(('inc-0', 0), inc, 0)
+  for i in range(1, depth):
+    task = Task(('inc', i), inc, TaskRef(fused.key))
+    fused = Task.fuse(fused, task, key=('inc', i))
+  return fused
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--depth', type=int, default=500, help='length of chains and nesting')
+  parser.add_argument('--repeat', type=int, default=200, help='references resolved per macro task')
+  args = parser.parse_args()
+
+  all_tasks, ref = alias_chain(args.depth)
+  for depth in (args.depth, 10 * args.depth):
+    all_tasks, ref = alias_chain(depth)
+    measure(f'alias chain of {depth}, recursive', lambda: recursive_get_value(ref, all_tasks, {}, {}, [], 'x'))
+    measure(f'alias chain of {depth}, iterative', lambda: get_value(ref, all_tasks, {}, {}, [], 'x'))
+
+  for depth in (args.depth, 10 * args.depth):
+    all_tasks, value = nested_list(depth, 100)
+    measure(f'nested list of depth {depth}, recursive', lambda: recursive_get_values_from_list(value, set(), all_tasks, {}, {}, [], 'x'))
+    measure(f'nested list of depth {depth}, iterative', lambda: get_values_from_list(value, set(), all_tasks, {}, {}, [], 'x'))
+
+  all_tasks, ref = alias_chain(50)
+  def resolve_repeatedly(memo: bool):
+    resolutions = {} if memo else None
+    for _ in range(args.repeat):
+      get_value(ref, all_tasks, {}, {}, [], 'x', resolutions)
+  measure(f'{args.repeat} references to a chain of 50, recursive', lambda: [
+    recursive_get_value(ref, all_tasks, {}, {}, [], 'x') for _ in range(args.repeat)
+  ])
+  measure(f'{args.repeat} references to a chain of 50, iterative', lambda: resolve_repeatedly(False))
+  measure(f'{args.repeat} references to a chain of 50, memoized', lambda: resolve_repeatedly(True))
+
+  with tempfile.TemporaryDirectory() as destination:
+    tracker = ProvTracker(destination=destination, jupyter_tracking=False)
+    scheduler = StubScheduler()
+    tracker.start(scheduler)
+    depth = 2 * args.depth
+    fused = nested_subgraph(depth)
+    ts = scheduler.task(fused.key)
+    ts.run_spec = fused
+    ts.group_key = 'inc'
+    def track():
+      tracker.update_graph(
+        scheduler, client='bench', keys={ fused.key }, tasks=[fused.key],
+        annotations={}, priority={}, stimulus_id='bench'
+      )
+      tracked = len(tracker.macro_tasks.get(fused.key, []))
+      if tracked != depth:
+        raise RuntimeError(f'{tracked} of {depth} nested tasks tracked')
+    measure(f'fused subgraphs nested {depth} times, plugin', track)
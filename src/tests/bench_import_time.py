@@ -0,0 +1,54 @@
+"""Measures the import cost of the modules of prov_tracking with
+`python -X importtime`, each one in a fresh interpreter. For each module, the
+best cumulative time over a few runs is reported, together with the heaviest
+third-party packages it pulls in and whether optional backends, e.g. the
+Jupyter ones, were loaded although their feature is not in use."""
+
+import argparse
+import subprocess
+import sys
+
+MODULES = (
+  'prov_tracking', 'prov_tracking.plugin', 'prov_tracking.reader',
+  'prov_tracking.diff', 'prov_tracking.replay'
+)
+# Packages that should only be loaded when their feature is enabled
+OPTIONAL = ('ipykernel', 'jupyter_client', 'zmq', 'rdflib', 'scipy', 'zstandard')
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+  """Imports `module` in a new interpreter and returns the self and cumulative
+  time, in microseconds, of each module it imported."""
+
+  result = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+    capture_output=True, text=True, check=True
+  )
+  times: dict[str, tuple[int, int]] = {}
+  for line in result.stderr.splitlines():
+    if not line.startswith('import time:') or 'self [us]' in line:
+      continue
+    own, cumulative, name = line[len('import time:'):].split('|')
+    times[name.strip()] = (int(own), int(cumulative))
+  return times
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--repeat', type=int, default=5, help='runs per module')
+  parser.add_argument('--top', type=int, default=5, help='heaviest packages shown')
+  args = parser.parse_args()
+
+  for module in MODULES:
+    runs = [import_times(module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times[module][1])
+    packages: dict[str, int] = {}
+    for name, (own, _) in best.items():
+      top = name.split('.')[0]
+      packages[top] = packages.get(top, 0) + own
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    print(f'{module}: {best[module][1] / 1000:.1f}ms, {len(best)} modules')
+    print('  ' + ', '.join(
+      f'{name} {own / 1000:.1f}ms' for name, own in heaviest[:args.top]
+    ))
+    loaded = [name for name in OPTIONAL if name in best]
+    if len(loaded) > 0:
+      print(f'  optional packages loaded: {", ".join(loaded)}')
@@ -0,0 +1,66 @@
+"""Measures how many tasks per second the plugin can track on map-heavy
+workloads, i.e. many flat tasks like those produced by `client.map`. The
+scheduler is replaced by the stub used to replay recorded transition streams,
+so that only the time spent by the plugin is measured."""
+
+import argparse
+import tempfile
+from time import perf_counter
+
+from dask.task_spec import Task, TaskRef
+from prov_tracking import ProvTracker
+from prov_tracking.replay import StubScheduler
+
+def inc(a):
+  return a + 1
+
+def add(a, b):
+  return a + b
+
+def submit(scheduler: StubScheduler, tracker: ProvTracker, specs: list[Task], group: str):
+  for spec in specs:
+    ts = scheduler.task(spec.key)
+    ts.run_spec = spec
+    ts.group_key = group
+    ts.state = 'waiting'
+    ts.dependencies = { scheduler.task(dep) for dep in spec.dependencies }
+  keys = [spec.key for spec in specs]
+  tracker.update_graph(
+    scheduler, client='bench', keys=set(keys), tasks=keys, annotations={},
+    priority={ key: (i,) for i, key in enumerate(keys) }, stimulus_id='bench'
+  )
+  worker = scheduler.worker('inproc://bench/0', 'bench-0')
+  for key in keys:
+    ts = scheduler.tasks[key]
+    ts.state = 'processing'
+    ts.processing_on = worker
+    tracker.transition(key, 'waiting', 'processing')
+    ts.processing_on = None
+    ts.state = 'memory'
+    ts.type = 'int'
+    ts.nbytes = 28
+    tracker.transition(key, 'processing', 'memory')
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-n', type=int, default=20_000, help='tasks per map')
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as destination:
+    tracker = ProvTracker(destination=destination, jupyter_tracking=False)
+    scheduler = StubScheduler()
+    tracker.start(scheduler)
+
+    # Equivalent to xs = client.map(inc, range(n)); client.map(add, xs, xs)
+    xs = [Task(f'inc-{i}', inc, i) for i in range(args.n)]
+    ys = [
+      Task(f'add-{i}', add, TaskRef(f'inc-{i}'), TaskRef(f'inc-{(i + 1) % args.n}'))
+      for i in range(args.n)
+    ]
+    started = perf_counter()
+    submit(scheduler, tracker, xs, 'inc')
+    submit(scheduler, tracker, ys, 'add')
+    elapsed = perf_counter() - started
+
+  tasks = 2 * args.n
+  print(f'{tasks} tasks tracked in {elapsed:.3f}s, {tasks / elapsed:.0f} tasks/s')
@@ -0,0 +1,57 @@
+"""Checks that the live feed reports tasks as soon as they finish, while the
+client still holds their results, i.e. before they are released."""
+
+import json
+import tempfile
+import urllib.request
+
+from dask.distributed import Client, LocalCluster, wait
+from prov_tracking import ProvTracker
+
+def inc(x):
+  return x + 1
+
+def fail(x):
+  raise ValueError(f'failed on {x}')
+
+def fetch(port: int, path: str) -> dict:
+  with urllib.request.urlopen(f'http://127.0.0.1:{port}/provenance/{path}') as response:
+    return json.load(response)
+
+def test_counters_while_futures_are_held():
+  with tempfile.TemporaryDirectory() as destination:
+    cluster = LocalCluster(
+      n_workers=2, threads_per_worker=1, processes=False, dashboard_address=':0'
+    )
+    client = Client(cluster)
+    client.register_plugin(ProvTracker(
+      destination=destination, jupyter_tracking=False, live_endpoint='/provenance'
+    ))
+    port = cluster.scheduler.http_server.port
+
+    # Futures are kept, so no result is released before the feed is read
+    succeeded = client.map(inc, range(5))
+    failed = client.map(fail, range(3))
+    wait(succeeded + failed)
+
+    summary = fetch(port, 'summary.json')
+    counts = { 'succeeded': 0, 'failed': 0 }
+    for group in summary['groups'].values():
+      counts['succeeded'] += group['succeeded']
+      counts['failed'] += group['failed']
+    assert counts == { 'succeeded': 5, 'failed': 3 }, summary
+    assert sum(
+      worker['succeeded'] + worker['failed'] for worker in summary['workers'].values()
+    ) == 8, summary
+    activities = fetch(port, 'activities.json')['records']
+    assert len(activities) == 8, activities
+    assert all('error' in record for record in activities if record['status'] == 'failed')
+    assert len(fetch(port, 'errors.json')) > 0
+
+    del succeeded, failed
+    client.close()
+    cluster.close()
+
+if __name__ == '__main__':
+  test_counters_while_futures_are_held()
+  print('ok')